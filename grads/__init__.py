@@ -39,7 +39,8 @@ ganum
   module defines class *GaNum* which extends the GrADS client class
   *GaCore* by providing methods for exchanging n-dimensional NumPy
   array data between Python and GrADS. It also provides methods for
-  computing EOF and least square estimation.
+  computing EOF and least square estimation, and class *LazyGaField*
+  for expressions which are only exported when sliced or reduced.
 
 galab 
   If PyLab/Matplotlib/Basemap is available, the module *galab* is
@@ -61,6 +62,13 @@ gahandle
   This module provides a simple container class to collect output for
   query() operations.
 
+gacache
+  This module defines class *GaMetaCache*, an in-memory and on-disk
+  cache of the metadata GaCore.open() retrieves from GrADS. It is
+  enabled with the *Cache* option of the GrADS client classes. Class
+  *GaCapsCache* likewise caches the capabilities of each GrADS binary
+  (option *Caps*).
+
 gacm
   This modules provides additional colormaps, as well as an extension
   of the *Colormaps* class which allows for the definition of color
@@ -69,70 +77,162 @@ gacm
   tables which are either reversed or provide an arbitrary scaling by
   means of a lambda function.
 
+gapool
+  If NumPy is available, the module *gapool* will be loaded. This
+  module defines class *GaPool*, a pool of GrADS worker processes
+  which keeps the same files and dimension environment on all
+  workers, and splits exports over time among them so that long
+  time series are exported in parallel.
+
+gastats
+  This module defines class *GaStats*, which collects the number of
+  commands, wall clock time and amount of data exchanged with GrADS,
+  broken down by command verb, when the GrADS client classes are
+  created with Stats=True.
+
+gaasync
+  This module defines classes *AsyncGaCore* and, if NumPy is
+  available, *AsyncGaNum*: GrADS clients whose methods are coroutines
+  run by a small select() based scheduler, so that a single thread
+  can drive many GrADS processes concurrently.
+
 numtypes 
   This module defines GaField, a class for representing GrADS
   variables in Python. It consists of a NumPy masked array with a
   *grid* containing coordinate/dimension information attached to it.
 
-The generic class *GrADS* is an alias to *GaLab* when module *galab*
-is sucessfully loaded (usually when NumPy, Matplotlib and PIL are
-available.) Otherwise, *GrADS* is an alias to *GaNum* if module
-*ganum* can be sucessfully loaded (usually when NumPy is
-available). Failing that, the class *GrADS* becomes an alias to
-*GaCore* which only relies on the Python standard library. The
+The generic class *GrADS* is an alias to *GaYa* or *GaLab* when
+module *gaya* or *galab* is sucessfully loaded (usually when NumPy,
+Matplotlib and PIL are available.) Otherwise, *GrADS* is an alias to
+*GaNum* if module *ganum* can be sucessfully loaded (usually when
+NumPy is available). Failing that, the class *GrADS* becomes an alias
+to *GaCore* which only relies on the Python standard library. The
 following boolean attributes can be used to determine hich
-functionality is available: HAS_GALAB, HAS_GANUM, HAS_GACM.
+functionality is available: HAS_GALAB, HAS_GAYA, HAS_GANUM, HAS_GACM.
+
+Only module *gacore* is imported with the package. The other
+classes, and the HAS_* attributes that depend on them, are resolved
+the first time they are looked up, so that a script which only needs
+*GaNum* (or *GaCore*) does not pay for importing Matplotlib, Basemap
+or MayaVi.
 
 """
 
 __version__ = '1.2.0'
 
+import sys
+from types    import ModuleType
+
+from gacore   import GaCore, GrADSError
+from gacache  import GaMetaCache, GaCapsCache
+from gastats  import GaStats
+
+HAS_GACORE = True
+
 #
-# Import the most capable moodule we have the dependencies for.
-# Notice that galab imports all of ganum which in turn imports
-# all of gacore.
+# Loaders for the lazily resolved attributes. Each one imports the
+# module(s) it needs, returning a dictionary with the attributes to
+# be set on the package. Notice that galab imports all of ganum which
+# in turn imports all of gacore.
 #
 
-HAS_GACORE = False
-HAS_GANUM  = False
-HAS_GALAB  = False
-HAS_GAYA   = False
-
-try:
-    import galab
-    GrADS  = galab.GaLab
-    GaCore = galab.GaCore
-    GaLab  = galab.GaLab
-    GaNum  = galab.GaNum
-    HAS_GALAB  = True
-    HAS_GANUM  = True
-    HAS_GACORE = True
+def _loadGaNum():
+    try:
+        import numpy
+    except ImportError:
+        return dict(HAS_GANUM=False)
+    import ganum, numtypes
+    return dict(HAS_GANUM=True, GaNum=ganum.GaNum,
+                LazyGaField=ganum.LazyGaField,
+                GaGrid=numtypes.GaGrid, GaField=numtypes.GaField)
+
+def _loadGaPool():
+    if not sys.modules[__name__].HAS_GANUM:
+        return dict()
+    import gapool
+    return dict(GaPool=gapool.GaPool)
+
+def _loadGaLab():
+    try:
+        import galab
+        return dict(HAS_GALAB=True, GaLab=galab.GaLab)
+    except:
+        return dict(HAS_GALAB=False)
+
+def _loadGaYa():
+    if not sys.modules[__name__].HAS_GALAB:
+        return dict(HAS_GAYA=False)
     try:
         import gaya
-        GrADS = gaya.GaYa
-        GaYa  = gaya.GaYa
-        HAS_GAYA = True
+        return dict(HAS_GAYA=True, GaYa=gaya.GaYa)
     except:
-        HAS_GAYA = False
-except:
+        return dict(HAS_GAYA=False)
+
+def _loadGaCm():
     try:
-        import ganum
-        GrADS  = ganum.GaNum
-        GaCore = ganum.GaCore
-        GaNum  = ganum.GaNum
-        HAS_GANUM  = True
-        HAS_GACORE = True
+        import gacm
+        return dict(HAS_GACM=True)
     except:
-        import gacore
-        GrADS  = gacore.GaCore
-        GaCore = gacore.GaCore
-        HAS_GACORE = True
-try:
-    import gacm
-    HAS_GACM = True
-except:
-    HAS_GACM = False
-
-from gacore   import GrADSError
-if ( HAS_GANUM ) :
-    from numtypes import GaGrid, GaField
+        return dict(HAS_GACM=False)
+
+def _loadAsync():
+    import gaasync
+    if gaasync.HAS_NUMPY:
+        return dict(AsyncGaCore=gaasync.AsyncGaCore,
+                    AsyncGaNum=gaasync.AsyncGaNum)
+    return dict(AsyncGaCore=gaasync.AsyncGaCore)
+
+def _loadGrADS():
+    """
+    Selects the most capable class we have the dependencies for.
+    """
+    package = sys.modules[__name__]
+    for has, name in ( ('HAS_GAYA',  'GaYa'),
+                       ('HAS_GALAB', 'GaLab'),
+                       ('HAS_GANUM', 'GaNum') ):
+        if getattr(package,has):
+            return dict(GrADS=getattr(package,name))
+    return dict(GrADS=GaCore)
+
+def _loadAll():
+    package = sys.modules[__name__]
+    names = [ 'GaCore', 'GrADSError', 'GaMetaCache', 'GaCapsCache',
+              'GaStats',
+              'HAS_GACORE' ] + sorted(_loaders.keys())
+    return dict(__all__=[ n for n in names if n != '__all__'
+                                      and hasattr(package,n) ])
+
+_loaders = dict(HAS_GANUM=_loadGaNum, GaNum=_loadGaNum,
+                GaGrid=_loadGaNum, GaField=_loadGaNum,
+                GaPool=_loadGaPool, AsyncGaNum=_loadAsync,
+                LazyGaField=_loadGaNum,
+                HAS_GALAB=_loadGaLab, GaLab=_loadGaLab,
+                HAS_GAYA=_loadGaYa, GaYa=_loadGaYa,
+                HAS_GACM=_loadGaCm,
+                AsyncGaCore=_loadAsync,
+                GrADS=_loadGrADS,
+                __all__=_loadAll)
+
+class _Package(ModuleType):
+    """
+    The grads package, with the attributes in _loaders resolved on
+    first use; internal use.
+    """
+    def __getattr__(self, name):
+        if name not in _loaders:
+            raise AttributeError, "'module' object has no attribute '%s'"%name
+        self.__dict__.update(_loaders[name]())
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError, "'module' object has no attribute '%s'"%name
+
+#
+# Replace ourselves in sys.modules; the original module is kept
+# around since the loaders above still use its globals.
+#
+
+_package = _Package(__name__, __doc__)
+_package.__dict__.update(globals())
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
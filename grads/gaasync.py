@@ -0,0 +1,694 @@
+#--------------------------------------------------------------------------
+#
+#    Copyright (C) 2006-2008 by Arlindo da Silva <dasilva@opengrads.org>
+#    All Rights Reserved.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation# using version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY# without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program# if not, please consult
+#
+#              http://www.gnu.org/licenses/licenses.html
+#
+#    or write to the Free Software Foundation, Inc., 59 Temple Place,
+#    Suite 330, Boston, MA 02111-1307 USA
+#
+#------------------------------------------------------------------------
+
+"""
+This module implements asynchronous GrADS clients, so that a single
+thread can drive many GrADS processes at once. Methods that talk to
+GrADS are coroutines: generators which yield whenever they would
+otherwise block reading from GrADS. Coroutines are run by a GaLoop,
+a small scheduler based on select():
+
+    ga1, ga2 = AsyncGaNum(Window=False), AsyncGaNum(Window=False)
+
+    def job(ga, fname):
+        yield ga.start()
+        yield ga.open(fname)
+        yield ga.cmd('set t 1 5')
+        ts = yield ga.exp('ts')
+        raise Return(ts.mean())
+
+    m1, m2 = run(job(ga1,'a.ctl'), job(ga2,'b.ctl'))
+
+Inside a coroutine, yielding another coroutine waits for its result,
+and yielding a list of coroutines runs them concurrently, resuming
+with the list of their results. Coroutines return a value by raising
+Return(value).
+
+This module only relies on the standard library and select(), hence it
+is not available on Windows. Class AsyncGaNum requires NumPy.
+"""
+
+__version__ = '1.0.0'
+
+import os
+from select   import select
+from time     import time
+from string   import split
+from types    import GeneratorType, StringTypes
+
+from gacore   import GaCore, GrADSError, GaHandle, _opener
+from array    import array
+
+class Return(Exception):
+    """
+    Raised by a coroutine to return a value to its caller.
+    """
+    def __init__(self, value=None):
+        Exception.__init__(self)
+        self.value = value
+
+class _Wait(object):
+    """
+    Yielded by a coroutine to wait until a file descriptor has data.
+    """
+    def __init__(self, fd):
+        self.fd = fd
+
+#.....................................................................
+
+class _Task(object):
+    """
+    A coroutine being run by GaLoop, along with the stack of
+    coroutines it is waiting on.
+    """
+    def __init__(self, coro, parent=None, slot=None):
+        self.stack = [ coro ]
+        self.parent = parent  # task waiting on this one, if any
+        self.slot = slot
+        self.value = None     # value to send on next step
+        self.error = None     # exception to throw on next step
+        self.done = False
+        self.result = None
+        self.pending = 0      # children still running
+        self.results = None   # their results
+
+class GaLoop(object):
+    """
+    A small scheduler for the coroutines of the asynchronous GrADS
+    clients. Use run() to run coroutines until they are all done.
+    """
+
+    def __init__(self):
+        self.ready = []     # tasks ready to run
+        self.waiting = {}   # fd -> tasks waiting on it
+
+    def run(self, *coros):
+        """
+        Runs coroutines *coros* concurrently until all are done,
+        returning the list of their results. The first exception
+        raised by any of them is re-raised after all are done.
+        """
+        tasks = [ _Task(c) for c in coros ]
+        self.ready.extend(tasks)
+        while self.ready or self.waiting:
+            if not self.ready:
+                fds = select(self.waiting.keys(),[],[])[0]
+                for fd in fds:
+                    self.ready.extend(self.waiting.pop(fd))
+            ready, self.ready = (self.ready, [])
+            for task in ready:
+                self._step(task)
+        for task in tasks:
+            if task.error is not None:
+                raise task.error
+        return [ task.result for task in tasks ]
+
+    def _step(self, task):
+        """
+        Advances *task* until it needs to wait.
+        """
+        while True:
+            coro = task.stack[-1]
+            try:
+                if task.error is not None:
+                    error, task.error = (task.error, None)
+                    got = coro.throw(error)
+                else:
+                    value, task.value = (task.value, None)
+                    got = coro.send(value)
+            except StopIteration:
+                self._return(task,None)
+            except Return, r:
+                self._return(task,r.value)
+            except Exception, e:
+                self._return(task,None,e)
+            else:
+                if isinstance(got,_Wait):
+                    self.waiting.setdefault(got.fd,[]).append(task)
+                    return
+                elif isinstance(got,GeneratorType):
+                    task.stack.append(got)
+                elif isinstance(got,list):
+                    self._spawn(task,got)
+                    return
+                else:
+                    task.error = TypeError('cannot yield %r'%got)
+            if task.done:
+                return
+
+    def _return(self, task, value, error=None):
+        """
+        Pops the innermost coroutine of *task*, passing its value (or
+        exception) to the one below or finishing the task.
+        """
+        task.stack.pop()
+        task.value, task.error = (value, error)
+        if task.stack: return
+
+        task.done = True
+        task.result = value
+        if task.parent is None: return
+        parent = task.parent
+        if error is not None and parent.error is None:
+            parent.error = error
+        parent.results[task.slot] = value
+        parent.pending = parent.pending - 1
+        if parent.pending == 0:
+            if parent.error is None:
+                parent.value = parent.results
+            self.ready.append(parent)
+
+    def _spawn(self, task, coros):
+        """
+        Runs *coros* as children of *task*, which resumes with the list
+        of their results once they are all done.
+        """
+        task.results = [ None ] * len(coros)
+        task.pending = len(coros)
+        if task.pending == 0:
+            task.value = []
+            self.ready.append(task)
+        for i in range(len(coros)):
+            self.ready.append(_Task(coros[i],parent=task,slot=i))
+
+def run(*coros):
+    """
+    Runs coroutines *coros* concurrently on a new GaLoop, returning
+    the list of their results.
+    """
+    return GaLoop().run(*coros)
+
+#.....................................................................
+
+class AsyncGaCore(GaCore):
+    """
+    An asynchronous version of GaCore. The GrADS process is started
+    by the constructor, which accepts the same options as GaCore's,
+    but the coroutine start() must be run before anything else.
+
+    Coroutines provided:
+        start  - parses the splash screen and checks capabilities
+        cmd    - sends one or more commands to GrADS
+        query  - queries the GrADS state, as GaCore.query()
+        open   - opens a file, as GaCore.open()
+        setdim - sets the dimension environment
+        eval   - exports an expression as a flat array
+
+    Each client runs one coroutine at a time; use several clients
+    for concurrency. Methods rline() and rword() return the output of
+    the last command as usual. Other GaCore methods, such as coords(),
+    are blocking and must not be used with this class. Writes to
+    GrADS are blocking, which is harmless for commands but may stall
+    the loop while large arrays are being sent; with Shm=True arrays
+    are written to a file instead.
+    """
+
+    def _startup(self):
+        """
+        Internal method: nothing is read from GrADS in the constructor;
+        see start().
+        """
+        self._fd = self.Reader.fileno()
+        self._buf = ''
+        self._pos = 0
+        return 0
+
+    def __del__(self):
+        """ Sends GrADS the 'quit' command and close the pipes."""
+        try:
+            self.Writer.write('quit\n')
+            self.Reader.close()
+            self.Writer.close()
+        except:
+            pass
+
+#   Reading from GrADS
+#   ------------------
+    def _fill(self):
+        """Waits for more output from GrADS and adds it to the buffer."""
+        yield _Wait(self._fd)
+        data = os.read(self._fd,65536)
+        if data == '':
+            raise GrADSError, "GrADS terminated while waiting for response"
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+
+    def _readline(self):
+        """Returns the next line of output, including the new line."""
+        while True:
+            i = self._buf.find('\n',self._pos)
+            if i >= 0:
+                line = self._buf[self._pos:i+1]
+                self._pos = i + 1
+                raise Return(line)
+            yield self._fill()
+
+    def _read(self, n):
+        """Returns the next *n* bytes of output."""
+        chunks = [ self._buf[self._pos:] ]
+        have = len(chunks[0])
+        while have < n:
+            yield _Wait(self._fd)
+            data = os.read(self._fd,max(n-have,65536))
+            if data == '':
+                raise GrADSError, "GrADS terminated while waiting for response"
+            chunks.append(data)
+            have = have + len(data)
+        data = ''.join(chunks)
+        self._buf, self._pos = (data, n)
+        raise Return(data[:n])
+
+    def _parseReader(self, Quiet=False):
+        """
+        Coroutine version of GaCore._parseReader().
+        """
+
+        if Quiet:  Echo = False
+        else:      Echo = self.Echo
+        Lines = []
+        Words = []
+
+#       Discard debris
+#       --------------
+        got = ''
+        while got[:5] != '<IPC>' :
+            got = yield self._readline()
+        Lines.append(got)
+        Words.append(split(got))
+
+#       Next, record the GrADS output
+#       -----------------------------
+        rc = -99
+        got = yield self._readline()
+        while got[:6] != '</IPC>':
+            tokens = split(got)
+            if got[:4] == '<RC>':
+                rc = tokens[1]
+            else:
+                Lines.append(got[:-1])
+                Words.append(tokens)
+                if Echo: print got[:-1]
+            got = yield self._readline()
+
+        self.Lines = Lines
+        self.nLines = len(Lines)-2
+        self.Words = Words
+        self.rc    = int(rc)
+        raise Return(self.rc)
+
+#   Coroutines
+#   ----------
+    def start(self):
+        """
+        Parses the splash screen and records the GrADS version and the
+        extensions available, as the GaCore constructor does.
+        """
+        yield self._parseReader()
+
+        if self.Caps is not None:
+            caps = self.Caps.get(self._bin)
+            if caps is not None:
+                self.__dict__.update(caps)
+                return
+
+        yield self.cmd('q config',Quiet=True)
+        self.Version = self.rword(1,2)
+        self.byteorder = self.rword(1,4)
+        if ( self.byteorder!='big-endian' and self.byteorder!='little-endian'):
+            self.byteorder = self.rword(1,3) # grads v2
+
+        self.HAS_UDXT = False
+        self.HAS_UDCT = False
+        yield self.cmd('q udxt',Quiet=True)
+        if self.rword(1,1) is not 'Invalid':
+            self.HAS_UDXT = True
+        else:
+            yield self.cmd('q udct',Quiet=True)
+            if self.rword(1,1) is not 'Invalid':
+                self.HAS_UDXT = True
+                self.HAS_UDCT = True
+
+        if self.HAS_UDXT is True:
+            try:
+                yield self.cmd('ipc_close',Quiet=True)
+                self.HAS_IPC = True
+            except GrADSError:
+                self.HAS_IPC = False
+
+        if self.Caps is not None:
+            self.Caps.put(self._bin,self._caps())
+
+    def cmd(self, gacmd, Quiet=False, **kwopt):
+        """
+        Sends a command to GrADS; see GaCore.cmd() for details. Several
+        commands separated by new lines are sent one at a time.
+        """
+        if len(kwopt)>0:
+            from string import Template
+            Cmds = Template(gacmd).substitute(kwopt).split('\n')
+        else:
+            Cmds = gacmd.split('\n')
+        for cmd_ in Cmds:
+            if self.Stats is not None: t0 = time()
+            self.Writer.write(cmd_ + '\n')
+            self.Writer.flush()
+            rc = yield self._parseReader(Quiet)
+            if self.Stats is not None:
+                self.Stats.add(cmd_,time()-t0,self.nLines,rc=rc)
+            self._shadow(cmd_,rc)
+            if rc != 0:
+                if self.Verb==1: print "rc = ", rc, ' for ' + cmd_
+                raise GrADSError, 'GrADS returned rc=%d for <%s>'%(rc,cmd_)
+            elif self.Verb>1:    print "rc = ", rc, ' for ' + cmd_
+
+    def query(self, what, Quiet=False):
+        """
+        Queries GrADS internal state; see GaCore.query() for details.
+        """
+        if self._dims is not None and split(what) == ['dims']:
+            raise Return(self._shadowDims())
+        qh = GaHandle(what)
+        try:
+            yield self.cmd('query '+what,Quiet)
+            qh.rc = self.rc
+        except GrADSError:
+            raise GrADSError, 'Cannot query GrADS about <'+what+'>'
+        raise Return(self._parseQuery(what,qh))
+
+    def open(self, fname, ftype='default', Quiet=False):
+        """
+        Opens a GrADS file, returning the relevant metadata; see
+        GaCore.open() for details.
+        """
+        opener = _opener(fname,ftype)
+        try:
+            yield self.cmd(opener + ' ' + fname, Quiet=Quiet)
+        except GrADSError:
+            raise GrADSError, 'GrADS cannot open file <'+fname+'>'
+
+        fid = self._openedFid()
+        hit = None
+        if self.Cache is not None:
+            key = self.Version + ' ' + opener
+            hit = self.Cache.get(key,fname)
+        if hit is None:
+            fh = yield self.query('file %d'%fid, Quiet=True)
+            qh = yield self.query('ctlinfo %d'%fid, Quiet=True)
+            fh.undef = qh.undef
+            if self.Cache is not None:
+                self.Cache.put(key,fname,fh,qh)
+        else:
+            fh, qh = hit
+            fh.fid = fid
+        self._ctlinfo[fid] = qh
+        raise Return(fh)
+
+    def setdim(self, dh):
+        """
+        Sets the dimension environment from *dh*, usually obtained
+        with query("dims").
+        """
+        try:
+            yield self.cmd(self._setdimCmds(dh),Quiet=True)
+        except GrADSError:
+            raise GrADSError, 'Cannot restore dimension environment'
+
+    def eval(self, expr):
+        """
+        Exports GrADS expression *expr* through the fwrite stream,
+        returning a flat Python array; see GaCore.eval() for details.
+        """
+        if type(expr) not in StringTypes:
+            raise GrADSError, "input <expr> has invalid type"
+
+        dh = yield self.query("dims", Quiet=True)
+        nx, ny, nz, nt, ne = (dh.nx, dh.ny, dh.nz, dh.nt, dh.ne)
+
+        yield self.cmd('query gxout', Quiet=True)
+        gxout = self.rword(4,6)
+        yield self.cmd('set gxout fwrite\nset fwrite -', Quiet=True)
+        if dh.rank==3:
+            if   ne>1: yield self.cmd('set loopdim e', Quiet=True)
+            elif nt>1: yield self.cmd('set loopdim t', Quiet=True)
+            elif nz>1: yield self.cmd('set loopdim z', Quiet=True)
+        elif dh.rank>3:
+            raise GrADSError, 'can only handle 3 varying dimensions'
+        self.Writer.write('display %s\n'%expr)
+        self.Writer.flush()
+
+#       Position stream pointer after <FWRITE> marker
+#       ---------------------------------------------
+#       The rest of the display output is discarded by the next command
+#       ---------------------------------------------------------------
+        got = ''
+        while got[:8] != '<FWRITE>' :
+            got = yield self._readline()
+            if got[:13] == 'Syntax Error:' or got[:6] == '</IPC>':
+                yield self.cmd('disable fwrite\nset gxout %s'%gxout, Quiet=True)
+                raise GrADSError, "Syntax Error - cannot evaluate <%s>"%expr
+
+        n = ne*nt*nz*ny*nx
+        a = array('f')
+        a.fromstring((yield self._read(4*n)))
+
+        yield self.cmd('disable fwrite\nset gxout %s'%gxout, Quiet=True)
+        raise Return(a)
+
+#.....................................................................
+
+try:
+    from numpy    import fromstring, zeros, ones, float32, ndarray
+    from numtypes import GaGrid, GaField, _tymeAxis
+    from ganum    import _shmName, _shmRemove, _shmRead, _impWrite
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+if HAS_NUMPY:
+
+  class AsyncGaNum(AsyncGaCore):
+    """
+    An asynchronous version of GaNum, adding coroutines exp() and imp()
+    to AsyncGaCore. These rely on the IPC extension.
+    """
+
+    def exp(self, expr):
+        """
+        Exports GrADS expression *expr*, returning a GrADS Field; see
+        GaNum.exp() for details.
+        """
+        if type(expr) in StringTypes:
+            pass # OK, will proceed to export it from GrADS
+        elif isinstance(expr,GaField):
+            raise Return(expr) # just return input
+        elif isinstance(expr,ndarray):
+            raise Return(expr) # this is handy for 'lsq'
+        else:
+            raise GrADSError, "input <expr> has invalid type: %s"%type(expr)
+        if not self.HAS_IPC:
+            raise GrADSError, 'IPC extension not available - cannot export'
+
+        dh = yield self.query("dims", Quiet=True)
+        if dh.rank == 2:
+            F = yield self._exp2d(expr,dh)
+            raise Return(F)
+        if dh.nx==1: raise GrADSError, 'lon must be varying but got nx=1'
+        if dh.ny==1: raise GrADSError, 'lat must be varying but got ny=1'
+
+#       Loop over time/z, get a GrADS 2D slice at a time/z
+#       --------------------------------------------------
+        nz, nt = (dh.nz, dh.nt)
+        Data = None
+        grid = GaGrid(expr)
+        meta = zeros((nt,nz,20),dtype=float32)
+        lev = zeros(nz,dtype=float32)
+        grid.denv = dh
+        grid.time = []
+        try:
+            for l in range(nt):
+                yield self.cmd("set t %d"%(dh.t[0]+l),Quiet=True)
+                yield self.cmd("q time",Quiet=True)
+                grid.time.append(self.rword(1,3))
+                for k in range(nz):
+                    yield self.cmd("set z %d"%(dh.z[0]+k),Quiet=True)
+                    field = yield self._exp2d(expr)
+                    if Data is None:
+                        ny_, nx_ = field.shape
+                        Data = zeros(shape=(nt,nz,ny_,nx_), dtype=float32)
+                    Data[l,k,:,:] = field.data
+                    lev[k] = field.grid.lev[0]
+                    meta[l,k,:] = field.grid.meta
+        except GrADSError:
+            raise GrADSError, 'could not export <%s>'%expr
+        finally:
+            yield self.setdim(dh)
+
+        grid.lat = field.grid.lat
+        grid.lon = field.grid.lon
+        grid.lev = lev
+        amiss = meta.flat[0]
+        if nz==1:
+            Data = Data.reshape(nt,ny_,nx_)
+            grid.dims = [ 'time', 'lat', 'lon' ]
+            grid.meta = meta.reshape(nt,20)
+        elif nt==1:
+            Data = Data.reshape(nz,ny_,nx_)
+            grid.dims = [ 'lev', 'lat', 'lon' ]
+            grid.meta = meta.reshape(nz,20)
+        else:
+            grid.dims = [ 'time', 'lev', 'lat', 'lon' ]
+            grid.meta = meta
+        grid.tyme = _tymeAxis(grid.time,grid.Datetime64)
+
+        raise Return(GaField(Data, name=expr, grid=grid,
+                             mask=(Data==amiss), dtype=float32))
+
+    def _exp2d(self, expr, dh=None):
+        """
+        Coroutine version of GaNum._exp2d().
+        """
+        if dh is None:
+            dh = yield self.query("dims",Quiet=True)
+        if dh.rank !=2:
+            raise GrADSError, 'expecting rank=2 but got rank=%d'%dh.rank
+
+        grid = GaGrid(expr)
+        grid.denv = dh
+        if self.Shm is None:
+            fname = '-'
+        else:
+            fname = _shmName(self.Shm)
+        if self.Version[1] is '1':
+            cmd = 'ipc_define void = ipc_save('+expr+','+fname+')\n'
+        else:
+            cmd = 'define void = ipc_save('+expr+','+fname+')\n'
+        if self.Stats is not None: t0 = time()
+        self.Writer.write(cmd)
+        self.Writer.flush()
+
+#       Shared memory: wait for GrADS to finish, then map the file
+#       ----------------------------------------------------------
+        if self.Shm is not None:
+            rc = yield self._parseReader(Quiet=True)
+            if rc:
+                _shmRemove(fname)
+                raise GrADSError, 'problems exporting <'+expr+'>, ipc_save() failed'
+            grid.meta, array_, grid.lon, grid.lat = _shmRead(fname)
+            if self.Stats is not None:
+                self.Stats.add(cmd,time()-t0,self.nLines,
+                               4*(20+array_.size+grid.lon.size+grid.lat.size),rc)
+            amiss = grid.meta[0]
+            id, jd = (int(grid.meta[1]), int(grid.meta[2]))
+            nx_, ny_ = (int(grid.meta[3]), int(grid.meta[4]))
+            if id<0 or id>3 or jd<0 or jd>3 or id==jd:
+                raise GrADSError, \
+                      'invalid exchange metadata (idim,jdim)=(%d,%d) - make sure <%s> is valid and that lon/lat is varying.'%(id,jd,expr)
+
+#       Position stream pointer after <EXP> marker
+#       ------------------------------------------
+        else:
+            got = ''
+            while got[:5] != '<EXP>' :
+                got = yield self._readline()
+                if got[:5] == '<IPC>':
+                    self._pos = self._pos - len(got) # let the parser see it
+                    rc = yield self._parseReader(Quiet=True)
+                    if self.Stats is not None:
+                        self.Stats.add(cmd,time()-t0,self.nLines,rc=rc)
+                    raise GrADSError, 'problems exporting <'+expr+'>, ipc_save() failed'
+
+            grid.meta = fromstring((yield self._read(80)),dtype=float32)
+            amiss = grid.meta[0]
+            id, jd = (int(grid.meta[1]), int(grid.meta[2]))
+            nx_, ny_ = (int(grid.meta[3]), int(grid.meta[4]))
+            if id<0 or id>3 or jd<0 or jd>3 or id==jd:
+                yield self._parseReader(Quiet=True)
+                raise GrADSError, \
+                      'invalid exchange metadata (idim,jdim)=(%d,%d) - make sure <%s> is valid and that lon/lat is varying.'%(id,jd,expr)
+            n = nx_*ny_
+            buf = yield self._read(4*(n+nx_+ny_))
+            array_ = fromstring(buf[:4*n],dtype=float32)
+            grid.lon = fromstring(buf[4*n:4*(n+nx_)],dtype=float32)
+            grid.lat = fromstring(buf[4*(n+nx_):],dtype=float32)
+
+            rc = yield self._parseReader(Quiet=True)
+            if self.Stats is not None:
+                self.Stats.add(cmd,time()-t0,self.nLines,
+                               4*(20+nx_*ny_+nx_+ny_),rc)
+            if rc:
+                raise GrADSError, 'problems exporting <'+expr+'>, ipc_save() failed'
+
+        dims = ( 'lon', 'lat', 'lev', 'time' )
+        grid.dims = [dims[jd],dims[id]]
+        grid.time = [ dh.time[0] ]
+        grid.lev = ones(1,dtype=float32) * float(dh.lev[0])
+        grid.tyme = _tymeAxis(grid.time,grid.Datetime64)
+
+        data = array_.reshape(ny_,nx_)
+        raise Return(GaField(data, name=expr, grid=grid, mask=(data==amiss)))
+
+    def imp(self, name, Field):
+        """
+        Sends a GrADS Field to GrADS, defining it as *name*; see
+        GaNum.imp() for details.
+        """
+        if not self.HAS_IPC:
+            raise GrADSError, "IPC extension not available - cannot import!"
+        if not isinstance(Field,GaField):
+            raise GrADSError, "Field has invalid type"
+        grid = Field.grid
+
+        dh = yield self.query("dims", Quiet=True)
+        if dh.nx==1: raise GrADSError, 'lon must be varying but got nx=1'
+        if dh.ny==1: raise GrADSError, 'lat must be varying but got ny=1'
+        if self.Version[1] is '1':
+            cmd = 'ipc_define %s = ipc_load()\n'%name
+        else:
+            cmd = 'define %s = ipc_load()\n'%name
+
+        if self.Shm is None:
+            fname = '-'
+        else:
+            fname = _shmName(self.Shm) # data must be there before ipc_open
+            f = open(fname,'wb')
+            try:
+                _impWrite(f, Field, dh)
+            finally:
+                f.close()
+        try:
+            yield self.cmd("ipc_open %s r"%fname)
+        except GrADSError:
+            _shmRemove(fname)
+            raise GrADSError, '<ipc_open %s r> failed; is IPC installad?'%fname
+        self.Writer.write(cmd)
+        if self.Shm is None:
+            _impWrite(self.Writer, Field, dh)
+        self.Writer.flush()
+
+        rc = yield self._parseReader(Quiet=True)
+        yield self.setdim(dh)
+        yield self.cmd("ipc_close")
+        _shmRemove(fname)
+        if rc:
+            raise GrADSError, 'problems importing <'+name+'>, ipc_load() failed'
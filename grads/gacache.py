@@ -0,0 +1,408 @@
+#--------------------------------------------------------------------------
+#
+#    Copyright (C) 2006-2008 by Arlindo da Silva <dasilva@opengrads.org>
+#    All Rights Reserved.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation# using version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY# without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program# if not, please consult
+#
+#              http://www.gnu.org/licenses/licenses.html
+#
+#    or write to the Free Software Foundation, Inc., 59 Temple Place,
+#    Suite 330, Boston, MA 02111-1307 USA
+#
+#------------------------------------------------------------------------
+
+"""
+This module implements GaMetaCache, a cache for the file metadata
+returned by GaCore.open(). Entries are kept in memory and, optionally,
+on disk so that they survive across sessions. An entry is only used
+while the descriptor and the data file it refers to have the same
+modification time and size as when the entry was created.
+
+It also implements GaCapsCache, which likewise remembers the
+capabilities of each GrADS binary (version, byte order, extensions)
+so that GaCore does not have to query them at every start up.
+"""
+
+__version__ = '1.0.0'
+
+import os
+import cPickle as pickle
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5  # Python 2.4
+
+from gahandle import GaHandle
+
+class GaMetaCache(object):
+    """
+    A cache of the file and ctlinfo handles produced when opening a
+    file, keyed by the absolute file name:
+
+        cache = GaMetaCache()
+        ga = GrADS(Cache=cache)
+        fh = ga.open('model.ctl')   # parsed and cached
+        fh = ga.open('model.ctl')   # from the cache
+
+    Templated datasets and URLs are never cached, since there is no
+    cheap way of telling whether they have changed.
+    """
+
+    def __init__ (self, Dir=None, MaxSize=64):
+        """
+        Creates a cache holding at most *MaxSize* entries in memory,
+        the least recently used being dropped first. Entries are also
+        saved under directory *Dir*, by default ~/.pygrads/cache (or
+        the "cache" subdirectory of $PYGRADS_DIR, when set); use
+        Dir=False for an in-memory cache only.
+        """
+        if Dir is None:
+            Dir = _pygradsDir('cache')
+        self.Dir = Dir
+        self.MaxSize = MaxSize
+        self.hits = 0
+        self.misses = 0
+        self._mem = {}     # key -> entry
+        self._lru = []     # keys, most recently used last
+
+#........................................................................
+
+    def get (self, key, fname):
+        """
+        Returns a tuple (fh,qh) with fresh copies of the file and
+        ctlinfo handles cached for file *fname* under *key*, or None
+        if there is no valid entry.
+        """
+        path = os.path.abspath(fname)
+        entry = self._mem.get((key,path))
+        if entry is None:
+            entry = self._load(key,path)
+        if entry is None or not _current(entry['stamps']):
+            self.drop(key,fname)
+            self.misses = self.misses + 1
+            return None
+        self._touch((key,path),entry)
+        self.hits = self.hits + 1
+        return (_thaw(entry['fh']), _thaw(entry['qh']))
+
+    def put (self, key, fname, fh, qh):
+        """
+        Caches file handle *fh* and ctlinfo handle *qh* for file
+        *fname* under *key*. Files that cannot be cached are silently
+        ignored.
+        """
+        path = os.path.abspath(fname)
+        deps = _depends(path,fh)
+        if deps is None: return
+        stamps = _stamps(deps)
+        if stamps is None: return
+        entry = dict(stamps=stamps, fh=_freeze(fh), qh=_freeze(qh))
+        self._touch((key,path),entry)
+        self._save(key,path,entry)
+
+    def drop (self, key, fname):
+        """
+        Removes the entry for file *fname* under *key*, if any.
+        """
+        k = (key,os.path.abspath(fname))
+        if k in self._mem:
+            del self._mem[k]
+            self._lru.remove(k)
+        if self.Dir:
+            try:
+                os.remove(self._fname(*k))
+            except OSError:
+                pass
+
+    def clear (self):
+        """
+        Removes all entries, both in memory and on disk.
+        """
+        self._mem = {}
+        self._lru = []
+        if self.Dir and os.path.isdir(self.Dir):
+            for f in os.listdir(self.Dir):
+                if f[-4:] == '.pkl':
+                    try:
+                        os.remove(os.path.join(self.Dir,f))
+                    except OSError:
+                        pass
+
+#........................................................................
+
+    def _touch (self, k, entry):
+        """Makes *k* the most recently used entry."""
+        if k in self._mem:
+            self._lru.remove(k)
+        self._mem[k] = entry
+        self._lru.append(k)
+        while len(self._lru) > self.MaxSize:
+            del self._mem[self._lru.pop(0)]
+
+    def _fname (self, key, path):
+        """On-disk file name for an entry."""
+        return os.path.join(self.Dir, md5(key+'\n'+path).hexdigest()+'.pkl')
+
+    def _load (self, key, path):
+        """Loads an entry from disk, returning None if not there."""
+        if not self.Dir: return None
+        try:
+            f = open(self._fname(key,path),'rb')
+            try:
+                entry = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            return None # missing or corrupt: treat it as a miss
+        if entry.get('key') != key or entry.get('path') != path:
+            return None
+        return entry
+
+    def _save (self, key, path, entry):
+        """Saves an entry to disk; failures are not fatal."""
+        if not self.Dir: return
+        fname = self._fname(key,path)
+        tmp = fname + '.%d'%os.getpid()
+        try:
+            if not os.path.isdir(self.Dir):
+                os.makedirs(self.Dir)
+            f = open(tmp,'wb')
+            try:
+                pickle.dump(dict(entry,key=key,path=path),f,2)
+            finally:
+                f.close()
+            os.rename(tmp,fname) # atomic on posix
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+#.....................................................................
+
+class GaCapsCache(object):
+    """
+    A cache of the capabilities GaCore finds out about a GrADS binary
+    when it starts, keyed by the binary command line (option *Bin*):
+
+        ga = GrADS(Bin='grads')  # queries GrADS, caches the answer
+        ga = GrADS(Bin='grads')  # from the cache
+
+    An entry is only used while the executable (and any other file
+    named on the binary command line, e.g., a wrapper script) has the
+    same modification time and size as when the entry was created.
+    """
+
+    def __init__ (self, Dir=None):
+        """
+        Creates a cache saved under directory *Dir*, by default
+        ~/.pygrads (or $PYGRADS_DIR, when set); use Dir=False for an
+        in-memory cache only.
+        """
+        if Dir is None:
+            Dir = _pygradsDir()
+        self.Dir = Dir
+        self.hits = 0
+        self.misses = 0
+        self._mem = None   # key -> entry, loaded on first use
+
+    def get (self, argv):
+        """
+        Returns a dictionary with the capabilities cached for binary
+        command line *argv* (a list), or None if there is no valid
+        entry.
+        """
+        if self._mem is None:
+            self._mem = self._load()
+        entry = self._mem.get(tuple(argv))
+        if entry is None or not _current(entry['stamps']) or \
+           _executables(argv) != [ st[0] for st in entry['stamps'] ]:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        return dict(entry['caps'])
+
+    def put (self, argv, caps):
+        """
+        Caches dictionary *caps* for binary command line *argv*.
+        Binaries that cannot be found are silently ignored.
+        """
+        deps = _executables(argv)
+        if deps is None: return
+        stamps = _stamps(deps)
+        if stamps is None: return
+        if self._mem is None:
+            self._mem = self._load()
+        self._mem[tuple(argv)] = dict(stamps=stamps, caps=dict(caps))
+        self._save()
+
+    def clear (self):
+        """
+        Removes all entries, both in memory and on disk.
+        """
+        self._mem = {}
+        if self.Dir:
+            try:
+                os.remove(self._fname())
+            except OSError:
+                pass
+
+#........................................................................
+
+    def _fname (self):
+        """On-disk file name."""
+        return os.path.join(self.Dir,'capabilities.pkl')
+
+    def _load (self):
+        """Loads all entries from disk."""
+        if not self.Dir: return {}
+        try:
+            f = open(self._fname(),'rb')
+            try:
+                mem = pickle.load(f)
+            finally:
+                f.close()
+        except Exception:
+            return {} # missing or corrupt: start afresh
+        if not isinstance(mem,dict): return {}
+        return mem
+
+    def _save (self):
+        """
+        Saves all entries to disk, merging those saved by other
+        processes meanwhile; failures are not fatal.
+        """
+        if not self.Dir: return
+        mem = self._load()
+        mem.update(self._mem)
+        fname = self._fname()
+        tmp = fname + '.%d'%os.getpid()
+        try:
+            if not os.path.isdir(self.Dir):
+                os.makedirs(self.Dir)
+            f = open(tmp,'wb')
+            try:
+                pickle.dump(mem,f,2)
+            finally:
+                f.close()
+            os.rename(tmp,fname) # atomic on posix
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+#.....................................................................
+
+def _pygradsDir(*names):
+    """
+    Returns path *names* under the directory pygrads keeps its files
+    in: $PYGRADS_DIR if set, ~/.pygrads otherwise.
+    """
+    top = os.environ.get('PYGRADS_DIR')
+    if not top:
+        top = os.path.join(os.path.expanduser('~'),'.pygrads')
+    return os.path.join(top,*names)
+
+def _executables(argv):
+    """
+    Returns the list of files a binary command line depends on: the
+    executable, looked up on the PATH when needed, and any other
+    argument naming an existing file. Returns None if the executable
+    cannot be found.
+    """
+    if len(argv) == 0: return None
+    exe = argv[0]
+    if os.path.dirname(exe) == '':
+        for d in os.environ.get('PATH',os.defpath).split(os.pathsep):
+            path = os.path.join(d or os.curdir,exe)
+            if os.path.isfile(path) and os.access(path,os.X_OK):
+                exe = path
+                break
+    if not os.path.isfile(exe): return None
+    deps = [ os.path.abspath(exe) ]
+    for arg in argv[1:]:
+        if os.path.isfile(arg):
+            deps.append(os.path.abspath(arg))
+    return deps
+
+def _depends(path, fh):
+    """
+    Returns the list of files an entry depends on, or None if the
+    file cannot be cached.
+    """
+    if path.lower().find('http://') >= 0: return None
+    deps = [ path ]
+    bin = fh.bin
+    if bin.lower()[:7] == 'http://' or bin.find('%') >= 0:
+        return None # URL or templated dataset
+    if not os.path.isabs(bin) and not os.path.exists(bin):
+        bin = os.path.join(os.path.dirname(path),bin)
+    bin = os.path.abspath(bin)
+    if bin != path: deps.append(bin)
+    return deps
+
+def _stamps(deps):
+    """
+    Returns a list of (path,mtime,size) for each file in *deps*, or
+    None if any of them is missing.
+    """
+    stamps = []
+    for path in deps:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamps.append((path,st.st_mtime,st.st_size))
+    return stamps
+
+def _current(stamps):
+    """
+    Whether files still have the modification time and size
+    recorded in *stamps*.
+    """
+    return stamps == _stamps([ s[0] for s in stamps ])
+
+def _freeze(v):
+    """
+    Converts GaHandle objects in *v* to plain dictionaries so that
+    they can be safely pickled.
+    """
+    if isinstance(v,GaHandle):
+        return { '__GaHandle__': _freeze(v.__dict__) }
+    elif isinstance(v,dict):
+        return dict([ (k,_freeze(v[k])) for k in v ])
+    elif isinstance(v,list):
+        return [ _freeze(x) for x in v ]
+    elif isinstance(v,tuple):
+        return tuple([ _freeze(x) for x in v ])
+    return v
+
+def _thaw(v):
+    """
+    Inverse of _freeze(); always returns new containers.
+    """
+    if isinstance(v,dict):
+        if '__GaHandle__' in v:
+            d = _thaw(v['__GaHandle__'])
+            h = GaHandle(d.get('name'))
+            h.__dict__.update(d)
+            return h
+        return dict([ (k,_thaw(v[k])) for k in v ])
+    elif isinstance(v,list):
+        return [ _thaw(x) for x in v ]
+    elif isinstance(v,tuple):
+        return tuple([ _thaw(x) for x in v ])
+    return v
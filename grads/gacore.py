@@ -35,9 +35,10 @@ __version__ = '1.2.1'
 
 import sys
 import os
+import shlex
 
 from time     import sleep
-from datetime import datetime
+from datetime import datetime, timedelta
 from calendar import timegm
 from string   import *
 from types    import *
@@ -45,6 +46,12 @@ from math     import floor, ceil
 from time     import time
 from array    import array as array
 from gahandle import *
+from gacache  import GaMetaCache, GaCapsCache
+from gastats  import GaStats
+
+# GrADS is started through the shell only where we must; elsewhere
+# the command line is split and executed directly.
+Shell = os.name in ( 'nt', 'java' )
 
 # If possible, uses the subprocess module (Python 2.4 & new)
 try:
@@ -56,7 +63,7 @@ try:
         Kwds = dict( shell=True, bufsize=4,
                      stdin=PIPE, stdout=PIPE )
     else:
-        Kwds = dict( shell=True, bufsize=0,
+        Kwds = dict( shell=False, bufsize=0,
                      stdin=PIPE, stdout=PIPE,
                      close_fds=True)
         
@@ -101,6 +108,7 @@ class GaCore(GrADSObject):
         rword  - returns a given word from the GrADS stdout
         setdim - set dimension from dictionary returned by query()
         flush  - fluxes the communication pipes
+        stats  - statistics about the commands issued (Stats=True)
 
     Methods for exchanging data arrays with GrADS as well as an interface
     to Python based graphics are provided in derived classes such as
@@ -109,7 +117,8 @@ class GaCore(GrADSObject):
     
     def __init__ (self, 
                   Bin='grads', Echo=True, Opts='', Port=False, 
-                  Strict=False, Verb=0, Window=None):
+                  Strict=False, Verb=0, Window=None, Shadow=True,
+                  Cache=None, Stats=False, Shm=False, Caps=True):
         """
         Starts the GrADS process using Popen function. Optional input
         parameters are:
@@ -130,6 +139,34 @@ class GaCore(GrADSObject):
                 the rc for all GrADS commands will be printed.
         Window  If True GrADS will start with a graphics window; the
                 default is to start GrADS in batch mode.
+        Shadow  If True (default), a copy of the dimension environment
+                is kept on the client side and updated as "set" commands
+                are issued, so that most calls to query("dims") do not
+                need to go to GrADS; see query() for details.
+        Cache   A GaMetaCache object used by open() to avoid querying and
+                parsing the metadata of files opened before; if True, a
+                default GaMetaCache is created. By default, no caching.
+        Stats   If True, statistics about each command (time, lines of
+                output, binary data exchanged) are collected and can be
+                retrieved with method stats(); a GaStats object can be
+                given instead, e.g., to share it among several clients.
+        Shm     If True, the binary data exchanged by the IPC extension
+                (see GaNum methods exp() and imp()) goes through files
+                in /dev/shm rather than the stdio pipes; the name of
+                another directory can be given instead. Since GrADS
+                lower cases its input, the directory name must be in
+                lower case.
+        Caps    A GaCapsCache object remembering the version, byte order
+                and extensions of each GrADS binary, so that they are
+                only queried the first time a given binary is started;
+                by default (True) a cache shared by all clients and
+                saved under ~/.pygrads (or $PYGRADS_DIR) is used.
+                Use Caps=False to query GrADS every time.
+
+        Except on Windows, GrADS is executed directly rather than
+        through the shell, so *Bin* and *Opts* are split into words
+        as the shell would do but no other shell expansions (other
+        than ~ in *Bin*) take place.
         """
 
 #       Default foe graphical window
@@ -143,17 +180,23 @@ class GaCore(GrADSObject):
 
 #       Build GrADS command line
 #       ------------------------
-        cmdline = Bin + ' -u'
-        if Window != True: cmdline = cmdline + ' -b'
-        if Port   == True: cmdline = cmdline + ' -p'
-        else:              cmdline = cmdline + ' -l'
-        cmdline = cmdline + ' ' + Opts
+        args = ' -u'
+        if Window != True: args = args + ' -b'
+        if Port   == True: args = args + ' -p'
+        else:              args = args + ' -l'
+        args = args + ' ' + Opts
+        cmdline = Bin + args
+        self._bin = [ os.path.expanduser(w) for w in shlex.split(Bin) ]
 
 #       Spawn GrADS process with bi-directional pipes
 #       ---------------------------------------------
         try:
             # http://bit.ly/qvkUQK
-            self.p = Popen(cmdline, **Kwds )                  # could be popen2() or Popen)
+            if Shell:
+                self.p = Popen(cmdline, **Kwds )              # could be popen2() or Popen)
+            else:
+                argv = self._bin + shlex.split(args)
+                self.p = Popen(argv, **Kwds )
 
             if type(self.p) is TupleType:
                 Reader, Writer = self.p                       # older popen2() 
@@ -173,11 +216,64 @@ class GaCore(GrADSObject):
         self.Verb = Verb
         self.Strict = Strict
         self.rc = 0
+        self.PipeDepth = 64  # max commands in flight when Pipe=True
+        self.Shadow = Shadow
+        self._dims = None    # shadow dimension environment
+        self._ctlinfo = {}   # ctlinfo handles of files opened, by fid
+        if Cache is True: Cache = GaMetaCache()
+        elif not Cache:   Cache = None
+        self.Cache = Cache
+        if Stats is True: Stats = GaStats()
+        elif not Stats:   Stats = None
+        self.Stats = Stats
+        if Shm is True:
+            Shm = '/dev/shm'
+            if not os.path.isdir(Shm): Shm = '/tmp'
+        self.Shm = Shm or None
+        if Caps is True: Caps = _capsCache()
+        elif not Caps:   Caps = None
+        self.Caps = Caps
+
+#       Parse splash screen, find out what this GrADS can do
+#       ----------------------------------------------------
+        rc = self._startup()
+
+#       OK, ready to go
+#       ---------------
+        if Verb: print "Started <"+cmdline+">, rc = ",rc
+
+
+    def _startup ( self ):
+        """
+        Internal method: parses the splash screen and records the GrADS
+        version and the extensions available. Returns the rc of the 
+        splash screen.
+        """
 
 #       Parse out inital splash screen
 #       -------------------------------
         rc = self._parseReader()
 
+#       Capabilities of this binary may be known already
+#       ------------------------------------------------
+        caps = None
+        if self.Caps is not None:
+            caps = self.Caps.get(self._bin)
+        if caps is not None:
+            self.__dict__.update(caps)
+        else:
+            self._probe()
+            if self.Caps is not None:
+                self.Caps.put(self._bin,self._caps())
+
+        return rc
+
+    def _probe ( self ):
+        """
+        Internal method: queries GrADS for its version and the
+        extensions available.
+        """
+
 #       Record GrADS version
 #       --------------------
         self.cmd('q config',Quiet=True)
@@ -208,10 +304,13 @@ class GaCore(GrADSObject):
             except GrADSError:
                 self.HAS_IPC = False
 
-#       OK, ready to go
-#       ---------------
-        if Verb: print "Started <"+cmdline+">, rc = ",rc
-
+    def _caps ( self ):
+        """
+        Internal method: returns a dictionary with the capabilities
+        found by _probe(), for caching.
+        """
+        return dict([ (k,self.__dict__[k]) for k in _CAPS
+                                           if k in self.__dict__ ])
 
 #........................................................................
 
@@ -228,7 +327,7 @@ class GaCore(GrADSObject):
 
 #........................................................................
 
-    def cmd ( self, gacmd, Quiet=False, Block=True, **kwopt ):
+    def cmd ( self, gacmd, Quiet=False, Block=True, Pipe=False, **kwopt ):
         """
         Sends a command to GrADS. When Block=True, the output is captured 
         and can be retrieved by methods rline() and rword(). On input,
@@ -245,6 +344,17 @@ class GaCore(GrADSObject):
                  the command; use it with caution and if you know
                  what you are doing.
 
+        Pipe     if True, several commands are written to GrADS
+                 before waiting for their output, which is then
+                 parsed in order; this saves one round trip per
+                 command. In this case a list with one GaHandle per
+                 command is returned, each with attributes *cmd*,
+                 *rc*, *Lines*, *Words* and *nLines*. On failure,
+                 no further commands are sent and GrADSError is
+                 raised for the first command that failed; commands
+                 already in flight at that point are still executed
+                 by GrADS.
+
         kwopt    used as variables for string interpolation. For example,
 
                       ga.cmd('set time $m$y', m='jan', y=1998)
@@ -253,8 +363,8 @@ class GaCore(GrADSObject):
 
                       ga.cmd('set time jan1998')
 
-        IMPORTANT: Notice the names "$Quiet" and "$Block" cannot be used
-                   for string interpolation.
+        IMPORTANT: Notice the names "$Quiet", "$Block" and "$Pipe"
+                   cannot be used for string interpolation.
                    
         """
         
@@ -262,23 +372,87 @@ class GaCore(GrADSObject):
             Cmds = Template(gacmd).substitute(kwopt).split('\n')
         else:
             Cmds = gacmd.split('\n')
+
+        if Pipe and Block:
+            return self._pipeline(Cmds, Quiet)
             
         Verb = self.Verb
+        Stats = self.Stats
         for cmd_ in Cmds:
             cmd = cmd_ + '\n'
+            if Stats is not None: t0 = time()
             self.Writer.write(cmd)
             self.Writer.flush()
             if Block:
                 rc = self._parseReader(Quiet)
+                if Stats is not None: 
+                    Stats.add(cmd_,time()-t0,self.nLines,rc=rc)
+                self._shadow(cmd_,rc)
                 if rc != 0: 
                     if Verb==1:   print "rc = ", rc, ' for ' + cmd_
                     raise GrADSError, 'GrADS returned rc=%d for <%s>'%(rc,cmd_)
                 else:
                     if Verb>1:    print "rc = ", rc, ' for ' + cmd_
+            else:
+                self._shadow(cmd_,None)
         return
         
     __call__ = cmd
 
+#........................................................................
+
+    def _pipeline ( self, Cmds, Quiet=False ):
+        """
+        Internal method implementing cmd(Pipe=True). At most PipeDepth
+        commands are in flight at any time so that neither pipe fills
+        up while the other end is blocked writing.
+        """
+
+        Verb = self.Verb
+        Stats = self.Stats
+        n = len(Cmds)
+
+#       Fill up the pipe
+#       ----------------
+        sent = min(n,self.PipeDepth)
+        if Stats is not None: t0 = [ time() ] * sent
+        self.Writer.write(''.join([ c + '\n' for c in Cmds[:sent] ]))
+        self.Writer.flush()
+
+#       Parse responses in order, topping off the pipe as we go
+#       -------------------------------------------------------
+        Handles = []
+        failed = None
+        for i in range(n):
+            if i >= sent:
+                break  # stopped sending after a failure
+            rc = self._parseReader(Quiet)
+            if Stats is not None:
+                Stats.add(Cmds[i],time()-t0[i],self.nLines,rc=rc)
+            self._shadow(Cmds[i],rc)
+            h = GaHandle('cmd')
+            h.cmd = Cmds[i]
+            h.rc = rc
+            h.Lines = self.Lines
+            h.Words = self.Words
+            h.nLines = self.nLines
+            Handles.append(h)
+            if rc != 0:
+                if Verb==1:   print "rc = ", rc, ' for ' + Cmds[i]
+                if failed is None: failed = h
+            else:
+                if Verb>1:    print "rc = ", rc, ' for ' + Cmds[i]
+            if failed is None and sent < n:
+                if Stats is not None: t0.append(time())
+                self.Writer.write(Cmds[sent] + '\n')
+                self.Writer.flush()
+                sent = sent + 1
+
+        if failed is not None:
+            raise GrADSError, 'GrADS returned rc=%d for <%s>'%(failed.rc,failed.cmd)
+
+        return Handles
+
 #........................................................................
 
     def flush ( self ):
@@ -312,6 +486,24 @@ class GaCore(GrADSObject):
 #       --------------------------------------------------
         self.cmd('query config',Quiet=True)
 
+#........................................................................
+
+    def stats ( self, reset=False ):
+        """
+        Returns a GaHandle with statistics about the GrADS commands
+        issued so far, broken down by command verb; see GaStats.handle()
+        for details. Display of fwrite streams and IPC transfers are
+        recorded under verbs "display", "ipc_save" and "ipc_load",
+        along with the number of bytes exchanged. If *reset* is True,
+        statistics are reset after being retrieved. Statistics are
+        only available when the object was created with Stats=True.
+        """
+        if self.Stats is None:
+            raise GrADSError, 'statistics not enabled; use Stats=True'
+        sh = self.Stats.handle()
+        if reset: self.Stats.reset()
+        return sh
+
 #........................................................................
 
     def open ( self, fname, ftype='default', Quiet=False ):
@@ -325,26 +517,15 @@ class GaCore(GrADSObject):
         default  Open command is Guessed from the file name; the heuristic
                  algorithm works pretty well but is not perfect, therefore
                  the options above for when it fails.
-        """
 
-#       Determine the file opener
-#       -------------------------
-        FNAME = upper(fname) 
-        FTYPE = upper(ftype) 
-        if FTYPE == 'DEFAULT':
-            if    FNAME[:7]  == 'HTTP://' or\
-                  FNAME[-4:] == '.HDF'    or\
-                  FNAME[-4:] == '.NC4'    or\
-                  FNAME[-3:] == '.NC':          opener = 'sdfopen'
-            elif  FNAME[-4:] == '.DDF':         opener = 'xdfopen'
-            elif  FNAME[-4:] == '.XTL':         opener = 'xdfopen'
-            else:                               opener = 'open'
-        elif FTYPE == 'SDF':                    opener = 'sdfopen'
-        elif FTYPE == 'XDF':                    opener = 'xdfopen'
-        else:                                   opener = 'open'
+        When the object was created with the Cache option, metadata
+        for files opened before is taken from the cache, provided
+        neither the descriptor nor the data file have changed since.
+        """
 
 #       Issue the GrADS command
 #       -----------------------
+        opener = _opener(fname,ftype)
         gacmd = opener + ' ' + fname
         try:
             self.cmd ( gacmd, Quiet=Quiet )
@@ -353,19 +534,38 @@ class GaCore(GrADSObject):
 
 #       Next, fill in the file handle
 #       -----------------------------
-        fid = -1
+        fid = self._openedFid()
+        hit = None
+        if self.Cache is not None:
+            key = self.Version + ' ' + opener
+            hit = self.Cache.get(key,fname)
+        if hit is None:
+            fh = self.query('file %d'%fid, Quiet=True)
+            qh = self.query('ctlinfo %d'%fid, Quiet=True)
+            fh.undef = qh.undef # will need that for fwrite later
+            if self.Cache is not None:
+                self.Cache.put(key,fname,fh,qh)
+        else:
+            fh, qh = hit
+            fh.fid = fid
+        self._ctlinfo[fid] = qh # for the shadow dimension environment
+
+        return fh
+                      
+    def _openedFid ( self ):
+        """
+        Internal method: returns the file number reported by the most
+        recent open command, or -1 if none was found.
+        """
         for i in range(self.nLines, 0, -1):
             line = self.rline(i)
             if line[:9] == 'Data file' or line[:8] == 'SDF file':
-                fid = int(self.rword(i,8))
-                break
-            
-        fh = self.query('file %d'%fid, Quiet=True)
-        qh = self.query('ctlinfo %d'%fid, Quiet=True)
-        fh.undef = qh.undef # will need that for fwrite later
+                try:
+                    return int(self.rword(i,8))
+                except ValueError:
+                    break
+        return -1
 
-        return fh
-                      
 #........................................................................
 
     def jopen ( self, fname, ftype='default', Quiet=False ):
@@ -446,7 +646,8 @@ class GaCore(GrADSObject):
            nt     - number of times
            ttype  - "linear" or "levels"
            t0     - time origin 
-           dt     - time increment (in minutes)
+           dt     - time increment (in units of *tunit*)
+           tunit  - time increment units: "mn", "hr", "dy", "mo" or "yr"
 
            ne     - number of ensembles
            etype  - "linear" or "levels"
@@ -496,6 +697,15 @@ class GaCore(GrADSObject):
             ensemble dimensions, the number of ensemble members *ne* is
             set to 1 in this case.
 
+            Unless the object was created with Shadow=False, the result
+            is kept on the client side and updated as the dimension
+            environment is changed with "set x/y/z/t/e", "set lon/lat/lev"
+            and "set time"; subsequent queries are then answered without
+            a round trip to GrADS. Commands that cannot be tracked on the
+            client side (e.g., "set dfile", "close", "reinit", scripts
+            and unknown commands) simply cause the next query to go to
+            GrADS again.
+
         qh = self.query ( "udc" )
                                                                                 
            Returns information about User Defined Commands. The following
@@ -517,6 +727,11 @@ class GaCore(GrADSObject):
 
         """
 
+#       The dimension environment may be known already
+#       ----------------------------------------------
+        if self._dims is not None and split(what) == ['dims']:
+            return self._shadowDims()
+
         qh = GaHandle(what) # handle to hold results
 
 #       Query GrADS
@@ -527,6 +742,19 @@ class GaCore(GrADSObject):
         except GrADSError: 
             raise GrADSError, 'Cannot query GrADS about <'+what+'>'
 
+        if self.Stats is None:
+            return self._parseQuery(what,qh)
+        t0 = time()
+        qh = self._parseQuery(what,qh)
+        self.Stats.addParse('query',time()-t0)
+        return qh
+
+    def _parseQuery ( self, what, qh ):
+        """
+        Internal method: parses the output of "query *what*" into the
+        GaHandle *qh*, returning it.
+        """
+
 #       Parse output
 #       ------------
         tokens = split(what)
@@ -591,25 +819,13 @@ class GaCore(GrADSObject):
                 qh.ens = (1,1)
                 qh.e   = (1,1)
 
-#           Index space: 
-#             x  ... indices as reported by GrADS (not always a whole number)
-#             xi ... bracketing indices (always a whole number)
-#           -----------------------------------------------------------------
-            qh.xi = (int(floor(qh.x[0])),int(ceil(qh.x[1])))
-            qh.yi = (int(floor(qh.y[0])),int(ceil(qh.y[1])))
-            qh.zi = (int(floor(qh.z[0])),int(ceil(qh.z[1])))
-            qh.ti = (int(floor(qh.t[0])),int(ceil(qh.t[1])))
-            qh.ei = (int(floor(qh.e[0])),int(ceil(qh.e[1])))
-
-#           Number is based on bracketing integer indices
-#           ---------------------------------------------
-            qh.nx = qh.xi[1] - qh.xi[0] + 1
-            qh.ny = qh.yi[1] - qh.yi[0] + 1
-            qh.nz = qh.zi[1] - qh.zi[0] + 1
-            qh.nt = qh.ti[1] - qh.ti[0] + 1
-            qh.ne = qh.ei[1] - qh.ei[0] + 1
-
-            qh.tyme = [gat2dt(t) for t in qh.time]
+            _dimsIndex(qh)
+
+#           Keep it around for next time
+#           ----------------------------
+            if self.Shadow:
+                self._dims = qh
+                qh = self._shadowDims()
 
 #       query file [fid]
 #       ----------------
@@ -759,6 +975,7 @@ class GaCore(GrADSObject):
             qh.ttype = self.rword(i_tdef,3)
             qh.t0 = self.rword(i_tdef,4)
             qh.dt = float(self.rword(i_tdef,5)[:-2])
+            qh.tunit = lower(self.rword(i_tdef,5)[-2:])
                  
             try:
                 qh.ne = int(self.rword(i_edef,2))
@@ -818,6 +1035,11 @@ class GaCore(GrADSObject):
         Notice that this method defines many of the attributes of
         a GaGrid object.
 
+        For files opened with open(), the coordinates are computed
+        from the file metadata (see query("ctlinfo")); only those
+        that cannot be computed this way (say, gaussian latitudes)
+        are obtained from GrADS.
+
         """
 
         dh = self.query("dims",Quiet=True)
@@ -842,15 +1064,26 @@ class GaCore(GrADSObject):
         if ch.denv.ny==1: ch.shape.remove(1)
         if ch.denv.nx==1: ch.shape.remove(1)
 
-        self.cmd("set x 1",Quiet=True)
-        self.cmd("set y 1",Quiet=True)
-        self.cmd("set z 1",Quiet=True)
+#       Coordinates computed from the file metadata, when possible
+#       ----------------------------------------------------------
+        ens, ch.time, ch.lev, ch.lat, ch.lon = self._coordsLocal(dh)
+        evals = ch.lev is None or ch.lat is None or ch.lon is None
+        loops = evals or ch.time is None
         if self.Version[1] is '2':
-            self.cmd("set e 1",Quiet=True)
+            ch.ens = ens
+            loops = loops or ch.ens is None
+
+#       Otherwise, fix the dimensions and ask GrADS
+#       -------------------------------------------
+        if evals:
+            Cmds = [ "set x 1", "set y 1", "set z 1", "set t 1" ]
+            if self.Version[1] is '2':
+                Cmds.append("set e 1")
+            self.cmd('\n'.join(Cmds),Quiet=True,Pipe=True)
 
 #       ensemble coordinates
 #       --------------------
-        if self.Version[1] is '2':
+        if self.Version[1] is '2' and ch.ens is None:
             ch.ens = []
             for n in range(dh.ne):
                 e = dh.ei[0] + n
@@ -861,40 +1094,46 @@ class GaCore(GrADSObject):
                 
 #       Time coordinates
 #       ----------------
-        ch.time = []
-        for n in range(dh.nt):
-            t = dh.ti[0] + n
-            self.cmd("set t %d"%t,Quiet=True)
-            self.cmd("q time",Quiet=True)
-            ch.time.append(self.rword(1,3))
-        self.cmd("set t 1",Quiet=True)
+        if ch.time is None:
+            ch.time = []
+            for n in range(dh.nt):
+                t = dh.ti[0] + n
+                self.cmd("set t %d"%t,Quiet=True)
+                self.cmd("q time",Quiet=True)
+                ch.time.append(self.rword(1,3))
+            self.cmd("set t 1",Quiet=True)
 
 #       Level coordinates
 #       -----------------
-        self.cmd("set z %d %d"%dh.zi,Quiet=True)
-        ch.lev  = self.eval('lev')
-        self.cmd("set z 1",Quiet=True)
+        if ch.lev is None:
+            self.cmd("set z %d %d"%dh.zi,Quiet=True)
+            ch.lev  = self.eval('lev')
+            self.cmd("set z 1",Quiet=True)
 
 #       Latitude coordinates
 #       --------------------
-        self.cmd("set y %d %d"%dh.yi,Quiet=True)
-        ch.lat  = self.eval('lat')
-        self.cmd("set y 1",Quiet=True)
+        if ch.lat is None:
+            self.cmd("set y %d %d"%dh.yi,Quiet=True)
+            ch.lat  = self.eval('lat')
+            self.cmd("set y 1",Quiet=True)
 
 #       Longitude coordinates
 #       ---------------------
-        self.cmd("set x %d %d"%dh.xi,Quiet=True)
-        ch.lon = self.eval('lon')
-        self.cmd("set x 1",Quiet=True)
+        if ch.lon is None:
+            self.cmd("set x %d %d"%dh.xi,Quiet=True)
+            ch.lon = self.eval('lon')
+            self.cmd("set x 1",Quiet=True)
 
 #       Retore dimension environment
 #       ----------------------------
-        if self.Version[1] is '2':
-            self.cmd("set e %d %d"%dh.ei,Quiet=True)
-        self.cmd("set t %d %d"%dh.ti,Quiet=True)
-        self.cmd("set z %d %d"%dh.zi,Quiet=True)
-        self.cmd("set y %d %d"%dh.yi,Quiet=True)
-        self.cmd("set x %d %d"%dh.xi,Quiet=True)
+        if loops:
+            Cmds = [ "set t %d %d"%dh.ti,
+                     "set z %d %d"%dh.zi,
+                     "set y %d %d"%dh.yi,
+                     "set x %d %d"%dh.xi ]
+            if self.Version[1] is '2':
+                Cmds.insert(0,"set e %d %d"%dh.ei)
+            self.cmd('\n'.join(Cmds),Quiet=True,Pipe=True)
 
 #       Undef
 #       -----
@@ -912,6 +1151,29 @@ class GaCore(GrADSObject):
 #       --------
         return ch
 
+    def _coordsLocal ( self, dh ):
+        """
+        Internal method: returns the coordinates (ens, time, lev, lat,
+        lon) of dimension environment *dh* computed from the metadata
+        of the default file, without asking GrADS. Coordinates that
+        cannot be computed this way are returned as None.
+        """
+        ens = time = lev = lat = lon = None
+        if dh.ne == 1:
+            ens = [ dh.ens[0] ]
+        try:
+            ch = self._ctlinfo[int(dh.dfile)]
+        except (KeyError, ValueError):
+            return (ens, time, lev, lat, lon) # file not opened by open()
+        try:
+            time = [ _gat(_tyme(ch,t)) for t in range(dh.ti[0],dh.ti[1]+1) ]
+        except (ValueError, KeyError, AttributeError, OverflowError):
+            pass # e.g., month arithmetic from the 31st
+        lev = _coordAxis(ch,'z',dh.zi)
+        lat = _coordAxis(ch,'y',dh.yi)
+        lon = _coordAxis(ch,'x',dh.xi)
+        return (ens, time, lev, lat, lon)
+
 #........................................................................
 
     def jcoords ( self ):
@@ -979,9 +1241,47 @@ class GaCore(GrADSObject):
         else:
             raise GrADSError, "input <expr> has invalid type"
 
-#       Retrieve dimension environment
-#       ------------------------------
+#       Start the fwrite stream
+#       -----------------------
         dh = self.query("dims", Quiet=True) 
+        gxout, t0 = self._fwriteStart(expr, dh)
+
+#       Attempt to read from pipe
+#       -------------------------
+        a = array('f')
+        n = dh.ne*dh.nt*dh.nz*dh.ny*dh.nx
+        try:
+            a.fromfile(self.Reader,n)
+            rc = 0
+        except:
+            rc = 1
+        self._fwriteEnd(expr, gxout, t0, 4*len(a), rc)
+
+#       Something went wrong
+#       --------------------
+        if rc or len(a) < n:
+            raise GrADSError, 'problems evaluating <'+expr+'>'
+
+#       All is well
+#       -----------
+        else:
+            if os.name == 'java':
+                if self.byteorder == 'little-endian':
+                    a.byteswap() # JVM is always big-endian
+                try:
+                    return jarray.array(a,'f') # jython 2.3 & older needed this
+                except:
+                    return a # same as jarray in jython 2.5
+            else:
+                return a
+
+    def _fwriteStart ( self, expr, dh ):
+        """
+        Internal method: tells GrADS to write expression *expr* to
+        the pipe for dimension environment *dh*, leaving the stream
+        positioned at the start of the data. Returns the gxout
+        setting to be restored by _fwriteEnd() and the start time.
+        """
         nx, ny, nz, nt, ne = (dh.nx, dh.ny, dh.nz, dh.nt, dh.ne)
 
 #       Tell GrADS to write expression to pipe
@@ -993,6 +1293,7 @@ class GaCore(GrADSObject):
  
 #       For now, can only handle up to 3 varying dimensions
 #       ---------------------------------------------------
+        t0 = time()
         if dh.rank<=2: 
             self.cmd('display %s'%expr, Block=False) # non-blocking
         elif dh.rank==3: # xyz, xyt, xzt, yzt
@@ -1008,45 +1309,28 @@ class GaCore(GrADSObject):
         got = ''
         while got[:8] != '<FWRITE>' :
             got = self.Reader.readline()
-            if got[:13] == 'Syntax Error:':
-                self.flush()
+            if got[:13] == 'Syntax Error:' or got[:6] == '</IPC>':
+                self.flush() # display failed, e.g., undefined variable
+                self._fwriteEnd(expr, gxout, t0, 0, 1)
                 raise GrADSError, "Syntax Error - cannot evaluate <%s>"%expr
             elif got == '':
                 raise GrADSError, "GrADS terminated while waiting for response"
 
-#       Attempt to read from pipe
-#       -------------------------
-        a = array('f')
-        try:
-            n = ne*nt*nz*ny*nx
-            a.fromfile(self.Reader,n)
-            rc = 0
-        except:
-            rc = 1
+        return (gxout, t0)
+
+    def _fwriteEnd ( self, expr, gxout, t0, nbytes, rc ):
+        """
+        Internal method: records statistics once the data written
+        by _fwriteStart() has been read and restores gxout.
+        """
+        if self.Stats is not None:
+            self.Stats.add('display '+expr,time()-t0,nbytes=nbytes,rc=rc)
 
 #       Restore gxout settings
 #       ----------------------
         self.cmd('disable fwrite')
         self.cmd('set gxout %s'%gxout, Quiet=True) 
 
-#       Something went wrong
-#       --------------------
-        if rc or len(a) < n:
-            raise GrADSError, 'problems evaluating <'+expr+'>'
-
-#       All is well
-#       -----------
-        else:
-            if os.name == 'java':
-                if self.byteorder == 'little-endian':
-                    a.byteswap() # JVM is always big-endian
-                try:
-                    return jarray.array(a,'f') # jython 2.3 & older needed this
-                except:
-                    return a # same as jarray in jython 2.5
-            else:
-                return a
-
 #.....................................................................
 
     def setdim (self, dh):
@@ -1057,15 +1341,121 @@ class GaCore(GrADSObject):
             dh = ga.query('dims')
         """
         try:
-            self.cmd("set x %d %d"%dh.x,Quiet=True)
-            self.cmd("set y %d %d"%dh.y,Quiet=True)
-            self.cmd("set z %d %d"%dh.z,Quiet=True)
-            self.cmd("set t %d %d"%dh.t,Quiet=True)
-            if self.Version[1] is '2':
-                self.cmd("set e %d %d"%dh.e,Quiet=True)
+            self.cmd(self._setdimCmds(dh),Quiet=True,Pipe=True)
         except GrADSError:
             raise GrADSError, 'Cannot restore dimension environment'
 
+    def _setdimCmds (self, dh):
+        """
+        Internal method: returns the commands used by setdim().
+        """
+        Cmds = [ "set x %d %d"%dh.x,
+                 "set y %d %d"%dh.y,
+                 "set z %d %d"%dh.z,
+                 "set t %d %d"%dh.t ]
+        if self.Version[1] is '2':
+            Cmds.append("set e %d %d"%dh.e)
+        return '\n'.join(Cmds)
+
+#........................................................................
+
+#   Shadow dimension environment
+#   ----------------------------
+    def _shadowDims ( self ):
+        """
+        Internal method: returns a copy of the shadow dimension
+        environment, as query("dims") would.
+        """
+        qh = GaHandle('dims')
+        qh.__dict__.update(self._dims.__dict__)
+        qh.tyme = list(qh.tyme)
+        return qh
+
+    def _shadow ( self, gacmd, rc ):
+        """
+        Internal method: updates the shadow dimension environment
+        after GrADS executed command *gacmd* with return code *rc*
+        (None if not known). Commands that may change the dimension
+        environment in ways not tracked here invalidate it.
+        """
+        words = split(lower(gacmd))
+        if len(words)==0: return
+        verb = words[0]
+        if verb in _SafeVerbs: return
+
+        if verb == 'set':
+            if len(words)<2: return
+            what = words[1]
+            if what not in _DimSets and what not in ('dfile','ens'):
+                return # not about dimensions
+            if rc==0 and self._dims is not None and what in _DimSets:
+                try:
+                    self._shadowSet(what,words[2:])
+                    return
+                except (ValueError, KeyError, IndexError, OverflowError):
+                    pass # could not work it out
+
+        elif verb in ('open','sdfopen','xdfopen'):
+            if rc==0 and self._openedFid()>1: 
+                return # only the first file sets the dimensions
+
+        elif verb == 'close':
+            try:
+                del self._ctlinfo[int(words[1])]
+            except (ValueError, KeyError, IndexError):
+                pass
+            
+        elif verb == 'reinit':
+            self._ctlinfo = {}
+
+        self._dims = None # will ask GrADS next time
+
+    def _shadowSet ( self, what, args ):
+        """
+        Internal method: applies "set *what* *args*" to the shadow
+        dimension environment, raising ValueError when it cannot be
+        worked out exactly.
+        """
+
+        dh = self._dims
+        ch = self._ctlinfo[int(dh.dfile)]
+        if len(args)==1:   args = args * 2
+        elif len(args)!=2: raise ValueError, 'invalid set arguments'
+
+#       Grid and world coordinates
+#       --------------------------
+        dim = _WorldDims.get(what,what)
+        if what == 'time':
+            g = [ _tindex(ch,gat2dt(a)) for a in args ]
+        elif what == dim:
+            g = [ float(a) for a in args ]
+        else:
+            g = [ _gridCoord(ch,dim,float(a)) for a in args ]
+        if g[0] > g[1]: raise ValueError, 'decreasing range'
+        if dim in ('z','t','e'):
+            g = [ _whole(g_) for g_ in g ]
+        else:
+            g = [ _g(g_) for g_ in g ]
+        if dim == 't':
+            w = [ _gat(_tyme(ch,g_)) for g_ in g ]
+        elif dim == 'e':
+            if ch.ne != 1 or g != [1,1]:
+                raise ValueError, 'ensemble names not known'
+            w = [ '1', '1' ]
+        elif what == dim:
+            w = [ _g(_worldCoord(ch,dim,g_)) for g_ in g ]
+        else:
+            w = [ _g(float(a)) for a in args ]
+
+#       Update environment
+#       ------------------
+        state, world, grid = _DimAttrs[dim]
+        if g[0] == g[1]: dh.__dict__[state] = 'fixed'
+        else:            dh.__dict__[state] = 'varying'
+        dh.__dict__[world] = tuple(w)
+        dh.__dict__[grid]  = tuple(g)
+        _dimsIndex(dh)
+
 #........................................................................
 
 #   This should be private
@@ -1139,6 +1529,183 @@ def _nint(str):
 
 #.....................................................................
 
+_CAPS = ( 'Version', 'byteorder', 'HAS_UDXT', 'HAS_UDCT', 'HAS_IPC' )
+
+_capsShared = []
+
+def _capsCache():
+    """
+    Returns the GaCapsCache shared by all clients, internal use.
+    """
+    if not _capsShared:
+        _capsShared.append(GaCapsCache())
+    return _capsShared[0]
+
+def _opener(fname, ftype):
+    """
+    Determines the GrADS command for opening a file, internal use.
+    """
+    FNAME = upper(fname) 
+    FTYPE = upper(ftype) 
+    if FTYPE == 'DEFAULT':
+        if    FNAME[:7]  == 'HTTP://' or\
+              FNAME[-4:] == '.HDF'    or\
+              FNAME[-4:] == '.NC4'    or\
+              FNAME[-3:] == '.NC':          opener = 'sdfopen'
+        elif  FNAME[-4:] == '.DDF':         opener = 'xdfopen'
+        elif  FNAME[-4:] == '.XTL':         opener = 'xdfopen'
+        else:                               opener = 'open'
+    elif FTYPE == 'SDF':                    opener = 'sdfopen'
+    elif FTYPE == 'XDF':                    opener = 'xdfopen'
+    else:                                   opener = 'open'
+    return opener
+
+#   Commands that never change the dimension environment
+#   -----------------------------------------------------
+_SafeVerbs = ( 'q', 'query', 'd', 'display', 'c', 'clear', 'draw',
+               'define', 'undefine', 'enable', 'disable', 'print',
+               'printim', 'gxprint', 'gxyat', 'swap', 'quit',
+               'ipc_open', 'ipc_close', 'ipc_save', 'ipc_define', 'ipc_verb' )
+
+_DimSets   = ( 'x', 'y', 'z', 't', 'e', 'lon', 'lat', 'lev', 'time' )
+_WorldDims = { 'lon':'x', 'lat':'y', 'lev':'z', 'time':'t' }
+_DimAttrs  = { 'x':('x_state','lon','x'),  'y':('y_state','lat','y'),
+               'z':('z_state','lev','z'),  't':('t_state','time','t'),
+               'e':('e_state','ens','e') }
+
+def _dimsIndex(qh):
+    """
+    Fills in the attributes of a query("dims") handle that are derived
+    from the grid coordinates and states, internal use.
+    """
+    
+#   Index space: 
+#     x  ... indices as reported by GrADS (not always a whole number)
+#     xi ... bracketing indices (always a whole number)
+#   -----------------------------------------------------------------
+    qh.xi = (int(floor(qh.x[0])),int(ceil(qh.x[1])))
+    qh.yi = (int(floor(qh.y[0])),int(ceil(qh.y[1])))
+    qh.zi = (int(floor(qh.z[0])),int(ceil(qh.z[1])))
+    qh.ti = (int(floor(qh.t[0])),int(ceil(qh.t[1])))
+    qh.ei = (int(floor(qh.e[0])),int(ceil(qh.e[1])))
+
+#   Number is based on bracketing integer indices
+#   ---------------------------------------------
+    qh.nx = qh.xi[1] - qh.xi[0] + 1
+    qh.ny = qh.yi[1] - qh.yi[0] + 1
+    qh.nz = qh.zi[1] - qh.zi[0] + 1
+    qh.nt = qh.ti[1] - qh.ti[0] + 1
+    qh.ne = qh.ei[1] - qh.ei[0] + 1
+
+    qh.rank = 0
+    for state in (qh.x_state, qh.y_state, qh.z_state, qh.t_state, qh.e_state):
+        if state == 'varying': qh.rank = qh.rank + 1
+
+    qh.tyme = [gat2dt(t) for t in qh.time]
+
+def _g(x):
+    """
+    Rounds *x* the way GrADS prints it (%g), internal use.
+    """
+    return float('%g'%x)
+
+def _whole(x):
+    """
+    Returns *x* as an int, raising ValueError if it is not a whole
+    number; internal use.
+    """
+    n = _nint(x)
+    if abs(x-n) > 1e-4: raise ValueError, '%g is not a whole number'%x
+    return n
+
+def _worldCoord(ch, dim, g):
+    """
+    World coordinate of grid coordinate *g* along dimension *dim*
+    ('x', 'y' or 'z') of a file with ctlinfo handle *ch*; internal use.
+    """
+    type_ = ch.__dict__[dim+'type']
+    if type_ == 'linear':
+        return ch.__dict__[dim+'0'] + (g-1) * ch.__dict__['d'+dim]
+    levs = ch.__dict__[dim+'levs']
+    i = int(floor(g))
+    if i<1 or i>len(levs) or (i==len(levs) and g>i):
+        raise ValueError, 'grid coordinate %g out of range'%g
+    if i == g: return levs[i-1]
+    return levs[i-1] + (g-i) * (levs[i]-levs[i-1])
+
+def _gridCoord(ch, dim, w):
+    """
+    Grid coordinate of world coordinate *w* along dimension *dim*
+    ('x', 'y' or 'z') of a file with ctlinfo handle *ch*; for non-linear
+    dimensions only exact levels are supported. Internal use.
+    """
+    type_ = ch.__dict__[dim+'type']
+    if type_ == 'linear':
+        return (w - ch.__dict__[dim+'0']) / ch.__dict__['d'+dim] + 1
+    levs = ch.__dict__[dim+'levs']
+    for i in range(len(levs)):
+        if _g(levs[i]) == w: return float(i+1)
+    raise ValueError, 'no level %g'%w
+
+_Minutes = { 'mn':1, 'hr':60, 'dy':1440 }
+_Months  = { 'mo':1, 'yr':12 }
+
+def _tyme(ch, t):
+    """
+    Datetime of time index *t* of a file with ctlinfo handle *ch*,
+    internal use.
+    """
+    t0 = gat2dt(ch.t0)
+    n = _whole(ch.dt * (t-1))
+    if ch.tunit in _Minutes:
+        return t0 + timedelta(minutes=n*_Minutes[ch.tunit])
+    if t0.day > 28: raise ValueError, 'ambiguous month arithmetic'
+    m = t0.month - 1 + n * _Months[ch.tunit]
+    return t0.replace(year=t0.year+m//12, month=m%12+1)
+
+def _tindex(ch, tyme):
+    """
+    Time index of datetime *tyme* of a file with ctlinfo handle *ch*;
+    raises ValueError unless *tyme* falls on a time of the file.
+    Internal use.
+    """
+    t0 = gat2dt(ch.t0)
+    if ch.tunit in _Minutes:
+        d = tyme - t0
+        n = d.days * 1440 + d.seconds // 60
+        t = 1 + float(n) / (ch.dt * _Minutes[ch.tunit])
+    else:
+        n = 12 * (tyme.year - t0.year) + tyme.month - t0.month
+        t = 1 + float(n) / (ch.dt * _Months[ch.tunit])
+    t = _whole(t)
+    if _tyme(ch,t) != tyme: raise ValueError, 'not on the time grid'
+    return t
+
+def _coordAxis(ch, dim, gi):
+    """
+    Float array with the world coordinates of grid indices gi[0] to
+    gi[1] along dimension *dim* of a file with ctlinfo handle *ch*, or
+    None if they cannot be computed; internal use.
+    """
+    try:
+        a = array('f',[ _worldCoord(ch,dim,float(g))
+                        for g in range(gi[0],gi[1]+1) ])
+    except (ValueError, KeyError):
+        return None # e.g., gaussian latitudes
+    if os.name == 'java':
+        return jarray.array(a,'f')
+    return a
+
+def _gat(t):
+    """
+    Formats datetime *t* as GrADS prints times, internal use.
+    """
+    if t.minute:
+        return '%02d:%02dZ%02d%s%04d'%(t.hour,t.minute,t.day,__Months__[t.month-1],t.year)
+    return '%02dZ%02d%s%04d'%(t.hour,t.day,__Months__[t.month-1],t.year)
+
+#.....................................................................
+
 def _toHashMap(qh):
     """
     Convert attributes to a Java HashMap.
@@ -1169,10 +1736,17 @@ def _toHashMap(qh):
 
 __Months__ = ['JAN','FEB','MAR','APR','MAY','JUN','JUL','AUG','SEP','OCT','NOV','DEC']
 
+_gat2dtCache = {}
+
 def gat2dt(gat):
     """
-    Convert grads time to datetime.
+    Convert grads time to datetime. Conversions are memoized, since
+    the same times tend to be converted over and over.
     """
+    try:
+        return _gat2dtCache[gat]
+    except KeyError:
+        pass
     time, date = gat.upper().split('Z')
     if time.count(':') > 0:
         h, m = time.split(":")
@@ -1183,6 +1757,8 @@ def gat2dt(gat):
     dd, yy = date.split(mmm)
     mm = __Months__.index(mmm) + 1
     dt = datetime(int(yy),int(mm),int(dd),int(h),int(m))
+    if len(_gat2dtCache) > 65536: _gat2dtCache.clear()
+    _gat2dtCache[gat] = dt
     return dt
 
 def dt2gat(t):
@@ -504,9 +504,11 @@ class GaLab(GaNum):
 #       Transform data if necessary
 #       ---------------------------
         if self.transf:
-            if ( abs(g.lon[-1]-180.) < 0.1*(g.lon[1]-g.lon[0]) ):
-                g.lon[-1] = 180. # to avoid float point issues
-            Z = m.transform_scalar(Z,g.lon,g.lat,Nx,Ny,masked=True)
+            lon = g.lon
+            if ( abs(lon[-1]-180.) < 0.1*(lon[1]-lon[0]) ):
+                lon = lon.copy() # grid coordinates are read-only
+                lon[-1] = 180. # to avoid float point issues
+            Z = m.transform_scalar(Z,lon,g.lat,Nx,Ny,masked=True)
 
 #       If no background image specified, use Blue Marble if loaded
 #       -----------------------------------------------------------
@@ -30,16 +30,25 @@ GrADS.
 
 __version__ = '1.1.3'
 
+import os
+import errno
+import itertools
+import operator
 
 from gacore       import *
 from numtypes     import *
+from numtypes     import _tymeAxis
 from simplekml    import SimpleKML
 
 from numpy        import zeros, ones, average, newaxis, sqrt, pi, cos, inner, \
                          arange, fromfile, float32, ma, reshape, ndarray, \
-                         abs, size, meshgrid, shape, tile
+                         abs, size, meshgrid, shape, tile, memmap, \
+                         empty, dtype, uint8, asarray, datetime64, \
+                         minimum, maximum, inf, float64, prod, \
+                         concatenate, ascontiguousarray, load, dot
 
-from numpy.linalg import svd, lstsq
+from numpy.linalg import svd, lstsq, eigh, eigvalsh, qr
+from numpy.random import RandomState
 
 class GaNum(GaCore):
     """
@@ -48,15 +57,21 @@ class GaNum(GaCore):
 
     _Methods provided:
        exp  -  exports a GrADS expression into a NumPy array, with metada
+       iexp -  same as exp, but a few time steps/levels at a time
        imp  -  imports NumPy array (+metadata) into GrADS
+       imp_stream - imports data from an iterator or a memmap into GrADS
+       eval -  exports a GrADS expression into a NumPy array, no metadata
        eof  -  compute Empirical Orthogonal Functions (EOFS) from expressions 
+       eof_proj - principal components of new data on existing EOFS
+       eof_update - updates EOFS to include new time steps
+       mca  -  maximum covariance analysis (coupled SVD) of two expressions
        lsq  -  least square parameter estimation from expressions 
 
     """
 
 #........................................................................
 
-    def exp (self, expr):
+    def exp (self, expr, Bulk=True):
         """
         Exports GrADS expression *expr*, returning a GrADS Field.
 
@@ -65,6 +80,13 @@ class GaNum(GaCore):
         where
 
             F  ---  GrADS field
+
+        When more than 2 dimensions are varying, the field is
+        exported one xy slice at a time. With Bulk=True (default),
+        the commands for all slices are written ahead (at most
+        PipeDepth in flight) and the slices are read back to back
+        into a single buffer; Bulk=False waits for each slice before
+        asking for the next one.
             
         Generalized Expressions
         =======================
@@ -121,15 +143,18 @@ class GaNum(GaCore):
         if nx==1: raise GrADSError, 'lon must be varying but got nx=1'
         if ny==1: raise GrADSError, 'lat must be varying but got ny=1'
 
+        if Bulk:
+            return self._expBulk(expr, dh)
+
 #       Loop over time/z, get a GrADS 2D slice at a time/z
 #       --------------------------------------------------
         l = rc = 0  
         Data = None # defer allocations until we know the size
         grid = GaGrid(expr)
-        grid.meta = zeros((nt,nz,20),dtype=float32)
+        meta = zeros((nt,nz,20),dtype=float32)
+        lev = zeros(nz,dtype=float32)         
         grid.denv = dh 
         grid.time = [] 
-        grid.lev = zeros(nz,dtype=float32)         
         try:
             for t in range(t1,t2+1):
                 self.cmd("set t %d"%t,Quiet=True) 
@@ -143,8 +168,8 @@ class GaNum(GaCore):
                         ny_, nx_ = field.shape # may differ from dh.nx/dh.ny
                         Data = zeros(shape=(nt,nz,ny_,nx_), dtype=float32)
                     Data[l,k,:,:] = field.data
-                    grid.lev[k] = field.grid.lev[0]
-                    grid.meta[l,k,:] = field.grid.meta
+                    lev[k] = field.grid.lev[0]
+                    meta[l,k,:] = field.grid.meta
                     k = k + 1
                 l = l + 1
 
@@ -152,27 +177,29 @@ class GaNum(GaCore):
 #           --------------
             grid.lat = field.grid.lat
             grid.lon = field.grid.lon
-            amiss = grid.meta[0]
+            grid.lev = lev
+            amiss = meta.flat[0]
 
 #           Remove dimensions with size 1
 #           -----------------------------
             if nz==1: 
                 Data = Data.reshape(nt,ny_,nx_)
                 grid.dims = [ 'time', 'lat', 'lon' ]
-                grid.meta = grid.meta.reshape(nt,20)
+                grid.meta = meta.reshape(nt,20)
             elif nt==1: 
                 Data = Data.reshape(nz,ny_,nx_)
                 grid.dims = [ 'lev', 'lat', 'lon' ]
-                grid.meta = grid.meta.reshape(nz,20)
+                grid.meta = meta.reshape(nz,20)
             else:
                 grid.dims = [ 'time', 'lev', 'lat', 'lon' ]
+                grid.meta = meta
 
         except:
             self.setdim(dh)
             raise GrADSError, 'could not export <%s>'%expr
 
 
-        grid.tyme = array([gat2dt(t) for t in grid.time])
+        grid.tyme = _tymeAxis(grid.time,grid.Datetime64)
 
 #       Restore dimension environment
 #       -----------------------------
@@ -180,14 +207,235 @@ class GaNum(GaCore):
         return GaField(Data, name=expr, grid=grid, 
                        mask=(Data==amiss), dtype=float32)
     
+    def iexp ( self, expr, Dim='t', Chunk=1 ):
+        """
+        Exports GrADS expression *expr* a chunk at a time, returning
+        a generator of GrADS Fields, e.g.,
+
+            for F in self.iexp('ta',Chunk=24):
+                ...
+
+        On input, *Dim* is the dimension the export is split along:
+        't' (or 'time', the default), 'z' (or 'lev'), or 'e' (or
+        'ens'); each field has at most *Chunk* time steps or levels
+        and is what exp() returns with that dimension restricted to
+        the chunk, except that the time or level axis is kept even
+        when a chunk has a single time step or level. Since exp()
+        does not handle varying ensembles, ensemble members are
+        always exported one at a time.
+
+        Only one chunk is held in memory at a time, unless the caller
+        keeps them. The dimension environment is restored when the
+        generator is exhausted or closed, including when the loop
+        over it ends early.
+        """
+
+        try:
+            d = dict(t='t', time='t', z='z', lev='z', e='e', ens='e')[lower(Dim)]
+        except KeyError:
+            raise GrADSError, 'cannot export chunks along <%s>'%Dim
+        if type(expr) not in StringTypes:
+            raise GrADSError, "input <expr> must be a string"
+        if Chunk<1:
+            raise GrADSError, 'invalid chunk size %d'%Chunk
+        if d=='e':
+            if self.Version[1] is not '2':
+                raise GrADSError, 'ensembles require GrADS v2'
+            Chunk = 1
+
+        dh = self.query("dims", Quiet=True)
+        i1, i2 = getattr(dh,d)
+        try:
+            for i in range(i1,i2+1,Chunk):
+                self.cmd('set %s %d %d'%(d,i,min(i+Chunk-1,i2)),Quiet=True)
+                F = self.exp(expr)
+                if i2>i1 and d!='e':
+                    F = _keepAxis(F,dict(t='time',z='lev')[d])
+                yield F
+        finally:
+            self.setdim(dh)
+
+    def _expBulk ( self, expr, dh ):
+        """
+        Internal method implementing exp(Bulk=True) for rank>2: the
+        set t/z and ipc_save commands for all slices are pipelined
+        and the slices read into a preallocated (nt,nz,ny,nx) array.
+        """
+        t1, t2 = dh.t
+        z1, z2 = dh.z
+        nz, nt = (dh.nz, dh.nt)
+
+#       Time and levels, from the file metadata if possible
+#       ---------------------------------------------------
+        ens, times, levs, lat, lon = self._coordsLocal(dh)
+        if times is None or levs is None:
+            ch = self.coords()
+            times, levs = (ch.time, ch.lev)
+
+#       Commands: (command, (l,k) for slices or None)
+#       ---------------------------------------------
+        Cmds = []
+        for l in range(nt):
+            if nt>1: Cmds.append(('set t %d'%(t1+l),None))
+            for k in range(nz):
+                if nz>1: Cmds.append(('set z %d'%(z1+k),None))
+                Cmds.append((None,(l,k)))
+
+        grid = GaGrid(expr)
+        Meta = zeros((nt,nz,20),dtype=float32)
+        grid.denv = dh
+        grid.time = list(times)
+        grid.lev = array(levs,dtype=float32)
+        Data = None # allocated once we know the slice size
+        Stats = self.Stats
+        fnames = {}
+        t0 = []
+        n = len(Cmds)
+        i = sent = 0
+        try:
+            for i in range(n):
+
+#               Keep PipeDepth commands in flight: fill up the pipe
+#               first, then send a new command for each reply read
+#               --------------------------------------------------
+                m = min(n,i+self.PipeDepth)
+                if sent < m:
+                    buf = []
+                    for j in range(sent,m):
+                        cmd, lk = Cmds[j]
+                        if lk is not None:
+                            cmd = self._ipcSave(expr,lk,fnames)
+                            Cmds[j] = (cmd,lk)
+                        buf.append(cmd+'\n')
+                        if Stats is not None: t0.append(time())
+                    self.Writer.write(''.join(buf))
+                    self.Writer.flush()
+                    sent = m
+
+#               Parse response to set commands
+#               ------------------------------
+                cmd, lk = Cmds[i]
+                if lk is None:
+                    rc = self._parseReader(Quiet=True)
+                    if Stats is not None:
+                        Stats.add(cmd,time()-t0[i],self.nLines,rc=rc)
+                    self._shadow(cmd,rc)
+                    if rc:
+                        raise GrADSError, 'GrADS returned rc=%d for <%s>'%(rc,cmd)
+                    continue
+
+#               Read slice header
+#               -----------------
+                l, k = lk
+                meta = Meta[l,k]
+                if self.Shm is None:
+                    if not self._expFrame(meta):
+                        raise GrADSError, 'ipc_save() failed'
+                else:
+                    rc = self._parseReader(Quiet=True)
+                    if rc: raise GrADSError, 'ipc_save() failed'
+                    meta[:], a, lon, lat = _shmRead(fnames.pop(lk))
+                nx_, ny_ = (int(meta[3]), int(meta[4]))
+                if Data is None:
+                    id, jd = (int(meta[1]), int(meta[2]))
+                    if id!=0 or jd!=1:
+                        raise GrADSError, \
+                              'invalid exchange metadata (idim,jdim)=(%d,%d)'%(id,jd)
+                    Data = empty((nt,nz,ny_,nx_),dtype=float32)
+                    lon_ = empty(nx_,dtype=float32)
+                    lat_ = empty(ny_,dtype=float32)
+                elif (ny_,nx_) != Data.shape[2:]:
+                    raise GrADSError, 'slices of different sizes'
+
+#               Read data straight into place; lon/lat are the
+#               same for all slices, but GrADS sends them anyway
+#               ------------------------------------------------
+                if self.Shm is None:
+                    _readinto(self.Reader,Data[l,k])
+                    _readinto(self.Reader,lon_)
+                    _readinto(self.Reader,lat_)
+                    rc = self._parseReader(Quiet=True)
+                    if rc: raise GrADSError, 'ipc_save() failed'
+                else:
+                    Data[l,k] = a.reshape(ny_,nx_)
+                    lon_[:], lat_[:] = (lon, lat)
+                if Stats is not None:
+                    Stats.add(cmd,time()-t0[i],self.nLines,
+                              4*(20+nx_*ny_+nx_+ny_),rc)
+
+        except:
+            self.flush() # discard output of commands still in flight
+            for fname in fnames.values(): _shmRemove(fname)
+            self.setdim(dh)
+            raise GrADSError, 'could not export <%s>'%expr
+
+#       Remove dimensions with size 1
+#       -----------------------------
+        grid.lon, grid.lat = (lon_, lat_)
+        if nz==1:
+            Data = Data.reshape(nt,ny_,nx_)
+            grid.dims = [ 'time', 'lat', 'lon' ]
+            grid.meta = Meta.reshape(nt,20)
+        elif nt==1:
+            Data = Data.reshape(nz,ny_,nx_)
+            grid.dims = [ 'lev', 'lat', 'lon' ]
+            grid.meta = Meta.reshape(nz,20)
+        else:
+            grid.dims = [ 'time', 'lev', 'lat', 'lon' ]
+            grid.meta = Meta
+        grid.tyme = _tymeAxis(grid.time,grid.Datetime64)
+        amiss = Meta.flat[0]
+
+#       Restore dimension environment
+#       -----------------------------
+        self.setdim(dh)
+        return GaField(Data, name=expr, grid=grid, 
+                       mask=(Data==amiss), dtype=float32)
+
+    def _ipcSave ( self, expr, key, fnames ):
+        """
+        Internal method: returns the command saving *expr* with
+        ipc_save(), to the pipe or, with Shm, to a new file whose
+        name is recorded in *fnames* under *key*.
+        """
+        if self.Shm is None:
+            fname = '-'
+        else:
+            fname = fnames[key] = _shmName(self.Shm)
+        if self.Version[1] is '1':
+            return 'ipc_define void = ipc_save('+expr+','+fname+')'
+        else:
+            return 'define void = ipc_save('+expr+','+fname+')'
+
+    def _expFrame ( self, meta ):
+        """
+        Internal method: positions the stream after the next <EXP>
+        marker and reads the 20 word header into *meta*. Returns
+        False, with the output of the command discarded, if GrADS
+        responded without sending any data.
+        """
+        got = ''
+        while got[:5] != '<EXP>':
+            got = self.Reader.readline()
+            if got == '':
+                raise GrADSError, "GrADS terminated while waiting for response"
+            elif got[:5] == '<IPC>':
+                while got[:6] != '</IPC>' and got != '':
+                    got = self.Reader.readline()
+                return False
+        _readinto(self.Reader,meta)
+        return True
+
 #........................................................................
 
     def _exp2d ( self, expr, dh=None ):
         """ 
         Exports GrADS expression *expr* as a GrADS Field.
-        The stdio pipes are used for data exchange.
-        This is an internal version handling 2D xy slices.
-        In here, *expr* must be a string.
+        The stdio pipes are used for data exchange, unless a
+        shared memory directory has been specified (Shm option),
+        in which case the data is mapped from a file written
+        by GrADS.  This is an internal version handling 2D xy
+        slices.  In here, *expr* must be a string.
         """
 
         if dh==None:
@@ -206,22 +454,39 @@ class GaNum(GaCore):
 
 #       Issue GrADS command, will check rc later
 #       -----------------------------------------
+        if self.Shm is None:
+            fname = '-'
+        else:
+            fname = _shmName(self.Shm)
         if self.Version[1] is '1':
-            cmd = 'ipc_define void = ipc_save('+expr+',-)\n'
+            cmd = 'ipc_define void = ipc_save('+expr+','+fname+')\n'
         else:
-            cmd = 'define void = ipc_save('+expr+',-)\n'
+            cmd = 'define void = ipc_save('+expr+','+fname+')\n'
 
+        if self.Stats is not None: t0 = time()
         self.Writer.write(cmd)
 
-#       Position stream pointer after <EXP> marker
-#       ------------------------------------------
-        got = ''
-        while got[:5] != '<EXP>' :
-            got = self.Reader.readline()
-
-#       Read header
-#       -----------
-        grid.meta = fromfile(self.Reader,count=20,dtype=float32)
+#       Shared memory: wait for GrADS to finish, then map the file
+#       ----------------------------------------------------------
+        if self.Shm is not None:
+            rc = self._parseReader(Quiet=True)
+            if rc:
+                _shmRemove(fname)
+                raise GrADSError, 'problems exporting <'+expr+'>, ipc_save() failed'
+            grid.meta, array_, grid.lon, grid.lat = _shmRead(fname)
+            if self.Stats is not None:
+                self.Stats.add(cmd,time()-t0,self.nLines,
+                               4*(20+array_.size+grid.lon.size+grid.lat.size),rc)
+            return self._exp2dField(expr, grid, dh, array_)
+
+#       Position stream pointer after <EXP> marker, read header
+#       -------------------------------------------------------
+        meta = zeros(20,dtype=float32)
+        if not self._expFrame(meta):
+            if self.Stats is not None:
+                self.Stats.add(cmd,time()-t0,self.nLines,rc=1)
+            raise GrADSError, 'problems exporting <'+expr+'>, ipc_save() failed'
+        grid.meta = meta
 
         amiss = grid.meta[0]
         id = int(grid.meta[1])
@@ -245,21 +510,41 @@ class GaNum(GaCore):
             self.flush()
             raise GrADSError, 'problems exporting <'+expr+'>, fromfile() failed'
 
-#       Annotate grid - assumes lon, lat
-#       --------------------------------
-        dims = ( 'lon', 'lat', 'lev', 'time' )
-        grid.dims = [dims[jd],dims[id]]
-        grid.time = [ dh.time[0] ]
-        grid.lev = ones(1,dtype=float32) * float(dh.lev[0])
-
 #       Check rc from asynchronous ipc_save
 #       -----------------------------------
         rc = self._parseReader(Quiet=True)
+        if self.Stats is not None:
+            self.Stats.add(cmd,time()-t0,self.nLines,
+                           4*(20+nx_*ny_+nx_+ny_),rc)
         if rc:
             self.flush()
             raise GrADSError, 'problems exporting <'+expr+'>, ipc_save() failed'
 
-        grid.tyme = array([gat2dt(t) for t in grid.time])
+        return self._exp2dField(expr, grid, dh, array_)
+
+    def _exp2dField ( self, expr, grid, dh, array_ ):
+        """
+        Internal method: annotates *grid* and creates the GaField
+        object for the 2D slice *array_* exported by _exp2d().
+        """
+
+        amiss = grid.meta[0]
+        id = int(grid.meta[1])
+        jd = int(grid.meta[2])
+        nx_ = int(grid.meta[3])
+        ny_ = int(grid.meta[4])
+
+        if id<0 or id>3 or jd<0 or jd>3 or id==jd:
+            raise GrADSError, \
+                  'invalid exchange metadata (idim,jdim)=(%d,%d) - make sure <%s> is valid and that lon/lat is varying.'%(id,jd,expr)
+
+#       Annotate grid - assumes lon, lat
+#       --------------------------------
+        dims = ( 'lon', 'lat', 'lev', 'time' )
+        grid.dims = [dims[jd],dims[id]]
+        grid.time = [ dh.time[0] ]
+        grid.lev = ones(1,dtype=float32) * float(dh.lev[0])
+        grid.tyme = _tymeAxis(grid.time,grid.Datetime64)
 
 #       Create the GaField object
 #       -------------------------
@@ -298,10 +583,68 @@ class GaNum(GaCore):
 #       Retrieve dimension environment
 #       ------------------------------
         dh = self.query("dims", Quiet=True) 
+        nx_, ny_ = (len(grid.lon), len(grid.lat))
+
+        self._impSend(name, dh, 20+nx_*ny_+nx_+ny_,
+                      lambda stream: _impWrite(stream, Field, dh))
+
+    def imp_stream ( self, name, chunks, grid, undef=None ):
+        """
+        Imports data into GrADS as *name* for the current dimension
+        environment, without needing it all in memory. On input,
+        *chunks* can be
+
+          - an iterator (say, a generator) of arrays with the
+            slices for one or more time steps or levels each, e.g.,
+            (nz,ny,nx) arrays for one time step at a time;
+          - an array, which may be a numpy.memmap;
+          - the name of a .npy file, which is memory mapped.
+
+        Slices are taken in the order GrADS expects them: levels
+        varying fastest, then time. Masked values are replaced by the
+        undefined value, *undef*. 
+
+        The exchange metadata is taken from the template *grid*, a
+        GaGrid (or a GaField) with the metadata GrADS sent with a
+        prior export of a field on the same horizontal grid, e.g.,
+
+            ts = ga.exp('ts')
+            ga.imp_stream('tb', chunks, ts.grid)
+
+        The metadata of its first slice is used for all slices, with
+        the undefined value replaced by *undef* if specified.
+
+        If the data runs short (or the iterator fails) the missing
+        slices are sent as undefined, so that GrADS is not left
+        waiting, and GrADSError is raised.
+        """
+
+        if not self.HAS_IPC:
+            raise GrADSError, "IPC extension not available - cannot import!"
+
+        dh = self.query("dims", Quiet=True)
+        if isinstance(grid,GaField):
+            grid = grid.grid
+        nx_, ny_ = (len(grid.lon), len(grid.lat))
+        head = _impMeta(grid, undef)
+        slabs = _slabs(chunks, ny_, nx_)
+        error = []
+        def write(stream):
+            error.append(_impStream(stream, slabs, head, grid,
+                                    dh.nt*dh.nz))
+        self._impSend(name, dh, 20+nx_*ny_+nx_+ny_, write)
+        if error[0] is not None:
+            raise GrADSError, 'problems importing <%s>: %s'%(name,error[0])
+
+    def _impSend ( self, name, dh, nframe, write ):
+        """
+        Internal method: defines *name* in GrADS with ipc_load() for
+        dimension environment *dh*, the data being written by
+        function write(stream) as (nt*nz) frames of *nframe* floats.
+        """
         t1, t2 = dh.t
         z1, z2 = dh.z 
         nx, ny, nz, nt = (dh.nx, dh.ny, dh.nz, dh.nt)
-        nxy = nx * ny
 
 #       Initial implementation: require x,y to vary
 #       Note: remove this restriction is not very hard, but requires
@@ -325,62 +668,118 @@ class GaNum(GaCore):
             else:
                 cmd = 'define %s = ipc_load()\n'%name
 
+#       Shared memory: the data must be in place before ipc_open
+#       --------------------------------------------------------
+        if self.Shm is None:
+            fname = '-'
+        else:
+            fname = _shmName(self.Shm)
+            try:
+                f = open(fname,'wb')
+                try:
+                    write(f)
+                finally:
+                    f.close()
+            except:
+                _shmRemove(fname)
+                raise GrADSError, \
+                      'could not import <%s>, tofile() may have failed'%name
+
 #       Tell GrADS to start looking for data in transfer stream
 #       -------------------------------------------------------
         try:
-            self.cmd("ipc_open - r")
+            self.cmd("ipc_open %s r"%fname)
         except GrADSError:
-            raise GrADSError, '<ipc_open - r> failed; is IPC installad?'
+            _shmRemove(fname)
+            raise GrADSError, '<ipc_open %s r> failed; is IPC installad?'%fname
+        if self.Stats is not None: t0 = time()
         self.Writer.write(cmd) # asynchronous transfer
 
-#       Reshape and get original t/z offset
-#       -----------------------------------
-        t1_, z1_ = (grid.denv.t[0], grid.denv.z[0])
-        nt_, nz_ = (grid.denv.nt,grid.denv.nz)
-        nx_ = len(grid.lon)
-        ny_ = len(grid.lat)
-        nxy_ = nx_ * ny_
-        data = Field.data.reshape(nt_,nz_,ny_,nx_)
-        meta = grid.meta.reshape(nt_,nz_,20)
-
 #       Write the data to transfer stream
 #       ----------------------------------
-        try:
-            for t in range(t1,t2+1):
-                l = t - t1_
-                for z in range(z1,z2+1):
-                    k = z - z1_
-                    mx = int(meta[l,k,3])
-                    my = int(meta[l,k,4])
-                    if mx!=nx_ or my!=ny_:
-                        self.flush()
-                        raise GrADSError, \
-                             'nx/ny mismatch; got (%d,%d), expected (%d,%d)'%\
-                             (mx,my,nx_,ny_)
-                    meta[l,k,:].tofile(self.Writer)
-                    data[l,k,:,:].tofile(self.Writer)
-                    grid.lon.tofile(self.Writer)
-                    grid.lat.tofile(self.Writer)
-                    self.Writer.flush()
-        except:
-            self.flush()
-            self.setdim(dh)
-            raise GrADSError, \
-                  'could not import <%s>, tofile() may have failed'%name
-
+        if self.Shm is None:
+            try:
+                write(self.Writer)
+            except:
+                self.flush()
+                self.setdim(dh)
+                raise GrADSError, \
+                      'could not import <%s>, tofile() may have failed'%name
 
 #       Check rc from asynchronous ipc_save
 #       -----------------------------------
         rc = self._parseReader(Quiet=True)
+        if self.Stats is not None:
+            self.Stats.add(cmd,time()-t0,self.nLines,
+                           4*(t2-t1+1)*(z2-z1+1)*nframe,rc)
         self.flush()
 
 #       Restore dimension environment
 #       -----------------------------
         self.setdim(dh)
         self.cmd("ipc_close")
+        _shmRemove(fname)
         if rc:
             raise GrADSError, 'problems importing <'+name+'>, ipc_load() failed'
 
+#........................................................................
+
+    def eval ( self, expr, out=None ):
+        """
+        Exports GrADS expression *expr* through the fwrite stream,
+        returning a NumPy array shaped as the varying dimensions
+        (ens, time, lev, lat, lon), without metadata.
+
+            a = self.eval(expr)
+
+        The data is read straight into the result. Use *out* to
+        provide the result yourself, say, to reuse it in a loop; it
+        must be a contiguous float32 array of the right size, but
+        any shape, and it is returned filled in:
+
+            a = self.eval('ta', out=a)
+
+        As with GaCore.eval(), *expr* can also be an array, in which
+        case it is just returned back. This method does not need the
+        IPC extension, but the undefined values are not masked.
+        """
+
+        if type(expr) in StringTypes:
+            pass # OK, will proceed to export it from GrADS
+        elif isinstance(expr,ndarray):
+            return expr # just return input
+        else:
+            raise GrADSError, "input <expr> has invalid type"
+
+#       Check output buffer before anything is sent to GrADS
+#       ----------------------------------------------------
+        dh = self.query("dims", Quiet=True) 
+        shp = [ n for n in (dh.ne, dh.nt, dh.nz, dh.ny, dh.nx) if n > 1 ]
+        n = dh.ne*dh.nt*dh.nz*dh.ny*dh.nx
+        if self.byteorder == 'big-endian': dt = dtype('>f4')
+        else:                              dt = dtype('<f4')
+        if out is None:
+            a = empty(shp or [1],dtype=dt)
+        else:
+            if not isinstance(out,ndarray) or out.size != n or \
+               out.dtype.kind != 'f' or out.dtype.itemsize != 4 or \
+               not out.flags.c_contiguous or not out.flags.writeable:
+                raise GrADSError, \
+                      'out must be a writeable, contiguous float32 array of size %d'%n
+            a = out
+
+#       Read the data into the array
+#       ----------------------------
+        gxout, t0 = self._fwriteStart(expr, dh)
+        nbytes = _readinto(self.Reader, a)
+        rc = int(nbytes < 4*n)
+        self._fwriteEnd(expr, gxout, t0, nbytes, rc)
+        if rc:
+            raise GrADSError, 'problems evaluating <'+expr+'>'
+        if a.dtype.str != dt.str:
+            a.byteswap(True) # out= in the other byte order
+        return a
+
 #........................................................................
 
     def expr (self, expr):
@@ -407,14 +806,15 @@ class GaNum(GaCore):
         c = self.coords()
         g = GaGrid(expr,coords=c)
 
-        Data = reshape(d,c.shape)
+        Data = reshape(d,c.shape) # no copy
         F = GaField(Data,mask=(Data==c.undef),name=expr,grid=g)
 
         return F
 
 #........................................................................
 
-    def eof ( self, expr, transf='anomaly', metric='area', keep=None):
+    def eof ( self, expr, transf='anomaly', metric='area', keep=None,
+              method=None, tol=1e-4, seed=None, chunk=None):
         """ 
         Given a GrADS generalized expression *expr*, calculates Empirical 
         Orthogonal Functions (EOFS) using Singular Value Decomposition (SVD). 
@@ -450,6 +850,40 @@ class GaNum(GaCore):
                        there are timesteps (nt) 
             n     ---  keep "n" eigenvectors
 
+        method
+            How to compute the singular value decomposition:
+            None     ---  choose based on the problem size: 'svd'
+                          unless only a few leading modes are kept,
+                          in which case 'gram' if nt is much smaller
+                          than the number of grid points, 'random'
+                          otherwise
+            'svd'    ---  full SVD, trimmed to *keep* modes
+            'gram'   ---  eigen-decomposition of the (nt,nt) matrix
+                          of inner products between time steps
+            'random' ---  randomized range finder with power
+                          iterations, stopping when the relative
+                          change of the leading singular values is
+                          below *tol*; *seed* initializes the random
+                          number generator for reproducible results
+
+        Eigenvalues, principal components and eigenvectors have the
+        same normalization for all methods, but the sign of each mode
+        is arbitrary.
+
+        chunk
+            None  ---  export the whole field at once, the default
+            n     ---  out-of-core EOFs: *expr* is exported "n" time
+                       steps at a time, a few times over, and never
+                       held in memory as a whole. A first pass gets
+                       the time mean and standard deviation; the
+                       covariance matrix is then accumulated and a
+                       second pass projects out the principal
+                       components (method 'cov', the default for up
+                       to 2048 grid points), or else the field is
+                       streamed through the randomized range finder
+                       (method 'random', at most 4 power iterations).
+                       Only GrADS expressions are accepted.
+
         Notice that *expr* on input is a *generalized expression* in the
         sense that it can contain a string with a GrADS expression to be
         evaluated or a valid GrADS field. See method *exp* for additional
@@ -467,6 +901,32 @@ class GaNum(GaCore):
             raise GrADSError, \
                   'need at least 2 time steps for EOFS but got nt=%d'%dh.nt
         nt, nz, ny, nx = (dh.nt, dh.nz, dh.ny, dh.nx)
+        if chunk is not None:
+            return self._eofStream(expr,transf,metric,keep,method,tol,
+                                   seed,chunk,dh)
+
+        u, I, fill_value, offset, scale, g, shp = \
+           self._eofPrep(expr,transf,metric,dh)
+
+#       Singular value decomposition of leading modes, reuse u
+#       ------------------------------------------------------
+        if keep==None:
+            nv = nt
+        else:
+            nv = min(keep,nt)
+        pc, d, u = _svdModes(u,nv,method,tol,seed)
+
+        return _eofField(expr,g,pc,d,u,I,fill_value,offset,scale,
+                         nt,shp,metric)
+
+    def _eofPrep ( self, expr, transf, metric, dh ):
+        """
+        Internal method: exports *expr* and applies the eof() transform
+        and metric, returning (u, I, fill_value, offset, scale, grid,
+        shape), u being the (nt,npts) array at the points I which are
+        defined at the first time, and shape that of a time step.
+        """
+        nt, nz = (dh.nt, dh.nz)
 
 #       Export N-dimensional array
 #       --------------------------
@@ -505,57 +965,242 @@ class GaNum(GaCore):
             u = u * factor[newaxis,newaxis,:,newaxis]
             scale = scale * factor[newaxis,newaxis,:,newaxis]
 
-#       Singular value decomposition, reuse u
-#       -------------------------------------
-        I = u.mask[0,:,:,:]==False  # un-masked values
-        fill_value = u.fill_value   # save it for later
-        pc, d, u = svd(u.data[:,I],full_matrices=0)
+        I = ma.getmaskarray(u)[0,:,:,:]==False  # un-masked values
+        return (u.data[:,I], I, u.fill_value, offset, scale, g, (nz,ny,nx))
 
-#       Trim eigenvectors
-#       -----------------
+    def eof_proj ( self, V, expr ):
+        """
+        Given EOFs *V* as returned by eof() and a generalized GrADS
+        expression *expr* (see method *exp*), typically new time
+        steps, returns the NumPy array of its principal components,
+        shaped (nv,nt),
+
+            c = self.eof_proj(V, expr)
+
+        The time mean, scaling and metric used to compute the EOFs
+        are applied to *expr* before projecting it on them; its
+        principal components are normalized as those returned by
+        eof(), which they reproduce for the original field.
+        """
+        u, I, off, w = _eofBasis(V)
+        a = _eofRowsOf(self.exp(expr),I,off,w)
+        return sqrt((V.nt-1)/_positive(V.d))[:,newaxis] * dot(u,a.T)
+
+    def eof_update ( self, V, expr ):
+        """
+        Given EOFs *V* as returned by eof() and a generalized GrADS
+        expression *expr* with new time steps, returns EOFs and
+        eigenvalues updated to include them, 
+
+            V, d = self.eof_update(V, expr)
+
+        without recomputing the decomposition: each new time step is
+        added by a rank-one update of the singular value decomposition
+        (Brand, 2006), keeping the number of EOFs. The time mean and
+        scaling are not updated. Principal components with respect to
+        the updated EOFs can be obtained with eof_proj().
+        """
+        u, I, off, w = _eofBasis(V)
+        a = _eofRowsOf(self.exp(expr),I,off,w)
+        k = u.shape[0]
+        s = sqrt(V.d*(V.nt-1))
+        for row in a:
+            m = dot(u,row)
+            r = row - dot(m,u)
+            rho = _norm(r)
+            K = zeros((k+1,k+1),dtype=float64)
+            K[range(k),range(k)] = s
+            K[k,0:k] = m
+            K[k,k] = rho
+            Pk, s, Vk = svd(K)
+            if rho > 0:
+                u = dot(Vk[:,0:k],u) + Vk[:,k:k+1] * (r/rho)
+            else:
+                u = dot(Vk[:,0:k],u)
+            u, s = (u[0:k], s[0:k])
+        nt = V.nt + len(a)
+
+#       Same layout and attributes as V
+#       -------------------------------
+        U = _scatter(u.astype(float32),I,(k,)+V.shape[1:],V.fill_value)
+        U = GaField(U.data.reshape(V.shape), name=V.name, grid=V.grid,
+                    mask=ma.getmaskarray(V))
+        U.offset, U.scale, U.metric = (V.offset, V.scale, V.metric)
+        U.nt = nt
+        U.d = s * s / (nt - 1)
+        return (U, U.d)
+
+    def _eofStream ( self, expr, transf, metric, keep, method, tol, seed,
+                     chunk, dh ):
+        """
+        Internal method implementing eof(chunk=n): the field is exported
+        *chunk* time steps at a time with iexp(), once per pass.
+        """
+        if type(expr) not in StringTypes:
+            raise GrADSError, "out-of-core EOFs require a GrADS expression"
+        if transf not in (None,'anomaly','z-score'):
+            raise GrADSError, 'Unknown transf <%s>'%transf
+        nt, nz = (dh.nt, dh.nz)
+        geo = GaHandle('eof')
+        geo.I = None
+
+#       First pass: time mean and standard deviation, merging the
+#       statistics of each chunk (Chan et al, 1979)
+#       ---------------------------------------------------------
+        off, n = (0., 0)
+        if transf is None:
+            for a in self._eofRows(expr,chunk,geo,nz):
+                break # just the grid
+        else:
+            m2 = 0.
+            for a in self._eofRows(expr,chunk,geo,nz):
+                m = a.shape[0]
+                mu = a.mean(axis=0,dtype=float64)
+                delta = mu - off
+                off = off + delta * m / (n + m)
+                m2 = m2 + ((a-mu)**2).sum(axis=0) + delta*delta*n*m/(n+m)
+                n = n + m
+        I, g = (geo.I, geo.grid)
+        npts = I.sum()
+
+#       Weights: 1/stdv for z-scores, times sqrt(cos(lat)) for area
+#       -----------------------------------------------------------
+        std = ones(npts,dtype=float64)
+        if transf=='z-score':
+            std = sqrt(m2/n)
+        fac = ones(npts,dtype=float64)
+        if metric=='area':
+            fac = sqrt(cos(pi*g.lat/180.))[newaxis,:,newaxis] \
+                  * ones(geo.shape,dtype=float64)
+            fac = fac.reshape(-1)[I]
+        w = zeros(npts,dtype=float64)
+        w[std>0] = fac[std>0] / std[std>0]
+        off = (off + zeros(npts)).astype(float32)
+        w = w.astype(float32)
+        rows = lambda: self._eofRows(expr,chunk,geo,nz,off,w)
+
+#       Leading modes
+#       -------------
         if keep==None:
             nv = nt
         else:
             nv = min(keep,nt)
-            u = u[0:nv,:]
-            d = d[0:nv]
-            pc = pc[:,0:nv]
+        k = min(nv,npts)
+        if method is None:
+            if npts <= _EofCovMax:
+                method = 'cov'
+            else:
+                method = 'random'
+        if method=='cov':
+            pc, d, u = _eofCov(rows,nt,npts,k)
+        elif method=='random':
+            pc, d, u = _eofRandom(rows,nt,npts,k,tol,seed)
+        else:
+            raise GrADSError, 'Unknown method <%s> for out-of-core EOFs'%method
+
+#       Offset, scale and grid as eof() would have them: the grid
+#       of a chunk only knows about its own time steps
+#       ---------------------------------------------------------
+        offset = _scatter(off[newaxis,:],I,(1,)+geo.shape,0.)[0]
+        scale = _scatter((fac*std)[newaxis,:],I,(1,)+geo.shape,1.)[0]
+        times = self._coordsLocal(dh)[1]
+        if times is None:
+            times = self.coords().time
+        g = g.copy()
+        g.denv = dh
+        g.time = list(times)
+        g.tyme = _tymeAxis(g.time,g.Datetime64)
+        meta = g.meta.reshape((-1,nz,20))[0]
+        g.meta = meta[newaxis].repeat(nv,axis=0).reshape((nv,)+g.meta.shape[1:])
+
+        return _eofField(expr,g,pc,d,u,I,geo.fill_value,offset,scale,
+                         nt,geo.shape,metric)
+
+    def _eofRows ( self, expr, chunk, geo, nz, off=0., w=1. ):
+        """
+        Internal method: generator of (m,npts) arrays with *chunk* time
+        steps of *expr* at a time, restricted to the points which are
+        defined at the first time and transformed as (a-off)*w. Mask,
+        grid and shape are recorded in GaHandle *geo* on first use.
+        """
+        for F in self.iexp(expr,Dim='t',Chunk=chunk):
+            g = F.grid
+            if geo.I is None:
+                geo.shape = (nz,len(g.lat),len(g.lon))
+                geo.grid = g
+                geo.fill_value = F.fill_value
+                geo.I = ma.getmaskarray(F).reshape((-1,prod(geo.shape)))[0]==False
+            a = F.data.reshape((-1,geo.I.size))[:,geo.I]
+            yield (a - off) * w
 
-#       Adjust grid properties
-#       ----------------------
-        g.dims[0] = 'eof'
-        g.time = arange(nv)
-        g.eof = arange(nv)
+#.....................................................................
 
-#       Eigenvalues/coefficients
-#       ------------------------
-        d = d * d / (nt - 1)
-        pc = (nt -1) * pc.transpose()
-
-#       Normalize eigenvectors
-#       ----------------------
-        for i in range(nv):
-            vnorm = _norm(u[i,:])
-            u[i,:] = u[i,:] / vnorm
-            pc[i,:] = pc[i,:] * vnorm
-    
-        # Scatter eigenvectors
-        # --------------------
-        g.meta = g.meta[0:nv] 
-        u = _scatter(u,I,(nv,nz,ny,nx),fill_value)
+    def mca ( self, expr_a, expr_b, transf='anomaly', metric='area',
+              keep=None, method=None, tol=1e-4, seed=None ):
+        """
+        Given GrADS generalized expressions *expr_a* and *expr_b* (see
+        method *exp*), performs a Maximum Covariance Analysis (MCA):
+        the singular value decomposition of their cross-covariance
+        matrix, also known as coupled SVD,
 
-#       Let's make sure "u" is a bonafide GaGield
-#       -----------------------------------------
-        u = GaField(u.data, name=expr, grid=g, mask=u.mask)
-        u.offset = offset.squeeze()
-        u.scale = scale.squeeze()
+            U, V, d, a, b = self.mca(expr_a, expr_b)
 
-#       Note: since GrADS v1 does not know about e-dimensions yet,
-#       we let it think that the EOF dimension is the time dimension
+        where
 
-#       All done
-#       --------
-        return (u, d, pc)
+            U, V  ---  Specialized GrADS Fields holding the singular
+                       vectors of *expr_a* and *expr_b*, with the
+                       *offset* and *scale* factors of eof()
+            d     ---  NumPy array with singular values, the
+                       covariances between the modes
+            a, b  ---  NumPy arrays with the expansion coefficients,
+                       shaped (nv,nt), the projection of each field
+                       on its singular vectors
+
+        Both fields are exported for the same dimension environment,
+        but need not be on the same grid. Options *transf*, *metric*,
+        *keep*, *tol* and *seed* are as for eof(), and applied to both
+        fields. The cross-covariance matrix is never formed; *method*
+        can be
+
+            None     ---  'qr' if only a few leading modes are kept or
+                          nt is much smaller than the number of grid
+                          points, 'random' otherwise
+            'qr'     ---  exact: decomposes the (nt,nt) product of the
+                          triangular factors of each field
+            'random' ---  randomized range finder with power
+                          iterations, as in eof()
+
+        The sign of each pair of modes is arbitrary.
+        """
+
+        dh = self.query("dims",Quiet=True)
+        if dh.nt < 2:
+            raise GrADSError, \
+                  'need at least 2 time steps for MCA but got nt=%d'%dh.nt
+        nt = dh.nt
+        A = self._eofPrep(expr_a,transf,metric,dh)
+        B = self._eofPrep(expr_b,transf,metric,dh)
+
+#       Leading singular triplets of the cross-covariance
+#       -------------------------------------------------
+        if keep==None:
+            nv = nt
+        else:
+            nv = min(keep,nt)
+        ua, d, ub = _svdCross(A[0],B[0],nv,method,tol,seed)
+        d = d / (nt - 1)
+        a = dot(ua,A[0].T)
+        b = dot(ub,B[0].T)
+
+#       Scatter singular vectors
+#       ------------------------
+        u, I, fill_value, offset, scale, g, shp = A
+        U = _modeField(expr_a,ua,I,fill_value,offset,scale,g,shp,metric)
+        u, I, fill_value, offset, scale, g, shp = B
+        V = _modeField(expr_b,ub,I,fill_value,offset,scale,g,shp,metric)
+        U.nt = V.nt = nt
+
+        return (U, V, d, a, b)
 
 #.....................................................................
 
@@ -758,7 +1403,7 @@ class GaNum(GaCore):
             g.dims.append('lev')
         
         g.lon, g.lat = (lons, lats) # "obs" coordinates
-        g.tyme = array([gat2dt(t) for t in g.time])
+        g.tyme = _tymeAxis(g.time,g.Datetime64)
 
 #       Restore dimension environment
 #       -----------------------------
@@ -789,7 +1434,7 @@ class GaNum(GaCore):
     
         The optional **kwopts arguments are passed to the
         interpolate() function.  Notice that *tyme* is an array of
-        datetime objects.
+        datetime objects, or a NumPy datetime64 array.
 
         Note: the basemap interpolation routine requires longitudes in
         the range [-180,180]. When *expr* is a string the longitudes are
@@ -813,17 +1458,22 @@ class GaNum(GaCore):
         # ------------------------------
         dh = self.query("dims", Quiet=True) 
 
+        # All time arithmetic below is done on datetime64 arrays
+        # ------------------------------------------------------
+        t64 = asarray(tyme).astype('datetime64[s]')
+        gats = dt642gat(t64)
+
         # Find GrADS times bracketing the input time array
         # ------------------------------------------------
-        self.cmd('set time %s'%dt2gat(tyme[0]),Quiet=True)
+        self.cmd('set time %s'%gats[0],Quiet=True)
         qh = self.query("dims",Quiet=True)
         tbeg = int(qh.t[0])
-        if tyme[0] < gat2dt(qh.time[0]):
+        if t64[0] < gat2dt64(qh.time[0]):
             tbeg = tbeg - 1
-        self.cmd('set time %s'%dt2gat(tyme[-1]),Quiet=True)
+        self.cmd('set time %s'%gats[-1],Quiet=True)
         qh = self.query("dims",Quiet=True)
         tend = int(qh.t[0])
-        if tyme[-1] > gat2dt(qh.time[0]):
+        if t64[-1] > gat2dt64(qh.time[0]):
             tend = tend + 1
 
         # Check if (tbeg,tend) is in range of default file
@@ -834,16 +1484,16 @@ class GaNum(GaCore):
 
         # Find time step
         # --------------
-        dt = self._getDatetime(tbeg+1) - self._getDatetime(tbeg)
-        dt_secs = dt.total_seconds()
+        dt = datetime64(self._getDatetime(tbeg+1),'s') \
+           - datetime64(self._getDatetime(tbeg),'s')
         
         # Loop over time, producing XY interpolation at each time
         # -------------------------------------------------------
-        V, I = [], []
+        V, I, T = [], [], []
         for t in range(tbeg,tend+1):
-            now = self._getDatetime(t) # grads time is set to t
+            now = datetime64(self._getDatetime(t),'s') # grads time is set to t
             if Verbose: print " [] XY Interpolating at ", now
-            i = (tyme>=now-dt) & (tyme<=now+dt)
+            i = (t64>=now-dt) & (t64<=now+dt)
             if any(i):
                 self._tightDomain(lons[i],lats[i]) # minimize I/O
                 v, levs = self._interpXY(expr, lons[i], lats[i], levs=levs, **kwopts)
@@ -851,6 +1501,7 @@ class GaNum(GaCore):
                 v = None
             V.append(v)
             I.append(i)
+            T.append(now)
             
         # Now perform the time interpolation
         # ----------------------------------
@@ -863,11 +1514,11 @@ class GaNum(GaCore):
         v1, v2 = v.copy(), v.copy() # scratch space
         n = 0
         for t in range(tbeg,tend):
-            now = self._getDatetime(t) 
+            now = T[n]
             v1[I[n]], v2[I[n+1]] = V[n], V[n+1]
-            j = (tyme>=now) & (tyme<=now+dt)
+            j = (t64>=now) & (t64<=now+dt)
             if any(j): 
-                a = array([r.total_seconds()/dt_secs for r in tyme[j]-now],dtype=float32) 
+                a = ((t64[j]-now)/dt).astype(float32)
                 if len(shp)==2: # has vertical levels
                     a = tile(a,(shp[1],1)).T # replicate array
                 v[j] = (1-a) * v1[j] + a * v2[j]
@@ -878,7 +1529,7 @@ class GaNum(GaCore):
         g = GaGrid("sampleXYT")
         g.lev = levs
         g.lon, g.lat, g.tyme = (lons, lats, tyme)
-        g.time = array([dt2gat(t) for t in g.tyme])
+        g.time = gats
         g.dims = ['obs',]
         if dh.nz>1:
             g.dims.append('lev')
@@ -966,6 +1617,545 @@ class GaNum(GaCore):
    
 #.....................................................................
 
+_Names = dict(t='time', z='lev', y='lat', x='lon')
+_Axes = dict(time='t', lev='z', lat='y', lon='x')
+
+class LazyGaField(object):
+    """
+    A GrADS expression, along with the dimension environment at the
+    time it is created, which is only exported from GrADS when the
+    data is needed, e.g.,
+
+        ta = LazyGaField(ga,'ta')     # nothing exported yet
+        F = ta[0:2,:,10:20,30:40]     # exports just this box
+        tm = ta.mean(axis=0)          # exported in chunks
+
+    The axes are those of the GaField exp() would return, i.e.,
+    (time, lev, lat, lon) less those with a single element; both lat
+    and lon must be varying.
+
+    Indexing with integers and slices returns a GaField. The GrADS
+    dimension environment is restricted to the smallest box holding
+    the elements asked for, so that only these are exported. The
+    last *MaxChunks* boxes exported are cached; requests contained
+    in one of them are served from it. Reductions (sum, mean, min,
+    max) export *Chunk* elements of the first axis at a time and
+    do not go through the cache. By default, chunks have about 4
+    million values.
+
+    The expression is evaluated by client *ga* on its current default
+    file, and the dimension environment of *ga* is restored after
+    each export.
+    """
+
+    def __init__ (self, ga, expr, MaxChunks=8, Chunk=None):
+
+        if type(expr) not in StringTypes:
+            raise GrADSError, "input <expr> must be a string"
+        dh = ga.query("dims", Quiet=True)
+        if dh.nx==1: raise GrADSError, 'lon must be varying but got nx=1'
+        if dh.ny==1: raise GrADSError, 'lat must be varying but got ny=1'
+        if dh.ne>1:  raise GrADSError, 'cannot handle varying ensembles'
+
+        self.ga = ga
+        self.name = expr
+        self.denv = dh
+        self.MaxChunks = MaxChunks
+        self._axes = [ a for a in 'tzyx' if getattr(dh,'n'+a)>1 ]
+        self.dims = [ _Names[a] for a in self._axes ]
+        self.shape = tuple([ getattr(dh,'n'+a) for a in self._axes ])
+        self.ndim = len(self.shape)
+        if Chunk is None:
+            Chunk = max(1,(1<<22)//int(prod(self.shape[1:])))
+        self.Chunk = Chunk
+        self._cache = [] # (box,field), most recently used last
+
+    def __len__ (self):
+        return self.shape[0]
+
+    def __repr__ (self):
+        return '<LazyGaField %s %s>'%(self.name,str(self.shape))
+
+    def __array__ (self, dtype=None):
+        return asarray(self[...],dtype=dtype)
+
+    def __getitem__ (self, key):
+        box, idx = self._box(key)
+        cbox, F = self._fetch(box)
+        rel = []
+        for (lo, hi), k in zip(cbox,idx):
+            if type(k) is tuple:
+                first, last, step = k
+                stop = last - lo + step
+                if stop < 0: stop = None
+                rel.append(slice(first-lo,stop,step))
+            else:
+                rel.append(k-lo)
+        return _subset(F,tuple(rel))
+
+    def clear (self):
+        """
+        Empties the cache of exported boxes.
+        """
+        self._cache = []
+
+#   Reductions
+#   ----------
+    def sum (self, axis=None):
+        """Sum of the unmasked elements over the given axis."""
+        return self._reduce('sum',axis)
+
+    def mean (self, axis=None):
+        """Average of the unmasked elements over the given axis."""
+        return self._reduce('mean',axis)
+
+    def min (self, axis=None):
+        """Minimum of the unmasked elements over the given axis."""
+        return self._reduce('min',axis)
+
+    def max (self, axis=None):
+        """Maximum of the unmasked elements over the given axis."""
+        return self._reduce('max',axis)
+
+    def _reduce (self, op, axis):
+        """
+        Internal method: reduces the field one chunk at a time. Sums,
+        minima and maxima are accumulated from the filled data along
+        with the number of unmasked elements.
+        """
+        if axis is not None:
+            if axis < 0: axis = axis + self.ndim
+            if axis < 0 or axis >= self.ndim:
+                raise ValueError, 'invalid axis %d'%axis
+        fill = dict(sum=0., mean=0., min=inf, max=-inf)[op]
+        f = dict(sum='sum', mean='sum', min='min', max='max')[op]
+        acc = cnt = None
+        parts = []
+        n = self.shape[0]
+        full = [ (0,m-1) for m in self.shape[1:] ]
+        for i in range(0,n,self.Chunk):
+            F = self._export(tuple([(i,min(i+self.Chunk,n)-1)]+full))
+            a = getattr(F.filled(fill).astype(float64),f)(axis=axis)
+            c = F.count(axis=axis)
+            if axis is not None and axis > 0:
+                parts.append(_finish(op,a,c))
+            elif acc is None:
+                acc, cnt = (a, c)
+            else:
+                if   f=='sum': acc = acc + a
+                elif f=='min': acc = minimum(acc,a)
+                else:          acc = maximum(acc,a)
+                cnt = cnt + c
+        if parts:
+            return ma.concatenate(parts,axis=0)
+        return _finish(op,acc,cnt)
+
+#   Exporting
+#   ---------
+    def _box (self, key):
+        """
+        Internal method: returns the box (lo,hi) along each axis to
+        be exported for index *key*, along with the index for each
+        axis: an integer, or a (first,last,step) tuple for slices.
+        """
+        if type(key) is not tuple: key = (key,)
+        i = [ j for j in range(len(key)) if key[j] is Ellipsis ]
+        if len(i) > 1:
+            raise IndexError, 'an index can only have a single ellipsis'
+        elif i:
+            i = i[0]
+            key = key[:i] + (slice(None),)*(self.ndim-len(key)+1) + key[i+1:]
+        if len(key) > self.ndim:
+            raise IndexError, 'too many indices'
+        key = key + (slice(None),)*(self.ndim-len(key))
+        box, idx = [], []
+        for n, k, a in zip(self.shape,key,self._axes):
+            if isinstance(k,slice):
+                r = range(*k.indices(n))
+                if len(r)==0:
+                    raise IndexError, 'empty slices are not supported'
+                lo, hi = (min(r[0],r[-1]), max(r[0],r[-1]))
+                idx.append((r[0],r[-1],k.indices(n)[2]))
+            else:
+                try:
+                    k = operator.index(k)
+                except TypeError:
+                    raise IndexError, 'only integers, slices and ellipsis are valid indices'
+                if k < 0: k = k + n
+                if k < 0 or k >= n:
+                    raise IndexError, 'index out of range'
+                lo = hi = k
+                idx.append(k)
+            if a in 'xy' and lo==hi: # lon/lat must be varying for exp()
+                if hi < n-1: hi = hi + 1
+                else:        lo = lo - 1
+            box.append((lo,hi))
+        return (tuple(box), idx)
+
+    def _fetch (self, box):
+        """
+        Internal method: returns a cached box containing *box* along
+        with its field, exporting *box* if there is none.
+        """
+        for i in range(len(self._cache)):
+            cbox, F = self._cache[i]
+            for (lo, hi), (clo, chi) in zip(box,cbox):
+                if lo < clo or hi > chi: break
+            else:
+                self._cache.append(self._cache.pop(i))
+                return (cbox, F)
+        F = self._export(box)
+        if self.MaxChunks > 0:
+            self._cache.append((box,F))
+            del self._cache[:-self.MaxChunks]
+        return (box, F)
+
+    def _export (self, box):
+        """
+        Internal method: exports *box*, a (lo,hi) range for each axis,
+        returning a GaField with all the axes of this field.
+        """
+        ga, dh = (self.ga, self.denv)
+        box = dict(zip(self._axes,box))
+        Cmds = []
+        for a in 'xyzt':
+            i0 = getattr(dh,a+'i')[0]
+            lo, hi = box.get(a,(0,0))
+            Cmds.append('set %s %d %d'%(a,i0+lo,i0+hi))
+        if ga.Version[1] is '2':
+            Cmds.append('set e %d'%dh.e[0])
+        cur = ga.query("dims", Quiet=True)
+        try:
+            ga.cmd('\n'.join(Cmds),Quiet=True,Pipe=True)
+            F = ga.exp(self.name)
+        finally:
+            ga.setdim(cur)
+        for dim in ( 'lev', 'time' ):
+            if _Axes[dim] in box:
+                F = _keepAxis(F,dim)
+        return F
+
+def _finish(op, a, c):
+    """
+    Final result of reduction *op* from accumulated value *a* and
+    count *c*: masked where there are no unmasked elements.
+    """
+    if op=='mean':
+        a = a / maximum(c,1)
+    if isinstance(a,ndarray):
+        return ma.masked_array(a,mask=(c==0))
+    if c==0: return ma.masked
+    return a
+
+def _subset(F, idx):
+    """
+    Returns the subset *idx* (an integer or a slice for each axis) of
+    GaField *F*, with its grid. The dimension environment in the grid
+    is only kept for contiguous subsets.
+    """
+    grid = F.grid.copy()
+    lead = []
+    dims = []
+    for dim, k in zip(F.grid.dims,idx):
+        if isinstance(k,slice):
+            dims.append(dim)
+            sel = k
+        else:
+            sel = slice(k,k+1)
+        if dim in ( 'time', 'lev' ):
+            lead.append(k)
+        if dim=='time':
+            grid.time = list(grid.time[sel])
+            grid.tyme = grid.tyme[sel]
+        else:
+            setattr(grid,dim,getattr(grid,dim)[sel])
+    grid.dims = dims
+    grid.meta = grid.meta[tuple(lead)]
+    grid.denv = _subDenv(F.grid.denv,grid,F.grid.dims,F.shape,idx)
+    return GaField(F.data[idx], name=F.name, grid=grid,
+                   mask=ma.getmaskarray(F)[idx], dtype=float32)
+
+def _subDenv(dh, grid, dims, shape, idx):
+    """
+    Returns the dimension environment for subset *idx* of a field
+    exported with environment *dh*, or None if the subset is not
+    contiguous. Coordinate ranges are taken from *grid*.
+    """
+    if dh is None: return None
+    sub = GaHandle('dims')
+    sub.__dict__.update(dh.__dict__)
+    for dim, n, k in zip(dims,shape,idx):
+        a = _Axes[dim]
+        if isinstance(k,slice):
+            lo, hi, step = k.indices(n)
+            if step!=1: return None
+            hi = hi - 1
+        else:
+            lo = hi = k
+        i0 = getattr(dh,a+'i')[0]
+        i = (i0+lo, i0+hi)
+        setattr(sub,a+'i',i)
+        if a in 'xy': setattr(sub,a,(float(i[0]),float(i[1])))
+        else:         setattr(sub,a,i)
+        setattr(sub,'n'+a,hi-lo+1)
+        if hi>lo: setattr(sub,a+'_state','varying')
+        else:     setattr(sub,a+'_state','fixed')
+    sub.lon = (float(grid.lon[0]),float(grid.lon[-1]))
+    sub.lat = (float(grid.lat[0]),float(grid.lat[-1]))
+    sub.lev = (float(grid.lev[0]),float(grid.lev[-1]))
+    sub.time = (grid.time[0],grid.time[-1])
+    sub.tyme = [grid.tyme[0],grid.tyme[-1]]
+    sub.rank = len([ a for a in 'xyzte' if getattr(sub,'n'+a)>1 ])
+    return sub
+
+#.....................................................................
+
+_shmCount = itertools.count(1)
+
+def _shmName(dir):
+    """
+    Creates a new empty file under *dir* for exchanging data with
+    GrADS, returning its name. Names are in lower case since GrADS
+    lower cases its input.
+    """
+    while True:
+        fname = os.path.join(dir,'pygrads-%d-%d.bin'%(os.getpid(),_shmCount.next()))
+        try:
+            os.close(os.open(fname,os.O_WRONLY|os.O_CREAT|os.O_EXCL,0600))
+            return fname
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise GrADSError, 'cannot create exchange file %s (%s)'%(fname,e)
+
+def _shmRemove(fname):
+    """
+    Removes an exchange file, if it is one.
+    """
+    if fname == '-': return
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
+
+def _keepAxis(F, dim):
+    """
+    Returns field *F* with a size one axis for dimension *dim*
+    ('time' or 'lev') inserted, if exp() had dropped it.
+    """
+    if dim in F.grid.dims: return F
+    grid = F.grid.copy() # F may share it
+    i = 0
+    if dim=='lev' and 'time' in grid.dims: i = 1
+    shp = F.shape[:i] + (1,) + F.shape[i:]
+    grid.dims = grid.dims[:i] + [dim] + grid.dims[i:]
+    grid.meta = grid.meta.reshape(shp[:-2]+(20,))
+    return GaField(F.data.reshape(shp), name=F.name, grid=grid,
+                   mask=ma.getmaskarray(F).reshape(shp), dtype=float32)
+
+_ImpGather = 1 << 16  # slices smaller than this are gathered ...
+_ImpBuffer = 1 << 20  # ... into buffers of about this size (bytes)
+
+def _impWrite(stream, Field, dh):
+    """
+    Writes the 2D slices of *Field* needed for dimension environment
+    *dh* to *stream*, in the format expected by ipc_load(). Small
+    slices are gathered into large buffers, each sent with a single
+    write; large ones are written straight from the memory of
+    *Field* (say, a memory mapped file), only copied if they are not
+    contiguous native float32.
+    """
+    grid = Field.grid
+    t1_, z1_ = (grid.denv.t[0], grid.denv.z[0])
+    nt_, nz_ = (grid.denv.nt,grid.denv.nz)
+    nx_ = len(grid.lon)
+    ny_ = len(grid.lat)
+    nxy_ = nx_ * ny_
+    data = Field.data.reshape(nt_,nz_,ny_,nx_)
+    meta = grid.meta.reshape(nt_,nz_,20).astype(float32)
+    tail = concatenate((grid.lon,grid.lat)).astype(float32)
+
+    slices = []
+    for t in range(dh.t[0],dh.t[1]+1):
+        l = t - t1_
+        for z in range(dh.z[0],dh.z[1]+1):
+            k = z - z1_
+            mx = int(meta[l,k,3])
+            my = int(meta[l,k,4])
+            if mx!=nx_ or my!=ny_:
+                raise GrADSError, \
+                     'nx/ny mismatch; got (%d,%d), expected (%d,%d)'%\
+                     (mx,my,nx_,ny_)
+            slices.append((l,k))
+
+#   Small slices: whole frames (meta, data, lon, lat) copied into a buffer
+#   ----------------------------------------------------------------------
+    if 4*nxy_ < _ImpGather:
+        nb = max(1,_ImpBuffer//(4*(20+nxy_+nx_+ny_)))
+        buf = empty((min(nb,len(slices)),20+nxy_+nx_+ny_),dtype=float32)
+        buf[:,20+nxy_:] = tail
+        for i in range(0,len(slices),nb):
+            n = 0
+            for l, k in slices[i:i+nb]:
+                buf[n,:20] = meta[l,k]
+                buf[n,20:20+nxy_] = data[l,k].ravel()
+                n = n + 1
+            _write(stream,buf[:n])
+
+#   Large slices: written in place, with the small bits in between joined
+#   ---------------------------------------------------------------------
+    else:
+        native = dtype(float32)
+        pending = ''
+        for l, k in slices:
+            slab = data[l,k]
+            if slab.dtype != native or not slab.flags.c_contiguous:
+                slab = ascontiguousarray(slab,dtype=float32)
+            _write(stream,pending+meta[l,k].tostring())
+            _write(stream,slab)
+            pending = tail.tostring()
+        _write(stream,pending)
+
+    stream.flush()
+
+def _impMeta(grid, undef=None):
+    """
+    Returns the exchange metadata header for slices on *grid*: the
+    first one in grid.meta, as sent by ipc_save(), with undefined
+    value *undef* if specified.
+    """
+    if grid.meta is None:
+        raise GrADSError, \
+              'template grid has no exchange metadata; use that of a field from exp()'
+    head = asarray(grid.meta,dtype=float32).reshape(-1)[:20].copy()
+    if undef is not None: head[0] = undef
+    if int(head[3])!=len(grid.lon) or int(head[4])!=len(grid.lat):
+        raise GrADSError, \
+              'nx/ny mismatch; got (%d,%d), expected (%d,%d)'%\
+              (int(head[3]),int(head[4]),len(grid.lon),len(grid.lat))
+    return head
+
+def _slabs(chunks, ny, nx):
+    """
+    Returns an iterator over the (ny,nx) slices in *chunks*, an
+    iterator of arrays, an array or the name of a .npy file.
+    """
+    if type(chunks) in StringTypes:
+        try:
+            chunks = load(chunks,mmap_mode='r')
+        except (IOError, ValueError), e:
+            raise GrADSError, 'cannot load <%s>: %s'%(chunks,e)
+    if isinstance(chunks,ndarray):
+        chunks = [ chunks ]
+    for c in chunks:
+        if c.size % (ny*nx):
+            raise GrADSError, \
+                  'chunk of shape %s does not hold (%d,%d) slices'%(str(c.shape),ny,nx)
+        for slab in c.reshape(-1,ny,nx):
+            yield slab
+
+def _impStream(stream, slabs, head, grid, n):
+    """
+    Writes *n* frames with header *head*, the slices from iterator
+    *slabs* and the coordinates of *grid* to *stream*. Slices the
+    iterator fails to provide are sent as undefined. Returns None,
+    or a message describing what went wrong.
+    """
+    nx_, ny_ = (len(grid.lon), len(grid.lat))
+    gather = 4*nx_*ny_ < _ImpGather
+    native = dtype(float32)
+    undef = None
+    hbytes = head.tostring()
+    tbytes = concatenate((grid.lon,grid.lat)).astype(float32).tostring()
+    pending, parts, size = ('', [], 0)
+    error = None
+    for i in range(n):
+        slab = None
+        if error is None:
+            try:
+                slab = slabs.next()
+                if isinstance(slab,ma.MaskedArray):
+                    slab = slab.filled(head[0])
+                if slab.dtype != native or not slab.flags.c_contiguous:
+                    slab = ascontiguousarray(slab,dtype=float32)
+            except StopIteration:
+                error = 'got %d slices, expected %d'%(i,n)
+            except Exception, e:
+                error = 'failed after %d slices (%s)'%(i,e)
+        if slab is None:
+            if undef is None: undef = ones((ny_,nx_),dtype=float32) * head[0]
+            slab = undef
+        if gather:
+            parts.append(pending+hbytes)
+            parts.append(slab.tostring())
+            size = size + 4*(20+slab.size+nx_+ny_)
+            if size >= _ImpBuffer:
+                _write(stream,''.join(parts))
+                parts, size = ([], 0)
+        else:
+            _write(stream,pending+hbytes)
+            _write(stream,slab)
+        pending = tbytes
+    parts.append(pending)
+    _write(stream,''.join(parts))
+    stream.flush()
+    if error is None:
+        try:
+            slabs.next()
+            error = 'got more than %d slices'%n
+        except StopIteration:
+            pass
+        except Exception, e:
+            error = 'failed after %d slices (%s)'%(n,e)
+    return error
+
+def _write(stream, a):
+    """
+    Writes the bytes of array (or string) *a* to *stream*, without
+    copying them where possible.
+    """
+    try:
+        stream.write(a)
+    except TypeError: # stream does not take buffers
+        stream.write(a.tostring())
+
+def _readinto(stream, a):
+    """
+    Reads the contents of array *a* from *stream* in place, returning
+    the number of bytes read.
+    """
+    buf = a.reshape(-1).view(uint8)
+    got = 0
+    try:
+        while got < buf.size:
+            k = stream.readinto(buf[got:])
+            if not k: break
+            got = got + k
+    except AttributeError: # no readinto(), e.g., from popen2()
+        b = fromfile(stream,count=buf.size,dtype=uint8)
+        buf[:b.size] = b
+        got = b.size
+    return got
+
+def _shmRead(fname):
+    """
+    Maps a file written by ipc_save() and returns (meta, data, lon,
+    lat) as views of it, without copying. The file is removed right
+    away; its memory is released once these arrays are gone.
+    """
+    try:
+        try:
+            buf = memmap(fname,dtype=float32,mode='c').view(ndarray)
+        except (ValueError, IOError, OSError):
+            raise GrADSError, 'cannot map exchange file %s'%fname
+    finally:
+        _shmRemove(fname)
+    if buf.size >= 20:
+        nx_, ny_ = (int(buf[3]), int(buf[4]))
+        n = 20 + nx_*ny_
+    if buf.size < 20 or buf.size != n + nx_ + ny_:
+        raise GrADSError, 'exchange file %s has unexpected size'%fname
+    return (buf[:20], buf[20:n], buf[n:n+nx_], buf[n+nx_:])
+
 def _norm(x):
     """
     L-2 norm, internal use
@@ -976,14 +2166,266 @@ def _scatter(u,I,shp,fill_value):
     """
     Scatter input array according to index mask I.
     """
-    v = ma.masked_array(data=zeros(shp,dtype='float32')+fill_value,
-                        mask=ones(shp,dtype='bool'),
+    n = shp[0]
+    v = ma.masked_array(data=zeros((n,I.size),dtype='float32')+fill_value,
+                        mask=ones((n,I.size),dtype='bool'),
                         fill_value=fill_value)
-    v = v.squeeze()
-    v.data[:,I.squeeze()] = u[:,:]
-    v.mask[:,I.squeeze()] = False
+    v.data[:,I.ravel()] = u[:,:]
+    v.mask[:,I.ravel()] = False
+    
+    return v.reshape((n,)+tuple([ m for m in shp[1:] if m>1 ]))
+
+_SvdIters = 20 # max power iterations for method 'random'
+_EofIters = 4   # ... when streaming (each takes 2 passes)
+_EofCovMax = 2048 # max grid points for method 'cov' when streaming
+
+def _eofField(expr, g, pc, d, u, I, fill_value, offset, scale, nt, shp,
+              metric):
+    """
+    Packs the singular triplets (pc, d, u) of the (nt,npts) matrix
+    of points *I* of grid *g* as returned by GaNum.eof(); *shp* is
+    the (nz,ny,nx) shape of a time step.
+    """
+    nv = len(d)
+
+#   Eigenvalues/coefficients
+#   ------------------------
+    d = d * d / (nt - 1)
+    pc = (nt -1) * pc.transpose()
+
+#   Normalize eigenvectors
+#   ----------------------
+    for i in range(nv):
+        vnorm = _norm(u[i,:])
+        u[i,:] = u[i,:] / vnorm
+        pc[i,:] = pc[i,:] * vnorm
     
-    return v
+    u = _modeField(expr,u,I,fill_value,offset,scale,g,shp,metric)
+    u.nt = nt
+    u.d = d
+
+    return (u, d, pc)
+
+def _modeField(expr, u, I, fill_value, offset, scale, g, shp, metric):
+    """
+    Scatters the (nv,npts) modes *u* at points *I* into a GaField on
+    grid *g*, whose first dimension becomes 'eof'.
+    """
+    nv = u.shape[0]
+
+#   Adjust grid properties, on a copy since g may be shared
+#   -------------------------------------------------------
+    g = g.copy()
+    g.dims[0] = 'eof'
+    g.time = arange(nv)
+    g.eof = arange(nv)
+
+#   Scatter eigenvectors
+#   --------------------
+    g.meta = g.meta[0:nv] 
+    u = _scatter(u,I,(nv,)+tuple(shp),fill_value)
+
+#   Let's make sure "u" is a bonafide GaGield
+#   -----------------------------------------
+    u = GaField(u.data, name=expr, grid=g, mask=u.mask)
+    u.offset = offset.squeeze()
+    u.scale = scale.squeeze()
+    u.metric = metric
+
+#   Note: since GrADS v1 does not know about e-dimensions yet,
+#   we let it think that the EOF dimension is the time dimension
+
+    return u
+
+def _svdCross(A, B, nv, method=None, tol=1e-4, seed=None):
+    """
+    Returns the *nv* leading singular triplets (ua, s, ub) of A^T B,
+    for A (nt,na) and B (nt,nb), without forming it, by *method* 'qr'
+    or 'random' (see GaNum.mca); internal use.
+    """
+    nt, na = A.shape
+    nb = B.shape[1]
+    k = min(nv,nt,na,nb)
+    if method is None:
+        if 2*k >= nt or 4*nt <= min(na,nb):
+            method = 'qr'
+        else:
+            method = 'random'
+
+#   A^T B = Qa Ra Rb^T Qb^T: only the small middle factor is decomposed
+#   -------------------------------------------------------------------
+    if method == 'qr':
+        Qa, Ra = qr(A.T)
+        Qb, Rb = qr(B.T)
+        Ua, s, Vb = svd(dot(Ra,Rb.T))
+        ua = dot(Ua[:,0:k].T,Qa.T)
+        ub = dot(Vb[0:k],Qb.T)
+        return (ua, s[0:k], ub)
+
+#   Randomized range finder on the operator x -> A^T (B x)
+#   ------------------------------------------------------
+    elif method == 'random':
+        l = min(k+10,nt,na,nb)
+        O = RandomState(seed).standard_normal((nb,l)).astype(B.dtype)
+        Q = qr(dot(A.T,dot(B,O)))[0]
+        d0 = None
+        for i in range(_SvdIters):
+            Bt = dot(B.T,dot(A,Q)) # (Q^T A^T B)^T
+            d = sqrt(eigvalsh(dot(Bt.T,Bt).astype(float64)).clip(0.,None))
+            d = d[::-1][0:k]
+            if d0 is not None and (abs(d-d0) <= tol*d).all():
+                break
+            d0 = d
+            Z = qr(Bt)[0]
+            Q = qr(dot(A.T,dot(B,Z)))[0]
+        Ub, s, ub = svd(Bt.T,full_matrices=0)
+        ua = dot(Q,Ub).T
+        return (ua[0:k], s[0:k], ub[0:k])
+
+    else:
+        raise GrADSError, 'Unknown method <%s>'%method
+
+def _eofBasis(V):
+    """
+    Returns (u, I, off, w) for EOFs *V* from GaNum.eof(): the
+    eigenvectors u at the defined points I, and the offset and weight
+    turning fields at those points into the rows eof() decomposed,
+    (a-off)*w.
+    """
+    k = V.shape[0]
+    I = ma.getmaskarray(V).reshape((k,-1))[0]==False
+    u = V.data.reshape((k,-1))[:,I].astype(float64)
+    shp = V.shape[1:]
+    fac = ones(shp,dtype=float64)
+    if V.metric=='area':
+        lat = V.grid.lat.reshape((-1,1))
+        fac = fac * sqrt(cos(pi*lat/180.))
+    off = (ma.filled(V.offset,0.) + zeros(shp)).reshape(-1)[I]
+    scale = (ma.filled(V.scale,1.) + zeros(shp)).reshape(-1)[I]
+    w = fac.reshape(-1)[I]**2 / scale
+    return (u, I, off, w)
+
+def _eofRowsOf(F, I, off, w):
+    """
+    Returns the rows (a-off)*w of field *F* at points *I*, one per
+    time step.
+    """
+    a = asarray(F,dtype=float64).reshape((-1,I.size))
+    return (a[:,I] - off) * w
+
+def _positive(d):
+    """
+    Returns *d* with zeros replaced by infinity, for dividing by it.
+    """
+    d = array(d,dtype=float64)
+    d[d<=0] = inf
+    return d
+
+def _eofCov(rows, nt, npts, k):
+    """
+    The *k* leading singular triplets of the (nt,npts) matrix whose
+    rows are returned, a chunk at a time, by generator rows(): the
+    covariance matrix is accumulated in one pass and the principal
+    components projected out in another.
+    """
+    C = zeros((npts,npts),dtype=float64)
+    for a in rows():
+        C += dot(a.T,a)
+    e, V = eigh(C)
+    i = e.argsort()[::-1][0:k]
+    d = sqrt(e[i].clip(0.,None))
+    u = V[:,i].T.astype(float32)
+    del C, V
+    pc = empty((nt,k),dtype=float64)
+    r = 0
+    for a in rows():
+        pc[r:r+len(a)] = dot(a,u.T)
+        r = r + len(a)
+    nz = d > 0
+    pc[:,nz] = pc[:,nz] / d[nz]
+    return (pc, d, u)
+
+def _eofRandom(rows, nt, npts, k, tol, seed):
+    """
+    As _eofCov(), but with the randomized range finder of method
+    'random' (see _svdModes), each product with the matrix being a
+    pass over the chunks.
+    """
+    l = min(k+10,nt,npts)
+    O = RandomState(seed).standard_normal((npts,l)).astype(float32)
+    Q = qr(concatenate([ dot(a,O) for a in rows() ]))[0]
+    d0 = None
+    for i in range(_EofIters+1):
+        Bt = zeros((npts,l),dtype=float64) # (Q^T A)^T
+        r = 0
+        for a in rows():
+            Bt += dot(a.T,Q[r:r+len(a)].astype(float32))
+            r = r + len(a)
+        d = sqrt(eigvalsh(dot(Bt.T,Bt)).clip(0.,None))[::-1][0:k]
+        if i==_EofIters or (d0 is not None and (abs(d-d0) <= tol*d).all()):
+            break
+        d0 = d
+        Z = qr(Bt)[0].astype(float32)
+        Q = qr(concatenate([ dot(a,Z) for a in rows() ]))[0]
+    pc, d, u = svd(Bt.T,full_matrices=0)
+    pc = dot(Q,pc)
+    return (pc[:,0:k], d[0:k], u[0:k,:].astype(float32))
+
+def _svdModes(A, nv, method=None, tol=1e-4, seed=None):
+    """
+    Returns the *nv* leading singular triplets of A as (pc, d, u), as
+    svd(A,full_matrices=0) trimmed to nv would, by *method* 'svd',
+    'gram' or 'random' (see GaNum.eof); internal use.
+    """
+    nt, n = A.shape
+    k = min(nv,nt,n)
+    if method is None:
+        if 2*k >= min(nt,n):
+            method = 'svd'
+        elif 4*nt <= n:
+            method = 'gram'
+        else:
+            method = 'random'
+
+#   Full SVD
+#   --------
+    if method == 'svd':
+        pc, d, u = svd(A,full_matrices=0)
+        return (pc[:,0:k], d[0:k], u[0:k,:])
+
+#   Snapshot method: eigenvectors of A A^T are the pcs
+#   --------------------------------------------------
+    elif method == 'gram':
+        e, V = eigh(dot(A,A.T).astype(float64))
+        i = e.argsort()[::-1][0:k]
+        d = sqrt(e[i].clip(0.,None))
+        pc = V[:,i]
+        u = dot(pc.T.astype(A.dtype),A)
+        nz = d > 0
+        u[nz] = u[nz] / d[nz,newaxis]
+        return (pc, d, u)
+
+#   Randomized range finder (Halko et al, 2011) with power iterations
+#   -----------------------------------------------------------------
+    elif method == 'random':
+        l = min(k+10,nt,n) # oversampling
+        rs = RandomState(seed)
+        Q = qr(dot(A,rs.standard_normal((n,l)).astype(A.dtype)))[0]
+        d0 = None
+        for i in range(_SvdIters):
+            Q = qr(dot(A,qr(dot(A.T,Q))[0]))[0]
+            B = dot(Q.T,A)
+            d = sqrt(eigvalsh(dot(B,B.T).astype(float64)).clip(0.,None))
+            d = d[::-1][0:k]
+            if d0 is not None and (abs(d-d0) <= tol*d).all():
+                break
+            d0 = d
+        pc, d, u = svd(B,full_matrices=0)
+        pc = dot(Q,pc)
+        return (pc[:,0:k], d[0:k], u[0:k,:])
+
+    else:
+        raise GrADSError, 'Unknown method <%s>'%method
 
 def interpolate(datain,xin,yin,xout,yout,checkbounds=False,masked=False,order=1):
     """
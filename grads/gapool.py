@@ -0,0 +1,258 @@
+#--------------------------------------------------------------------------
+#
+#    Copyright (C) 2006-2008 by Arlindo da Silva <dasilva@opengrads.org>
+#    All Rights Reserved.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation# using version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY# without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program# if not, please consult
+#
+#              http://www.gnu.org/licenses/licenses.html
+#
+#    or write to the Free Software Foundation, Inc., 59 Temple Place,
+#    Suite 330, Boston, MA 02111-1307 USA
+#
+#------------------------------------------------------------------------
+
+"""
+This module implements GaPool, a pool of GrADS client processes. Each
+worker is a separate GrADS process with its own pipes; files opened
+and commands issued through the pool are replayed on every worker, and
+exports are split over time ranges so that the workers run
+concurrently.
+"""
+
+__version__ = '1.0.0'
+
+from threading import Thread
+from types     import StringTypes
+
+from gacore    import GrADSError
+from ganum     import GaNum
+from numtypes  import GaGrid, GaField, _tymeAxis
+
+from numpy     import concatenate, float32
+from numpy.ma  import getmaskarray
+
+class GaPool(object):
+    """
+    A pool of GrADS workers, usually instances of GaNum. The pool
+    keeps all workers with the same open files and dimension
+    environment, so that it can be used much like a single GrADS
+    client object:
+
+        pool = GaPool(8, Echo=False, Window=False)
+        pool.open('model.ctl')
+        pool('set t 1 1000')
+        ts = pool.exp('ts')
+
+    _Methods provided:
+        cmd    - sends a command to all workers
+        open   - opens a file on all workers
+        query  - queries the first worker
+        setdim - sets the dimension environment of all workers
+        exp    - exports an expression splitting the time range
+                 among the workers
+    """
+
+    def __init__ (self, N=None, Worker=GaNum, **kwopts):
+        """
+        Starts *N* GrADS workers; by default as many as there are
+        CPUs on this machine. The workers are instances of class
+        *Worker*; all other keyword options (**kwopts) are passed
+        to its constructor.
+        """
+
+        if N is None:
+            try:
+                from multiprocessing import cpu_count
+                N = cpu_count()
+            except (ImportError, NotImplementedError):
+                N = 1
+        if N < 1:
+            raise GrADSError, 'need at least one worker but got N=%d'%N
+
+        self.workers = [ Worker(**kwopts) for i in range(N) ]
+        self.ga = self.workers[0]   # answers queries
+        self.Files = []             # (fname,ftype) opened so far
+
+    def __len__ (self):
+        return len(self.workers)
+
+#........................................................................
+
+    def cmd (self, gacmd, Quiet=False, **kwopt):
+        """
+        Sends a command to all workers; only the first worker honors
+        *Quiet*, the others are always quiet. Output can be retrieved
+        with methods rline() and rword() as usual.
+        """
+        calls = [ (self.ga.cmd, (gacmd,), dict(kwopt,Quiet=Quiet)) ]
+        for w in self.workers[1:]:
+            calls.append((w.cmd, (gacmd,), dict(kwopt,Quiet=True)))
+        _parallel(calls)
+
+    __call__ = cmd
+
+    def rline (self, i=None):
+        """Returns the ith line of the most recent output of the first worker."""
+        return self.ga.rline(i)
+
+    def rword (self, i, j):
+        """Returns the jth word of the ith line of the most recent output
+        of the first worker."""
+        return self.ga.rword(i,j)
+
+#........................................................................
+
+    def open (self, fname, ftype='default', Quiet=False):
+        """
+        Opens a GrADS file on all workers, returning the file handle
+        of the first one. See GaCore.open() for details.
+        """
+        calls = [ (self.ga.open, (fname,ftype), dict(Quiet=Quiet)) ]
+        for w in self.workers[1:]:
+            calls.append((w.open, (fname,ftype), dict(Quiet=True)))
+        fh = _parallel(calls)[0]
+        self.Files.append((fname,ftype))
+        return fh
+
+    def query (self, what, Quiet=False):
+        """
+        Queries the first worker; see GaCore.query() for details.
+        """
+        return self.ga.query(what,Quiet)
+
+    def setdim (self, dh):
+        """
+        Sets the dimension environment of all workers. On input, *dh*
+        is usually obtained as the output of:
+
+            dh = pool.query('dims')
+        """
+        _parallel([ (w.setdim, (dh,), {}) for w in self.workers ])
+
+#........................................................................
+
+    def exp (self, expr):
+        """
+        Exports GrADS expression *expr*, returning a GrADS Field
+        just like GaNum.exp() does. When the time dimension is
+        varying, the time range is split in contiguous pieces, one
+        per worker, and the pieces are exported concurrently. On
+        output, the GaGrid metadata refers to the full time range.
+        """
+
+#       Only string expressions need any work
+#       -------------------------------------
+        if type(expr) not in StringTypes:
+            return self.ga.exp(expr)
+
+#       Nothing to split: let the first worker handle it
+#       ------------------------------------------------
+        dh = self.ga.query("dims", Quiet=True)
+        if dh.rank<=2 or dh.nt<2 or len(self.workers)<2:
+            return self.ga.exp(expr)
+        if dh.nx==1: raise GrADSError, 'lon must be varying but got nx=1'
+        if dh.ny==1: raise GrADSError, 'lat must be varying but got ny=1'
+
+#       Split the time range among workers
+#       ----------------------------------
+        t1, t2 = dh.ti
+        nw = min(len(self.workers),dh.nt)
+        calls = []
+        for i in range(nw):
+            t1_ = t1 + (i*dh.nt)//nw
+            t2_ = t1 + ((i+1)*dh.nt)//nw - 1
+            calls.append((_exp_slice, (self.workers[i],expr,dh,t1_,t2_), {}))
+        try:
+            Pieces = _parallel(calls)
+        except GrADSError:
+            raise GrADSError, 'could not export <%s>'%expr
+
+#       Stitch the pieces together along the time axis
+#       ----------------------------------------------
+        Data  = concatenate([ p[0] for p in Pieces ])
+        Mask  = concatenate([ p[1] for p in Pieces ])
+        first = Pieces[0][2]
+
+        grid = GaGrid(expr)
+        grid.denv = dh
+        grid.meta = concatenate([ p[3] for p in Pieces ])
+        grid.time = []
+        for p in Pieces:
+            grid.time += list(p[2].time)
+        grid.lev = first.lev
+        grid.lat = first.lat
+        grid.lon = first.lon
+
+#       Remove dimensions with size 1, as in GaNum.exp()
+#       ------------------------------------------------
+        nt, nz, ny, nx = Data.shape
+        if nz==1:
+            Data = Data.reshape(nt,ny,nx)
+            Mask = Mask.reshape(nt,ny,nx)
+            grid.dims = [ 'time', 'lat', 'lon' ]
+            grid.meta = grid.meta.reshape(nt,20)
+        else:
+            grid.dims = [ 'time', 'lev', 'lat', 'lon' ]
+
+        grid.tyme = _tymeAxis(grid.time,grid.Datetime64)
+
+        return GaField(Data, name=expr, grid=grid, mask=Mask, dtype=float32)
+
+#.....................................................................
+
+def _exp_slice(ga, expr, dh, t1, t2):
+    """
+    Exports *expr* for times t1 through t2 on worker *ga*, returning
+    4D data and mask arrays, the grid and a 3D meta array.
+    """
+    ga.setdim(dh)
+    ga.cmd('set t %d %d'%(t1,t2),Quiet=True)
+    try:
+        F = ga.exp(expr)
+    finally:
+        ga.setdim(dh)
+    nt, nz = (t2-t1+1, dh.nz)
+    ny, nx = F.shape[-2:]
+    return (F.data.reshape(nt,nz,ny,nx),
+            getmaskarray(F).reshape(nt,nz,ny,nx),
+            F.grid,
+            F.grid.meta.reshape(nt,nz,20))
+
+def _parallel(calls):
+    """
+    Runs each (func,args,kwargs) in *calls* on its own thread, returning
+    the list of results. The first exception raised, if any, is
+    re-raised after all threads are done.
+    """
+    if len(calls)==1:
+        func, args, kwargs = calls[0]
+        return [ func(*args,**kwargs) ]
+
+    results = [ None ] * len(calls)
+    errors  = [ None ] * len(calls)
+    def run(i, func, args, kwargs):
+        try:
+            results[i] = func(*args,**kwargs)
+        except Exception, e:
+            errors[i] = e
+
+    threads = [ Thread(target=run, args=(i,)+tuple(calls[i]))
+                for i in range(len(calls)) ]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    for e in errors:
+        if e is not None:
+            raise e
+    return results
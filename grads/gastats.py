@@ -0,0 +1,201 @@
+#--------------------------------------------------------------------------
+#
+#    Copyright (C) 2006-2008 by Arlindo da Silva <dasilva@opengrads.org>
+#    All Rights Reserved.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation# using version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY# without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program# if not, please consult
+#
+#              http://www.gnu.org/licenses/licenses.html
+#
+#    or write to the Free Software Foundation, Inc., 59 Temple Place,
+#    Suite 330, Boston, MA 02111-1307 USA
+#
+#------------------------------------------------------------------------
+
+"""
+This module implements GaStats, a collector of per-command statistics
+for the GrADS client classes: number of commands, wall clock time,
+lines of output and bytes of binary data exchanged, all broken down
+by command verb. Statistics are only collected when the client is
+created with Stats=True.
+"""
+
+__version__ = '1.0.0'
+
+from math     import log
+from time     import time
+from gahandle import GaHandle
+
+#   Latency histogram: 4 buckets per octave starting at 1 microsecond
+#   -----------------------------------------------------------------
+_TMIN     = 1e-6
+_PEROCT   = 4
+_NBUCKETS = 128   # up to about 4 hours
+
+#   Verb aliases
+#   ------------
+_Aliases = { 'q':'query', 'd':'display', 'c':'clear' }
+
+class _Verb(object):
+    """
+    Statistics for a single verb, internal use.
+    """
+    __slots__ = ( 'count', 'errors', 'time', 'tmin', 'tmax', 'parse',
+                  'lines', 'bytes', 'hist' )
+    def __init__(self):
+        self.count  = 0
+        self.errors = 0
+        self.time   = 0.
+        self.tmin   = None
+        self.tmax   = 0.
+        self.parse  = 0.
+        self.lines  = 0
+        self.bytes  = 0
+        self.hist   = [ 0 ] * _NBUCKETS
+
+    def percentile(self, p):
+        """
+        Returns an upper bound for the *p*-th percentile of the wall
+        clock time, based on the histogram.
+        """
+        if self.count == 0: return 0.
+        n = p * self.count / 100.
+        cum = 0
+        for i in range(_NBUCKETS):
+            cum = cum + self.hist[i]
+            if cum >= n: break
+        return min(_TMIN * 2.**(float(i+1)/_PEROCT), self.tmax)
+
+class GaStats(object):
+    """
+    Collects statistics about GrADS commands. Usually created by the
+    client when Stats=True, e.g.,
+
+        ga = GrADS(Stats=True)
+        ...
+        sh = ga.stats()
+        print sh.verbs['display'].p90
+
+    The same GaStats object may be shared by several clients.
+    """
+
+    def __init__ (self):
+        self.reset()
+
+    def reset (self):
+        """Discards all statistics collected so far."""
+        self._verbs = {}
+        self.since = time()
+
+    def add (self, gacmd, secs, lines=0, nbytes=0, rc=0):
+        """
+        Records GrADS command *gacmd* that took *secs* seconds,
+        produced *lines* lines of output, exchanged *nbytes* bytes of
+        binary data and returned *rc*.
+        """
+        v = self._get(_verb(gacmd))
+        v.count = v.count + 1
+        if rc: v.errors = v.errors + 1
+        v.time = v.time + secs
+        if v.tmin is None or secs < v.tmin: v.tmin = secs
+        if secs > v.tmax: v.tmax = secs
+        v.lines = v.lines + lines
+        v.bytes = v.bytes + nbytes
+        if secs > _TMIN:
+            i = int(_PEROCT * log(secs/_TMIN) / log(2.))
+            v.hist[min(i,_NBUCKETS-1)] += 1
+        else:
+            v.hist[0] += 1
+
+    def addParse (self, gacmd, secs):
+        """
+        Records *secs* seconds spent in Python parsing the output of
+        GrADS command *gacmd*.
+        """
+        v = self._get(_verb(gacmd))
+        v.parse = v.parse + secs
+
+    def handle (self):
+        """
+        Returns a GaHandle with the statistics collected so far:
+
+           elapsed  - seconds since the statistics were reset
+           count    - total number of commands
+           time     - total wall clock time in GrADS commands
+           bytes    - total bytes of binary data exchanged
+           verbs    - dictionary with a GaHandle for each verb, with
+                      attributes count, errors, time, mean, min, max,
+                      p50, p90, p99 (wall clock time in seconds), parse
+                      (time spent parsing output), lines and bytes.
+        """
+        sh = GaHandle('stats')
+        sh.elapsed = time() - self.since
+        sh.count = sh.bytes = 0
+        sh.time = 0.
+        sh.verbs = {}
+        for name, v in self._verbs.items():
+            vh = GaHandle(name)
+            vh.count  = v.count
+            vh.errors = v.errors
+            vh.time   = v.time
+            vh.mean   = v.time / max(v.count,1)
+            vh.min    = v.tmin or 0.
+            vh.max    = v.tmax
+            vh.p50    = v.percentile(50)
+            vh.p90    = v.percentile(90)
+            vh.p99    = v.percentile(99)
+            vh.parse  = v.parse
+            vh.lines  = v.lines
+            vh.bytes  = v.bytes
+            sh.verbs[name] = vh
+            sh.count = sh.count + v.count
+            sh.time  = sh.time + v.time
+            sh.bytes = sh.bytes + v.bytes
+        return sh
+
+    def __str__ (self):
+        """A table with the statistics, slowest verbs first."""
+        sh = self.handle()
+        out = [ '%-12s %7s %10s %10s %10s %10s %10s %12s'%\
+                ('verb','count','total(s)','mean(ms)','p50(ms)',
+                 'p99(ms)','parse(ms)','bytes') ]
+        verbs = sh.verbs.values()
+        verbs.sort(lambda a, b: cmp(b.time,a.time))
+        for v in verbs:
+            out.append('%-12s %7d %10.3f %10.3f %10.3f %10.3f %10.3f %12d'%\
+                       (v.name,v.count,v.time,1e3*v.mean,1e3*v.p50,
+                        1e3*v.p99,1e3*v.parse,v.bytes))
+        return '\n'.join(out)
+
+    def _get (self, name):
+        v = self._verbs.get(name)
+        if v is None:
+            v = self._verbs[name] = _Verb()
+        return v
+
+#.....................................................................
+
+def _verb(gacmd):
+    """
+    Returns the verb statistics are recorded under for *gacmd*; IPC
+    transfers are recorded as "ipc_save" and "ipc_load".
+    """
+    words = gacmd.split(None,1)
+    if len(words) == 0: return ''
+    verb = words[0].lower()
+    verb = _Aliases.get(verb,verb)
+    if verb in ('define','ipc_define') and len(words) > 1:
+        rhs = words[1].lower()
+        if   rhs.find('ipc_save(') >= 0: verb = 'ipc_save'
+        elif rhs.find('ipc_load(') >= 0: verb = 'ipc_load'
+    return verb
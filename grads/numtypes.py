@@ -29,18 +29,87 @@ This module defines GrADS specific types by subclassing numpy.ma.MaskedArray.
 __version__ = '1.1.0'
 
 from copy      import deepcopy
-from numpy     import ma, array
+from weakref   import WeakValueDictionary
+from numpy     import ma, array, asarray, unique, empty
 from gahandle  import GaHandle
+from gacore    import gat2dt as _gat2dt
 
 from datetime  import datetime
 
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5  # Python 2.4
+
+#  Interned coordinates
+#  --------------------
+_Interned = WeakValueDictionary()
+
+def _intern(a):
+    """
+    Returns a read-only array equal to *a*, shared with any other
+    grid holding the same values; internal use.
+    """
+    if a is None:
+        return None
+    a = asarray(a)
+    if a.dtype.hasobject: # e.g., datetime objects
+        key = md5('\n'.join([ repr(x) for x in a.flat ])).digest()
+    else:
+        key = md5(a.tostring()).digest()
+    key = (a.dtype.str, a.shape, key)
+    try:
+        return _Interned[key]
+    except KeyError:
+        pass
+    a = a.copy() # do not freeze the caller's array
+    a.flags.writeable = False
+    _Interned[key] = a
+    return a
+
+def _coord(name):
+    """
+    Property for coordinate *name*, stored interned; internal use.
+    """
+    slot = '_' + name
+    def get(self):
+        return getattr(self,slot)
+    def set(self,value):
+        setattr(self,slot,_intern(value))
+    return property(get,set)
+
 class GaGrid(object):
     """
     A simple class for holding GrADS coordinate variables as well as
     dimension environment information and other necessary metadata for
     exchanging information with GrADS. A GaGrid object is usually
     attached to a GaField object.
+
+    Attribute *tyme* holds the time axis as an array of datetime
+    objects; set GaGrid.Datetime64 = True to have grids created from
+    then on carry a NumPy datetime64[m] array instead.
+
+    Grids are shared by reference between a GaField and its views and
+    the results of arithmetic on it, while GaField.copy() also copies
+    the grid; use copy() to get a grid to modify.
+
+    The arrays *meta*, *lev*, *lat*, *lon* and *tyme* are read-only
+    and shared among all grids with the same values, e.g., fields
+    exported from the same file and dimension environment. To change
+    them, assign a new array rather than modifying them in place.
     """
+
+    __slots__ = ( 'name', 'denv', 'dims', 'time', 'eof', 'dst',
+                  '_meta', '_tyme', '_lev', '_lat', '_lon' )
+
+    Datetime64 = False
+
+    meta = _coord('meta')
+    tyme = _coord('tyme')
+    lev  = _coord('lev')
+    lat  = _coord('lat')
+    lon  = _coord('lon')
+
     def __init__ (self, name, coords=None):
         """
         Creates an empty GaGrid object, or builds it from the GaHandle
@@ -51,6 +120,8 @@ class GaGrid(object):
         
         """
         self.name = name
+        self.eof = None
+        self.dst = None
         if coords==None:
             self.meta = None
             self.denv = None
@@ -65,22 +136,35 @@ class GaGrid(object):
             self.denv = coords.denv
             self.dims = coords.dims
             self.time = coords.time
-            self.tyme = array([_gat2dt(t) for t in coords.time])
+            self.tyme = _tymeAxis(coords.time,self.Datetime64)
             self.lev  = array(coords.lev)
             self.lat  = array(coords.lat)
             self.lon  = array(coords.lon)
         else:
             raise TypeError, "coords must be a GaHandle object"
 
+    def __getstate__(self):
+        return dict([ (a,getattr(self,a)) for a in self.__slots__ ])
+
+    def __setstate__(self, state):
+        for a in self.__slots__:
+            if a[0] == '_':
+                setattr(self,a[1:],state[a]) # re-intern
+            else:
+                setattr(self,a,state[a])
+
     def copy(self):
         """
-        Returns a deep copy of GaGrid object.
+        Returns a copy of GaGrid object. The read-only coordinate
+        arrays are shared with the original; everything else is
+        copied.
         """
         g = GaGrid(self.name)
-        for a in self.__dict__:
-            v = self.__dict__[a]
-            if v is not None:
-                g.__dict__[a] = deepcopy(v)
+        for a in self.__slots__:
+            v = getattr(self,a)
+            if a[0] != '_' and v is not None:
+                v = deepcopy(v)
+            setattr(g,a,v)
         return g
 
 class GaField (ma.MaskedArray):
@@ -118,96 +202,86 @@ class GaField (ma.MaskedArray):
 
     """
 
-    def __new__(self, data, name=None, grid=None, **kwargs):
-        self.name = name
-        self.grid = GaGrid(name)
-        return ma.MaskedArray.__new__(self,data, **kwargs)
-
-    def __init__(self, data, name=None, grid=None, **kwargs):
+    def __new__(cls, data, name=None, grid=None, **kwargs):
         """
         Creates a GaField object, an extesion of MaskedArray with
         grid information attached.
         """
-        ma.MaskedArray.__init__(self,data, **kwargs)
+        self = ma.MaskedArray.__new__(cls, data, **kwargs)
         self.name = name
-        if grid==None:
-            self.grid = GaGrid(name)
-        else:
-            self.grid = grid
+        self._grid = grid
+        return self
+
+    def _update_from(self, obj):
+        """
+        Propagates name and grid to views and to the results of
+        operations on a GaField; the grid is shared, not copied.
+        """
+        ma.MaskedArray._update_from(self, obj)
+        if isinstance(obj, GaField):
+            self.__dict__['name'] = obj.name
+            self.__dict__['_grid'] = obj._grid
+        elif 'name' not in self.__dict__:
+            self.__dict__['name'] = None
+            self.__dict__['_grid'] = None
+
+    def _getgrid(self):
+        if self._grid is None: # created on first use
+            self._grid = GaGrid(self.name)
+        return self._grid
+
+    def _setgrid(self, grid):
+        self._grid = grid
+
+    grid = property(_getgrid, _setgrid)
 
     def copy ( self ):
         """
-        Returns a copy of a GaField.
+        Returns a copy of a GaField, with its own copy of the grid.
+        The read-only coordinate arrays of the grid are still shared,
+        so this is cheap.
         """
-        return GaField(self.data.copy(),
-                       name=self.name[:],
-                       mask=self.mask.copy(),
-                       grid=self.grid.copy())
-
-#   Use closure to overload most operations
-#   ---------------------------------------
-    def ga_ops ( op ):
-        def wrapper(self,*args,**kwargs):
-            return GaField(op(self,*args,**kwargs),
-                           name=self.name,grid=self.grid)
-        return wrapper
-
-    __int__ = ga_ops(ma.MaskedArray.__int__)
-    __ror__ = ga_ops(ma.MaskedArray.__ror__)
-#   __repr__ = ga_ops(ma.MaskedArray.__repr__)
-    __rsub__ = ga_ops(ma.MaskedArray.__rsub__)
-    __rdiv__ = ga_ops(ma.MaskedArray.__rdiv__)
-    __rmul__ = ga_ops(ma.MaskedArray.__rmul__)
-    __rmod__ = ga_ops(ma.MaskedArray.__rmod__)
-    __rshift__ = ga_ops(ma.MaskedArray.__rshift__)
-    __abs__ = ga_ops(ma.MaskedArray.__abs__)
-    __rfloordiv__ = ga_ops(ma.MaskedArray.__rfloordiv__)
-    __isub__ = ga_ops(ma.MaskedArray.__isub__)
-    __div__ = ga_ops(ma.MaskedArray.__div__)
-    __pow__ = ga_ops(ma.MaskedArray.__pow__)
-    __lshift__ = ga_ops(ma.MaskedArray.__lshift__)
-    __gt__ = ga_ops(ma.MaskedArray.__gt__)
-    __radd__ = ga_ops(ma.MaskedArray.__radd__)
-    __eq__ = ga_ops(ma.MaskedArray.__eq__)
-    __rxor__ = ga_ops(ma.MaskedArray.__rxor__)
-    __array__ = ga_ops(ma.MaskedArray.__array__)
-    __mod__ = ga_ops(ma.MaskedArray.__mod__)
-    __neg__ = ga_ops(ma.MaskedArray.__neg__)
-    __iadd__ = ga_ops(ma.MaskedArray.__iadd__)
-    __le__ = ga_ops(ma.MaskedArray.__le__)
-    __floordiv__ = ga_ops(ma.MaskedArray.__floordiv__)
-    __sub__ = ga_ops(ma.MaskedArray.__sub__)
-    __ge__ = ga_ops(ma.MaskedArray.__ge__)
-    __rtruediv__ = ga_ops(ma.MaskedArray.__rtruediv__)
-    __and__ = ga_ops(ma.MaskedArray.__and__)
-    __truediv__ = ga_ops(ma.MaskedArray.__truediv__)
-    __lt__ = ga_ops(ma.MaskedArray.__lt__)
-    __rand__ = ga_ops(ma.MaskedArray.__rand__)
-    __float__ = ga_ops(ma.MaskedArray.__float__)
-    __ne__ = ga_ops(ma.MaskedArray.__ne__)
-    __idiv__ = ga_ops(ma.MaskedArray.__idiv__)
-    __add__ = ga_ops(ma.MaskedArray.__add__)
-    __imul__ = ga_ops(ma.MaskedArray.__imul__)
-    __xor__ = ga_ops(ma.MaskedArray.__xor__)
-    __mul__ = ga_ops(ma.MaskedArray.__mul__)
-#  __sqrt__ = ga_ops(ma.MaskedArray.__sqrt__)
-    __or__ = ga_ops(ma.MaskedArray.__or__)
-    ravel = ga_ops(ma.MaskedArray.ravel)
+        F = ma.MaskedArray.copy(self)
+        if self._grid is not None:
+            F._grid = self._grid.copy()
+        return F
 
 __Months__ = ['JAN','FEB','MAR','APR','MAY','JUN','JUL','AUG','SEP','OCT','NOV','DEC']
 
-def _gat2dt(gat):
+def gat2dt64(gats):
     """
-    Convert grads time to datetime.
+    Converts a sequence of GrADS times, e.g., ['00Z01JAN1987', ...],
+    into a NumPy datetime64[m] array. Each distinct time string is
+    parsed only once.
     """
-    time, date = gat.upper().split('Z')
-    if time.count(':') > 0:
-        h, m = time.split(":")
-    else:
-        h = time
-        m = '0'
-    mmm = date[-7:-4]
-    dd, yy = date.split(mmm)
-    mm = __Months__.index(mmm) + 1
-    dt = datetime(int(yy),int(mm),int(dd),int(h),int(m))
-    return dt
+    gats = asarray(gats)
+    if gats.size == 0:
+        return empty(gats.shape,dtype='datetime64[m]')
+    u, i = unique(gats.ravel(),return_inverse=True)
+    u = array([ _gat2dt(g) for g in u ],dtype='datetime64[m]')
+    return u[i].reshape(gats.shape)
+
+def dt642gat(tymes):
+    """
+    Converts an array of times (datetime64, or datetime objects) into
+    an array of GrADS times, as returned by dt2gat().
+    """
+    t = asarray(tymes).astype('datetime64[m]')
+    Y, M, D = [ t.astype('datetime64[%s]'%u) for u in 'YMD' ]
+    year = Y.astype(int) + 1970
+    month = (M - Y).astype(int)
+    day = (D - M).astype(int) + 1
+    minute = (t - D).astype(int)
+    gats = [ '%d:%dZ%d%s%d'%(minute[i]//60,minute[i]%60,day[i],
+                            __Months__[month[i]],year[i])
+             for i in range(t.size) ]
+    return array(gats).reshape(t.shape)
+
+def _tymeAxis(gats, datetime64=False):
+    """
+    Time axis for GrADS times *gats*: an array of datetime objects, or
+    a datetime64[m] array if *datetime64* is True; internal use.
+    """
+    t = gat2dt64(gats)
+    if datetime64: return t
+    return t.astype(object)
@@ -9,8 +9,17 @@ import sys
 sys.path.insert(0,'..')
 sys.path.insert(0,'lib')
 
+import atexit
+import shutil
+import tempfile
 import unittest
-from grads import GrADS
+from grads import GrADS, GrADSError, GaMetaCache, GaCapsCache
+from grads.gahandle import GaHandle
+
+# Keep the capabilities cache of the clients below out of ~/.pygrads
+# -------------------------------------------------------------------
+os.environ['PYGRADS_DIR'] = tempfile.mkdtemp(prefix='pygrads')
+atexit.register(shutil.rmtree,os.environ['PYGRADS_DIR'],True)
 
 class TestModelFile(unittest.TestCase):
 
@@ -39,6 +48,43 @@ class TestModelFile(unittest.TestCase):
         self.assertEqual(vars.sort(),vars2.sort())
         self.assertEqual(var_levs.sort(),var_levs2.sort())
 
+    def test_01_Cache(self):
+        """
+        Opens the same file twice with a metadata cache.
+        """
+        cache = GaMetaCache(Dir=False)
+        ga = GrADS(Bin=self.bin, Echo=False, Window=False, Cache=cache)
+        fh1 = ga.open(self.fname)
+        fh2 = ga.open(self.fname)
+        if cache.hits == 0:
+            return # not a cacheable file, e.g., a URL
+        self.assertEqual(fh2.fid,fh1.fid+1)
+        for att in ( 'bin', 'nx', 'ny', 'nz', 'nt', 'vars', 'undef' ):
+            self.assertEqual(getattr(fh1,att),getattr(fh2,att))
+
+    def test_01_CacheStale(self):
+        """
+        Checks that a cached entry is dropped once the descriptor or
+        data file is touched.
+        """
+        cache = GaMetaCache(Dir=False)
+        ga = GrADS(Bin=self.bin, Echo=False, Window=False, Cache=cache)
+        fh = ga.open(self.fname)
+        ga.open(self.fname)
+        if cache.hits == 0:
+            return # not a cacheable file, e.g., a URL
+        for path in ( self.fname, fh.bin ):
+            if not os.path.isfile(path): continue
+            st = os.stat(path)
+            try:
+                os.utime(path,(st.st_atime,st.st_mtime+60))
+                misses = cache.misses
+                ga.open(self.fname)
+                self.assertEqual(cache.misses,misses+1)
+                ga.open(self.fname)
+                self.assertEqual(cache.misses,misses+1)
+            finally:
+                os.utime(path,(st.st_atime,st.st_mtime))
 
     def test_02_Execs(self):
         """
@@ -47,6 +93,445 @@ class TestModelFile(unittest.TestCase):
         self.ga("exec Exec.ga")
         self.ga("exec Exec_dos.ga")
 
+    def test_02_Pipe(self):
+        """
+        Sends several commands at once and checks per-command output.
+        """
+        hs = self.ga.cmd("set t 2\nset z 3\nq dims",Pipe=True)
+        self.assertEqual(len(hs),3)
+        self.assertEqual([h.rc for h in hs],[0,0,0])
+        self.assertEqual(hs[2].Words[4][8],'3')
+        self.assertEqual(self.ga.rword(4,9),'3')
+        self.assertRaises(GrADSError,self.ga.cmd,
+                          "set t 1\nno_such_command\nset t 3",Pipe=True)
+
+    def test_02_Shadow(self):
+        """
+        Checks the shadow dimension environment against GrADS.
+        """
+        atts = ( 'x', 'y', 'z', 't', 'lon', 'lat', 'lev', 'time',
+                 'rank', 'nx', 'ny', 'nz', 'nt' )
+        ga = GrADS(Bin=self.bin, Echo=False, Window=False, Shadow=False)
+        ga.open(self.fname)
+
+#       Reference "q dims" output of GrADS 2 for the model file, one
+#       line changed by each command, starting from the state right
+#       after open (except for x, which GrADS wraps to 0 to 360)
+#       ------------------------------------------------------------
+        lines = [ '<IPC> q dims',
+                  'Default file number is: 1 ',
+                  'X is varying   Lon = 0 to 45   X = 1 to 10',
+                  'Y is varying   Lat = -90 to 90   Y = 1 to 46',
+                  'Z is fixed     Lev = 1000  Z = 1',
+                  'T is fixed     Time = 00Z01JAN1987  T = 1',
+                  'E is fixed     Ens = 1  E = 1' ]
+        ref = (
+          ('set x 1 10', 'X is varying   Lon = 0 to 45   X = 1 to 10'),
+          ('set lon -180 180',
+                         'X is varying   Lon = -180 to 180   X = -35 to 37'),
+          ('set lon 0 360', 'X is varying   Lon = 0 to 360   X = 1 to 73'),
+          ('set lat 0 30', 'Y is varying   Lat = 0 to 30   Y = 23.5 to 31'),
+          ('set z 2 5',  'Z is varying   Lev = 850 to 300   Z = 2 to 5'),
+          ('set lev 500', 'Z is fixed     Lev = 500  Z = 4'),
+          ('set z 1 7',  'Z is varying   Lev = 1000 to 100   Z = 1 to 7'),
+          ('set time 00Z02JAN1987 00Z04JAN1987',
+           'T is varying   Time = 00Z02JAN1987 to 00Z04JAN1987   T = 2 to 4'),
+          ('set t 5',    'T is fixed     Time = 00Z05JAN1987  T = 5'),
+          ('set y 2.5 10.5',
+                         'Y is varying   Lat = -84 to -52   Y = 2.5 to 10.5'),
+          )
+        for cmd, line in ref:
+            lines['XYZTE'.index(line[0])+2] = line
+            self.ga(cmd)
+            ga(cmd)
+            dh1 = self.ga.query('dims')
+            dh2 = ga.query('dims')
+            ga.Lines = lines + [ '' ]
+            ga.Words = [ l.split() for l in ga.Lines ]
+            dh3 = ga._parseQuery('dims',GaHandle('dims'))
+            for att in atts:
+                self.assertEqual(getattr(dh1,att),getattr(dh3,att))
+                self.assertEqual(getattr(dh2,att),getattr(dh3,att))
+
+    def test_02_Stats(self):
+        """
+        Checks the per-verb command statistics.
+        """
+        ga = GrADS(Bin=self.bin, Echo=False, Window=False, Stats=True)
+        ga.open(self.fname)
+        ga.stats(reset=True)
+        ga('set t 1 5')
+        ga('set z 1')
+        ga('q time')
+        sh = ga.stats()
+        self.assertEqual(sh.count,3)
+        self.assertEqual(sh.verbs['set'].count,2)
+        self.assertEqual(sh.verbs['query'].count,1)
+        self.assertTrue(sh.verbs['set'].p99>=sh.verbs['set'].p50)
+        self.assertRaises(GrADSError,self.ga.stats)
+
+    def test_02_Async(self):
+        """
+        Runs the same export on two asynchronous clients at once.
+        """
+        from grads import gaasync
+        if not gaasync.HAS_NUMPY:
+            return
+        def job(ga):
+            yield ga.start()
+            yield ga.open(self.fname)
+            yield ga.cmd('set t 1 5')
+            ts = yield ga.exp('ts')
+            raise gaasync.Return(ts)
+        gas = [ gaasync.AsyncGaNum(Bin=self.bin, Echo=False, Window=False)
+                for i in range(2) ]
+        ts1, ts2 = gaasync.run(*[ job(ga) for ga in gas ])
+        self.ga('set t 1 5')
+        ts = self.ga.exp('ts')
+        self.assertEqual(ts.shape,ts1.shape)
+        self.assertEqual(abs(ts-ts1).max(),0.)
+        self.assertEqual(abs(ts-ts2).max(),0.)
+
+#       Failed exports restore the dimensions; other types pass through
+#       ---------------------------------------------------------------
+        def fail(ga):
+            yield ga.start()
+            yield ga.open(self.fname)
+            yield ga.cmd('set t 1 5\nset z 1 2')
+            try:
+                yield ga.exp('no_such_var')
+            except GrADSError:
+                pass
+            dh = yield ga.query('dims')
+            F = yield ga.exp(ts)
+            try:
+                yield ga.exp(1)
+            except GrADSError:
+                pass
+            raise gaasync.Return((dh,F))
+        ga = gaasync.AsyncGaNum(Bin=self.bin, Echo=False, Window=False,
+                                Stats=True)
+        dh, F = gaasync.run(fail(ga))[0]
+        self.assertEqual((dh.t,dh.z),((1,5),(1,2)))
+        self.assertTrue(F is ts)
+        self.assertEqual(ga.stats().verbs['ipc_save'].count,1)
+
+    def test_02_Caps(self):
+        """
+        Starts GrADS twice, the second time without querying its
+        capabilities.
+        """
+        caps = GaCapsCache(Dir=False)
+        ga1 = GrADS(Bin=self.bin, Echo=False, Window=False, Caps=caps)
+        ga2 = GrADS(Bin=self.bin, Echo=False, Window=False, Caps=caps,
+                    Stats=True)
+        self.assertEqual((caps.misses,caps.hits),(1,1))
+        self.assertEqual(ga2.stats().count,0)
+        for att in ( 'Version', 'byteorder', 'HAS_UDXT', 'HAS_IPC' ):
+            self.assertEqual(getattr(ga1,att,None),getattr(ga2,att,None))
+
+    def test_02_Shm(self):
+        """
+        Exchanges data through shared memory files instead of the pipes.
+        """
+        if not self.ga.HAS_IPC:
+            return
+        ga = GrADS(Bin=self.bin, Echo=False, Window=False, Shm=True)
+        ga.open(self.fname)
+        for g in ( self.ga, ga ):
+            g('set z 1 7')
+        ta = self.ga.exp('ta')
+        ta1 = ga.exp('ta')
+        self.assertEqual(ta.shape,ta1.shape)
+        self.assertEqual(abs(ta-ta1).max(),0.)
+        ga.imp('ta1',ta1)
+        ta2 = ga.exp('ta1')
+        self.assertEqual(abs(ta-ta2).max(),0.)
+
+    def test_02_Bulk(self):
+        """
+        Exports a 4D field with and without pipelining the slices.
+        """
+        if not self.ga.HAS_IPC:
+            return
+        self.ga('set z 1 7')
+        self.ga('set t 1 5')
+        ta1 = self.ga.exp('ta')
+        ta2 = self.ga.exp('ta',Bulk=False)
+        self.assertEqual(ta1.shape,ta2.shape)
+        self.assertEqual(abs(ta1-ta2).max(),0.)
+        self.assertEqual(ta1.grid.time,ta2.grid.time)
+        self.assertEqual(list(ta1.grid.lev),list(ta2.grid.lev))
+        dh = self.ga.query('dims')
+        self.assertEqual((list(dh.z),list(dh.t)),([1,7],[1,5]))
+        self.ga.PipeDepth = 2
+        ta3 = self.ga.exp('ta')
+        self.assertEqual(abs(ta1-ta3).max(),0.)
+        self.ga('set z 1')
+        self.ga('set t 1')
+        self.assertRaises(GrADSError,self.ga.exp,'no_such_var')
+        self.assertEqual(self.ga.exp('ts').shape,ta1.shape[2:])
+
+    def test_02_Iexp(self):
+        """
+        Exports a 4D field a few time steps at a time.
+        """
+        if not self.ga.HAS_IPC:
+            return
+        from numpy import concatenate
+        self.ga('set z 1 7')
+        self.ga('set t 1 5')
+        ta = self.ga.exp('ta')
+        chunks = list(self.ga.iexp('ta',Chunk=2))
+        self.assertEqual([ c.shape[0] for c in chunks ],[2,2,1])
+        self.assertEqual(chunks[1].grid.time,ta.grid.time[2:4])
+        self.assertEqual(abs(concatenate(chunks)-ta).max(),0.)
+        for c in self.ga.iexp('ta',Dim='lev'):
+            break
+        self.assertEqual(c.shape,(5,1)+ta.shape[2:])
+        self.assertEqual(c.grid.dims,ta.grid.dims)
+        dh = self.ga.query('dims')
+        self.assertEqual((list(dh.z),list(dh.t)),([1,7],[1,5]))
+
+    def test_02_Lazy(self):
+        """
+        Slices and reduces a field which is exported on demand.
+        """
+        if not self.ga.HAS_IPC:
+            return
+        from grads import LazyGaField
+        self.ga('set z 1 7')
+        self.ga('set t 1 5')
+        ta = self.ga.exp('ta')
+        L = LazyGaField(self.ga,'ta',Chunk=2)
+        self.assertEqual(L.shape,ta.shape)
+        self.ga('set t 3')
+        for key in ( (slice(1,3),slice(None),slice(10,20),slice(30,40)),
+                     (slice(None,None,-2),0,slice(5,9,3)), (2,3,4,5) ):
+            F = L[key]
+            self.assertEqual(F.shape,ta[key].shape)
+            self.assertEqual(abs(F-ta[key]).max(),0.)
+        self.assertEqual(F.grid.time,[ta.grid.time[2]])
+        self.assertEqual(L.max(axis=0).shape,ta.shape[1:])
+        self.assertEqual(abs(L.max(axis=0)-ta.max(axis=0)).max(),0.)
+        self.assertTrue(abs(L.mean()-ta.mean())<1e-3)
+        self.assertEqual(list(self.ga.query('dims').t),[3,3])
+
+    def test_02_EofMethods(self):
+        """
+        Compares the leading EOFs from the truncated SVD methods
+        with those from the full SVD.
+        """
+        self.ga('set y 2 45')
+        self.ga('set t 1 5')
+        V0, d0, c0 = self.ga.eof('ts',keep=2,method='svd')
+        for method in ( 'gram', 'random' ):
+            V, d, c = self.ga.eof('ts',keep=2,method=method,seed=1)
+            self.assertEqual(V.shape,V0.shape)
+            self.assertTrue(abs(d-d0).max()<1e-4*d0[0])
+            for i in range(2):
+                s = (V[i]*V0[i]).sum() > 0 and 1. or -1.
+                self.assertTrue(abs(V[i]-s*V0[i]).max()<1e-4)
+                self.assertTrue(abs(c[i]-s*c0[i]).max()<1e-3*abs(c0).max())
+
+    def test_02_EofChunk(self):
+        """
+        Compares out-of-core EOFs with those from the whole field.
+        """
+        self.ga('set x 1 20')
+        self.ga('set y 2 45')
+        self.ga('set t 1 5')
+        V0, d0, c0 = self.ga.eof('ts',transf='z-score',keep=2)
+        for method in ( 'cov', 'random' ):
+            V, d, c = self.ga.eof('ts',transf='z-score',keep=2,
+                                  method=method,seed=1,chunk=2)
+            self.assertEqual(V.shape,V0.shape)
+            self.assertTrue(abs(d-d0).max()<1e-4*d0[0])
+            self.assertTrue(abs(V.offset-V0.offset).max()<1e-3)
+            self.assertTrue(abs(V.scale-V0.scale).max()<1e-3)
+            for i in range(2):
+                s = (V[i]*V0[i]).sum() > 0 and 1. or -1.
+                self.assertTrue(abs(V[i]-s*V0[i]).max()<1e-4)
+                self.assertTrue(abs(c[i]-s*c0[i]).max()<1e-3*abs(c0).max())
+            g, g0 = (V.grid, V0.grid)
+            self.assertEqual(g.dims,g0.dims)
+            self.assertEqual(list(g.time),list(g0.time))
+            self.assertEqual(list(g.tyme),list(g0.tyme))
+            self.assertEqual((g.denv.t,g.denv.time),(g0.denv.t,g0.denv.time))
+        self.assertEqual(list(self.ga.query('dims').t),[1,5])
+
+    def test_02_EofProj(self):
+        """
+        Projects on, and updates, existing EOFs.
+        """
+        self.ga('set y 2 45')
+        self.ga('set t 1 5')
+        V, d, c = self.ga.eof('ts',keep=2)
+        self.ga('set t 5')
+        c5 = self.ga.eof_proj(V,'ts')
+        self.assertEqual(c5.shape,(2,1))
+        self.assertTrue(abs(c5[:,0]-c[:,4]).max()<1e-4*abs(c).max())
+        self.ga('set t 1 5')
+        V5, d5, c5 = self.ga.eof('ts',transf=None,keep=2)
+        self.ga('set t 1 4')
+        V4, d4, c4 = self.ga.eof('ts',transf=None,keep=4)
+        self.ga('set t 5')
+        U, dU = self.ga.eof_update(V4,'ts')
+        self.assertEqual((U.shape,U.nt),(V4.shape,5))
+        self.assertTrue(abs(dU[0:2]-d5).max()<1e-4*d5[0])
+        for i in range(2):
+            s = (U[i]*V5[i]).sum() > 0 and 1. or -1.
+            self.assertTrue(abs(U[i]-s*V5[i]).max()<1e-4)
+
+    def test_02_Mca(self):
+        """
+        Checks the coupled SVD of two fields against the full
+        cross-covariance matrix.
+        """
+        from numpy import sqrt, cos, pi, dot
+        from numpy.linalg import svd
+        self.ga('set x 1 20')
+        self.ga('set y 2 45')
+        self.ga('set t 1 5')
+        ts, ps = (self.ga.exp('ts'), self.ga.exp('ps'))
+        w = sqrt(cos(pi*ts.grid.lat/180.)).reshape((-1,1))
+        A = ((ts-ts.mean(axis=0))*w).data.reshape((5,-1))
+        B = ((ps-ps.mean(axis=0))*w).data.reshape((5,-1))
+        u, s, v = svd(dot(A.T,B)/4.,full_matrices=0)
+        for method in ( 'qr', 'random' ):
+            U, V, d, a, b = self.ga.mca('ts','ps',keep=2,method=method,seed=1)
+            self.assertEqual((U.shape,V.shape,a.shape),(ts[0:2].shape,)*2+((2,5),))
+            self.assertTrue(abs(d-s[0:2]).max()<1e-4*s[0])
+            for i in range(2):
+                sg = (U[i].ravel()*u[:,i]).sum() > 0 and 1. or -1.
+                self.assertTrue(abs(U[i].ravel()-sg*u[:,i]).max()<1e-4)
+                self.assertTrue(abs(V[i].ravel()-sg*v[i]).max()<1e-4)
+
+    def test_02_Ops(self):
+        """
+        Checks that fields derived from an exported field share its grid,
+        while copies get their own.
+        """
+        ta = self.ga.exp('ta')
+        for F in ( 2*ta-1, ta>280, abs(ta), ta[1:] ):
+            self.assertEqual(F.name,'ta')
+            self.assertTrue(F.grid is ta.grid)
+        self.assertEqual(type(float(ta[0,0])),float)
+        dims, time = (list(ta.grid.dims), list(ta.grid.time))
+        G = ta.copy()
+        self.assertEqual(G.name,'ta')
+        self.assertTrue(G.grid is not ta.grid)
+        self.assertTrue(G.grid.lon is ta.grid.lon)
+        G.grid.dims[0] = 'eof'
+        G.grid.time.append('00Z01JAN2000')
+        G.grid.eof = [0]
+        self.assertEqual((ta.grid.dims,ta.grid.time,ta.grid.eof),
+                         (dims,time,None))
+
+    def test_02_Interned(self):
+        """
+        Checks that grids of fields exported from the same file share
+        read-only coordinates.
+        """
+        ta = self.ga.exp('ta')
+        ua = self.ga.exp('ua')
+        self.assertTrue(ta.grid.lon is ua.grid.lon)
+        self.assertTrue(ta.grid.lat is ua.grid.lat)
+        self.assertTrue(ta.grid.tyme is ua.grid.tyme)
+        self.assertRaises(ValueError, ta.grid.lon.__setitem__, 0, 0.)
+        g = ta.grid.copy()
+        g.lon = ta.grid.lon + 1.
+        self.assertEqual(abs(ta.grid.lon+1.-g.lon).max(),0.)
+
+    def test_02_OpsGrid(self):
+        """
+        Checks that computing EOFs of a field, or of a copy of it,
+        leaves the grid of the field alone.
+        """
+        self.ga('set y 2 45')
+        self.ga('set t 1 5')
+        F = self.ga.exp('ts')
+        dims, time, shape = (list(F.grid.dims), list(F.grid.time),
+                             F.grid.meta.shape)
+        for G in ( F.copy(), F ):
+            V, d, c = self.ga.eof(G,keep=2)
+            self.assertEqual(V.grid.dims[0],'eof')
+            self.assertEqual(F.grid.dims,dims)
+            self.assertEqual(list(F.grid.time),time)
+            self.assertEqual(F.grid.meta.shape,shape)
+
+    def test_02_ImpStream(self):
+        """
+        Imports a 4D field one time step at a time.
+        """
+        if not self.ga.HAS_IPC:
+            return
+        self.ga('set z 1 7')
+        self.ga('set t 1 5')
+        ta = self.ga.exp('ta')
+        self.ga.imp_stream('tb', (ta[t] for t in range(5)), grid=ta.grid)
+        tb = self.ga.exp('tb')
+        self.assertEqual(abs(tb-ta).max(),0.)
+        self.assertRaises(GrADSError, self.ga.imp_stream, 'tc',
+                          (ta[t] for t in range(4)), ta.grid)
+        g = ta.grid.copy()
+        g.meta = None
+        self.assertRaises(GrADSError, self.ga.imp_stream, 'tc', ta, g)
+        self.assertEqual(list(self.ga.query('dims').t),[1,5])
+
+    def test_02_Eval(self):
+        """
+        Evaluates an expression into a shaped array, then into a
+        preallocated one.
+        """
+        self.ga('set z 1 7')
+        ta = self.ga.eval('ta')
+        self.assertEqual(ta.shape,(7,self.fh.ny,self.fh.nx))
+        out = ta.ravel().copy()
+        out[:] = 0.
+        a = self.ga.eval('ta',out=out)
+        self.assertTrue(a is out)
+        self.assertEqual(abs(out-ta.ravel()).max(),0.)
+
+    def test_02_Coords(self):
+        """
+        Compares coordinates computed from the file metadata with
+        those obtained from GrADS.
+        """
+        self.ga('set lon -180 180')
+        self.ga('set z 1 7')
+        self.ga('set t 2 4')
+        c1 = self.ga.coords()
+        ctlinfo = self.ga._ctlinfo
+        self.ga._ctlinfo = {} # as if not opened with open()
+        try:
+            c2 = self.ga.coords()
+        finally:
+            self.ga._ctlinfo = ctlinfo
+        self.assertEqual(c1.time,c2.time)
+        for att in ( 'lev', 'lat', 'lon' ):
+            self.assertEqual(list(getattr(c1,att)),list(getattr(c2,att)))
+
+    def test_02_Datetime64(self):
+        """
+        Checks that datetime64 time axes agree with datetime ones.
+        """
+        if not hasattr(self.ga,'exp'):
+            return
+        from grads.numtypes import GaGrid, gat2dt64, dt642gat
+        self.ga('set t 1 5')
+        ts = self.ga.exp('ts')
+        GaGrid.Datetime64 = True
+        try:
+            ts64 = self.ga.exp('ts')
+        finally:
+            GaGrid.Datetime64 = False
+        self.assertEqual(ts64.grid.tyme.dtype.str,'<M8[m]')
+        self.assertEqual(list(ts64.grid.tyme.astype(object)),
+                         list(ts.grid.tyme))
+        t64 = gat2dt64(dt642gat(ts64.grid.tyme))
+        self.assertTrue((t64==ts64.grid.tyme).all())
+
     def test_02_Prints(self):
         """
         Exercises print/print file.eps/printim but does verify results.
@@ -181,11 +666,32 @@ class TestModelFile(unittest.TestCase):
                     self.assertEqual(self.ga.rline(1), \
                                      'Constant field.  Value = 0')
 
+    def test_07_Pool(self):
+        """
+        Exports with a pool of workers and compares with a serial export.
+        """
+        try:
+            from grads import GaPool
+        except ImportError:
+            return # needs NumPy
+        pool = GaPool(2, Bin=self.bin, Echo=False, Window=False)
+        pool.open(self.fname)
+        for ga in (self.ga, pool):
+            ga('set t 1 5')
+            ga('set z 1 7')
+        ta1 = self.ga.exp('ta')
+        ta2 = pool.exp('ta')
+        self.assertEqual(ta1.shape,ta2.shape)
+        self.assertEqual(ta1.grid.time,ta2.grid.time)
+        self.assertEqual(abs(ta1-ta2).max(),0.)
+
     def _GenericSetUp(self,bin,dat):
         global GrADSTestFiles
         global GrADSBinaryFiles
-        self.ga = GrADS(Bin=GrADSBinaryFiles[bin], Echo=False, Window=False)
-        self.fh = self.ga.open(GrADSTestFiles[dat])
+        self.bin = GrADSBinaryFiles[bin]
+        self.fname = GrADSTestFiles[dat]
+        self.ga = GrADS(Bin=self.bin, Echo=False, Window=False)
+        self.fh = self.ga.open(self.fname)
 
     def notest_04_LATS_Coards_1(self):
         self.ga("set x 1 72")
@@ -478,6 +984,20 @@ class grads_grb(TestModelFile):
     def test_05_Read_stream(self): pass
     def test_05_Read_sequential(self): pass
 
+class fake_grb(TestModelFile):
+    """Protocol tests against the GrADS emulator (fakegrads.py); there
+    is no real data behind it, nor a lats4d."""
+    def setUp(self):
+        self._GenericSetUp('fake','grb')
+    def test_03_Display(self): pass
+    def test_04_Write_generic(self): pass
+    def test_04_Write_stream(self): pass
+    def test_04_Write_sequential(self): pass
+    def test_04_Write_mean(self): pass
+    def test_04_stats(self): pass
+    def test_05_Read_stream(self): pass
+    def test_05_Read_sequential(self): pass
+
 class grads_grb2(TestGrb2File):
     """Grib-2 specific tests"""
     def setUp(self):
@@ -556,9 +1076,11 @@ class gradsdap_pdef(TestPdefFile):
 
 #......................................................................
 
-def run_all_tests(verb=2,BinDir=None,DataDir=None):
+def run_all_tests(verb=2,BinDir=None,DataDir=None,Fake=False):
     """
-    Runs all tests based on the standard *model* testing file.
+    Runs all tests based on the standard *model* testing file. If
+    *Fake* is True, the protocol tests are run against the GrADS
+    emulator in fakegrads.py instead of the GrADS binaries.
     """
 
 #   Search for a reasonable default for binary dir
@@ -594,6 +1116,24 @@ def run_all_tests(verb=2,BinDir=None,DataDir=None):
     GrADSBinaryFiles = { 'grads'    : BinDir+'grads',    \
                          'gradsdap' : BinDir+'gradsdap'  }
 
+#   Emulator only
+#   -------------
+    if Fake:
+        fake = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fakegrads.py')
+        GrADSBinaryFiles['fake'] = sys.executable + ' ' + fake
+        print ""
+        print "Testing with GrADS emulator <%s>"%fake
+        print ""
+        os.system("/bin/rm   -rf output")
+        os.system("/bin/mkdir -p output")
+        load = unittest.TestLoader().loadTestsFromTestCase
+        Results = unittest.TextTestRunner(verbosity=verb).run(load(fake_grb))
+        if not Results.wasSuccessful(): 
+            raise IOError, 'GrADS tests failed'
+        os.system("/bin/rm   -rf output")
+        return
+
 
     print ""
     print "Testing with GrADS Data Files from " + DataDir
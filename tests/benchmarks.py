@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the data-exchange hot paths of the GrADS client
+classes: command round trips, queries, open(), eval(), coords(),
+exp() and imp(), and the numerical methods built on top of them
+(eof, lsq, sampleXY, sampleXYT and interpolate).
+
+Each case is run in a child process of its own, so that its peak
+memory usage can be measured, over a range of global grids from the
+72x46 model.ctl file up to 0.25 degree resolution. Results are saved
+as JSON and can be compared against a baseline, e.g.,
+
+    python benchmarks.py -o baseline.json
+    ... change the code ...
+    python benchmarks.py -B baseline.json
+
+exits with status 1 when any case is slower (or uses more memory)
+than the baseline by more than the tolerance. Use --fake to run the
+benchmarks against the GrADS emulator in fakegrads.py.
+"""
+
+__version__ = '1.0.0'
+
+import os
+import sys
+import platform
+import resource
+from time          import strftime, gmtime
+from timeit        import default_timer as clock
+from optparse      import OptionParser   # Command-line args
+
+try:
+    import json
+except ImportError:
+    import simplejson as json   # Python 2.5
+
+# Add parent directory to python search path
+# ------------------------------------------
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+
+import numpy as N
+from datetime import datetime, timedelta
+from grads import GaNum, __version__ as pygrads_version
+from grads.ganum import interpolate
+
+#   Global grids: name -> (nx, ny); 72x46 is the standard model.ctl
+#   ---------------------------------------------------------------
+Grids = [ ('72x46',    (72,46)),
+          ('144x73',   (144,73)),
+          ('360x181',  (360,181)),
+          ('1440x721', (1440,721)) ]
+
+NZ, NT = (7, 5)     # same as model.ctl
+NOBS   = 1000       # number of points for sampling/interpolation
+
+Levels = ( 1000, 850, 700, 500, 300, 200, 100 )
+
+#.....................................................................
+
+#   Benchmark cases
+#   ---------------
+#   Each case is a function taking (ga,opts) and returning the
+#   callable being timed; the dimension environment on entry is the
+#   one right after opening the file: x/y varying, z=1, t=1.
+
+def case_cmd(ga, o):
+    return lambda: ga.cmd('q undef', Quiet=True)
+
+def case_query_dims(ga, o):
+    ga.Shadow = False
+    return lambda: ga.query('dims', Quiet=True)
+
+def case_query_dims_shadow(ga, o):
+    ga.Shadow = True
+    ga.query('dims', Quiet=True) # prime the shadow environment
+    return lambda: ga.query('dims', Quiet=True)
+
+def case_open(ga, o):
+    def run():
+        fh = ga.open(o.fname, Quiet=True)
+        ga.cmd('close %d'%fh.fid, Quiet=True)
+    return run
+
+def case_eval(ga, o):
+    return lambda: ga.eval('ts')
+
+def case_eval_out(ga, o):
+    ga.cmd('set z 1 %d'%NZ, Quiet=True)
+    out = ga.eval('ta')
+    return lambda: ga.eval('ta', out=out)
+
+def case_coords(ga, o):
+    ga.cmd('set z 1 %d'%NZ, Quiet=True)
+    ga.cmd('set t 1 %d'%NT, Quiet=True)
+    return lambda: ga.coords()
+
+def case_exp_2d(ga, o):
+    return lambda: ga.exp('ts')
+
+def case_exp_3d(ga, o):
+    ga.cmd('set z 1 %d'%NZ, Quiet=True)
+    return lambda: ga.exp('ta')
+
+def case_exp_4d(ga, o):
+    ga.cmd('set z 1 %d'%NZ, Quiet=True)
+    ga.cmd('set t 1 %d'%NT, Quiet=True)
+    return lambda: ga.exp('ta')
+
+def case_exp_3d_shm(ga, o):
+    ga.Shm = _shmDir()
+    return case_exp_3d(ga, o)
+
+def case_imp(ga, o):
+    ts = ga.exp('ts')
+    return lambda: ga.imp('bench', ts)
+
+def case_imp_3d(ga, o):
+    ga.cmd('set z 1 %d'%NZ, Quiet=True)
+    ta = ga.exp('ta')
+    return lambda: ga.imp('bench', ta)
+
+def case_imp_3d_shm(ga, o):
+    ga.Shm = _shmDir()
+    return case_imp_3d(ga, o)
+
+def case_eof(ga, o):
+    ny = ga.query('dims', Quiet=True).ny
+    ga.cmd('set y 2 %d'%(ny-1), Quiet=True) # area metric vanishes at poles
+    ga.cmd('set t 1 %d'%NT, Quiet=True)
+    return lambda: ga.eof('ts')
+
+def case_eof_keep(ga, o):
+    ny = ga.query('dims', Quiet=True).ny
+    ga.cmd('set y 2 %d'%(ny-1), Quiet=True)
+    ga.cmd('set t 1 %d'%NT, Quiet=True)
+    return lambda: ga.eof('ts', keep=2, seed=o.seed)
+
+def case_lsq(ga, o):
+    return lambda: ga.lsq('ts', ('ta(z=1)','ta(z=2)'), Bias=True)
+
+def case_sampleXY(ga, o):
+    lons, lats = _obs(o)
+    return lambda: ga.sampleXY('ts', lons, lats)
+
+def case_sampleXYT(ga, o):
+    lons, lats = _obs(o)
+    t0 = datetime(1987,1,1,0)
+    rs = N.random.RandomState(o.seed)
+    hours = N.sort(rs.uniform(0.,24.*(NT-1)-1.,NOBS))
+    tyme = N.array([ t0 + timedelta(hours=h) for h in hours ])
+    return lambda: ga.sampleXYT('ts', lons, lats, tyme)
+
+def case_interp_regular(ga, o):
+    ts = ga.exp('ts')
+    g = ts.grid
+    lons, lats = _obs(o,lon0=g.lon[0])
+    lons, lats = lons.reshape((NOBS,1)), lats.reshape((NOBS,1))
+    return lambda: interpolate(ts, g.lon, g.lat, lons, lats, masked=True)
+
+def case_interp_irregular(ga, o):
+    ts = ga.exp('ts')
+    g = ts.grid
+    lat = N.sin(N.linspace(-N.pi/2,N.pi/2,len(g.lat))) * 90. # gaussian-like
+    lons, lats = _obs(o,lon0=g.lon[0])
+    lons, lats = lons.reshape((NOBS,1)), lats.reshape((NOBS,1))
+    return lambda: interpolate(ts, g.lon, lat, lons, lats, masked=True)
+
+Cases = [ ('cmd',               case_cmd),
+          ('query_dims',        case_query_dims),
+          ('query_dims_shadow', case_query_dims_shadow),
+          ('open',              case_open),
+          ('eval',              case_eval),
+          ('eval_out',          case_eval_out),
+          ('coords',            case_coords),
+          ('exp_2d',            case_exp_2d),
+          ('exp_3d',            case_exp_3d),
+          ('exp_4d',            case_exp_4d),
+          ('exp_3d_shm',        case_exp_3d_shm),
+          ('imp',               case_imp),
+          ('imp_3d',            case_imp_3d),
+          ('imp_3d_shm',        case_imp_3d_shm),
+          ('eof',               case_eof),
+          ('eof_keep',          case_eof_keep),
+          ('lsq',               case_lsq),
+          ('sampleXY',          case_sampleXY),
+          ('sampleXYT',         case_sampleXYT),
+          ('interp_regular',    case_interp_regular),
+          ('interp_irregular',  case_interp_irregular) ]
+
+def _shmDir():
+    """Directory for the shared memory transport."""
+    if os.path.isdir('/dev/shm'): return '/dev/shm'
+    return '/tmp'
+
+def _obs(o, lon0=-180.):
+    """Reproducible random observation locations."""
+    rs = N.random.RandomState(o.seed)
+    lons = rs.uniform(lon0+1.,lon0+359.,NOBS)
+    lats = rs.uniform(-85.,85.,NOBS)
+    return (lons, lats)
+
+#.....................................................................
+
+def makeGrid(name, nx, ny, o):
+    """
+    Returns the name of a descriptor file for a global *nx* by *ny*
+    grid with the layout of model.ctl, creating it (and its data
+    file) under the work directory if necessary.
+    """
+    if name == '72x46' and o.datadir is not None:
+        fname = os.path.join(o.datadir,'model.ctl')
+        if os.path.exists(fname): return fname
+    if not os.path.isdir(o.workdir):
+        os.makedirs(o.workdir)
+    ctl = os.path.join(o.workdir,'bench_%s.ctl'%name)
+    bin = os.path.join(o.workdir,'bench_%s.bin'%name)
+    nrec = NT * (1 + NZ)
+    if os.path.exists(ctl) and os.path.exists(bin) \
+       and os.path.getsize(bin) == 4*nx*ny*nrec:
+        return ctl
+
+#   Data: ts(t) followed by ta(z,t), smooth fields plus a little noise
+#   ------------------------------------------------------------------
+    print " [] Creating %dx%d benchmark data in %s"%(nx,ny,o.workdir)
+    rs = N.random.RandomState(o.seed)
+    lon = N.linspace(0.,2*N.pi,nx,endpoint=False)[N.newaxis,:]
+    lat = N.linspace(-N.pi/2,N.pi/2,ny)[:,N.newaxis]
+    f = open(bin,'wb')
+    for t in range(NT):
+        wave = N.cos(lat) * N.cos(2*lon + 0.3*t)
+        ts = 280. + 20.*wave + rs.normal(0.,1.,(ny,nx))
+        ts.astype('float32').tofile(f)
+        for z in range(NZ):
+            ta = 290. - 8.*z + 15.*wave + rs.normal(0.,1.,(ny,nx))
+            ta.astype('float32').tofile(f)
+    f.close()
+
+    dx, dy = (360./nx, 180./(ny-1))
+    lines = [ 'dset ^%s'%os.path.basename(bin),
+              'title Benchmark data on a %s global grid'%name,
+              'undef 1e+20',
+              'xdef %d linear 0 %g'%(nx,dx),
+              'ydef %d linear -90 %g'%(ny,dy),
+              'zdef %d levels %s'%(NZ,' '.join(['%d'%l for l in Levels])),
+              'tdef %d linear 0Z1jan1987 1dy'%NT,
+              'vars 2',
+              'ts 0 99 Surface (2m) air temperature [K]',
+              'ta %d 99 Air Temperature [K]'%NZ,
+              'endvars' ]
+    open(ctl,'w').write('\n'.join(lines)+'\n')
+    return ctl
+
+#.....................................................................
+
+def runCase(cname, case, o):
+    """
+    Runs a case in a child process and returns a dictionary with the
+    wall clock time statistics and peak memory usage.
+    """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        try:
+            try:
+                result = _child(case, o)
+            except Exception, e:
+                result = { 'error': '%s: %s'%(e.__class__.__name__,e) }
+            os.write(wfd,json.dumps(result))
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    chunks = []
+    while True:
+        chunk = os.read(rfd,65536)
+        if not chunk: break
+        chunks.append(chunk)
+    os.close(rfd)
+    os.waitpid(pid,0)
+    if not chunks:
+        return { 'error': 'benchmark process died' }
+    return json.loads(''.join(chunks))
+
+def _child(case, o):
+    """Body of the child process running a case."""
+    ga = GaNum(Bin=o.bin, Echo=False, Window=False)
+    ga.open(o.fname, Quiet=True)
+    run = case(ga, o)
+    rss0 = _maxrss()
+    run()                                   # warm up
+    times = []
+    for i in range(o.repeat):
+        t0 = clock()
+        run()
+        times.append(clock() - t0)
+    result = _summary(times)
+    result['rss_kb'] = _maxrss()
+    result['drss_kb'] = result['rss_kb'] - rss0
+    result['grads_rss_kb'] = _grads_hwm(ga)
+    del ga
+    return result
+
+def _summary(times):
+    """Timing statistics, in seconds."""
+    t = N.array(times)
+    return { 'n': len(times),
+             'min': float(t.min()),
+             'median': float(N.median(t)),
+             'mean': float(t.mean()),
+             'stdev': float(t.std()) }
+
+def _maxrss():
+    """Peak resident set size of this process in KB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': rss = rss / 1024 # bytes on Mac OS X
+    return rss
+
+def _grads_hwm(ga):
+    """
+    Peak resident set size of the GrADS process in KB, if known. When
+    GrADS has been started through a shell, the shell's only child is
+    used instead.
+    """
+    try:
+        pid = ga.p.pid
+        while open('/proc/%d/comm'%pid).read().strip() in ('sh','bash','dash'):
+            task = '/proc/%d/task/%d/children'%(pid,pid)
+            children = open(task).read().split()
+            if len(children) != 1: return None
+            pid = int(children[0])
+        for line in open('/proc/%d/status'%pid).readlines():
+            if line[:6] == 'VmHWM:':
+                return int(line.split()[1])
+    except (AttributeError, IOError, ValueError):
+        pass
+    return None
+
+#.....................................................................
+
+def compare(results, baseline, tol):
+    """
+    Prints a comparison of *results* against *baseline* and returns
+    the number of regressions: cases whose median time or peak memory
+    growth exceed the baseline by more than a fraction *tol*.
+    """
+    print ""
+    print "%-10s %-18s %12s %12s %8s %10s"%\
+          ('grid','case','base(ms)','now(ms)','ratio','drss(KB)')
+    nbad = 0
+    for gname, cases in sorted(results.items()):
+        for cname, r in sorted(cases.items()):
+            b = baseline.get(gname,{}).get(cname)
+            if b is None or 'error' in b or 'error' in r: continue
+            ratio = r['median'] / max(b['median'],1e-9)
+            flag = ''
+            # ignore sub-millisecond jitter
+            if ratio > 1. + tol and r['median'] - b['median'] > 1e-3:
+                flag = flag + ' SLOWER'
+            if r['drss_kb'] > (1.+tol)*b['drss_kb'] + 1024:
+                flag = flag + ' MEMORY'
+            if flag: nbad = nbad + 1
+            print "%-10s %-18s %12.3f %12.3f %8.2f %10d%s"%\
+                  (gname,cname,1e3*b['median'],1e3*r['median'],ratio,
+                   r['drss_kb'],flag)
+    return nbad
+
+#.....................................................................
+
+def main():
+
+    parser = OptionParser(usage="Usage: %prog [options]",
+                          version=__version__ )
+
+    parser.add_option("-b", "--bindir", dest="bindir", default=None,
+                      help="Directory for GrADS binaries " )
+
+    parser.add_option("-d", "--datadir", dest="datadir", default=None,
+                      help="Directory with model.ctl" )
+
+    parser.add_option("-w", "--workdir", dest="workdir",
+                      default=os.path.join('/tmp','pygrads_bench'),
+                      help="Directory for generated benchmark data (default=%default)" )
+
+    parser.add_option("-g", "--grids", dest="grids",
+                      default=','.join([ g[0] for g in Grids ]),
+                      help="Comma separated list of grids (default=%default)" )
+
+    parser.add_option("-k", "--cases", dest="cases", default=None,
+                      help="Comma separated list of cases (default: all)" )
+
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=5,
+                      help="Number of timed runs per case (default=%default)" )
+
+    parser.add_option("-s", "--seed", dest="seed", type="int", default=1987,
+                      help="Random number seed (default=%default)" )
+
+    parser.add_option("-o", "--output", dest="output", default=None,
+                      help="Save results to this JSON file" )
+
+    parser.add_option("-B", "--baseline", dest="baseline", default=None,
+                      help="Compare results with this JSON file" )
+
+    parser.add_option("-t", "--tolerance", dest="tol", type="float", default=0.25,
+                      help="Tolerated slow down before flagging a regression (default=%default)" )
+
+    parser.add_option("-f", "--fake", dest="fake", action="store_true",
+                      default=False,
+                      help="run benchmarks against the GrADS emulator" )
+
+    (o, a) = parser.parse_args()
+
+#   GrADS binary and data
+#   ---------------------
+    if o.fake:
+        o.bin = sys.executable + ' ' + \
+                os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'fakegrads.py')
+    else:
+        o.bin = os.path.join(o.bindir or '','grads')
+    if o.datadir is None:
+        for dir in ( '.', 'data', '../data', '../../../data'):
+            if os.path.exists(dir+'/model.ctl'):
+                o.datadir = dir
+                break
+
+    grids = [ g for g in Grids if g[0] in o.grids.split(',') ]
+    cases = Cases
+    if o.cases is not None:
+        cases = [ c for c in Cases if c[0] in o.cases.split(',') ]
+
+    print ""
+    print "  PyGrADS Benchmarks"
+    print ""
+
+    results = {}
+    for gname, (nx, ny) in grids:
+        o.fname = makeGrid(gname, nx, ny, o)
+        results[gname] = {}
+        print ""
+        print "%-10s %-18s %10s %10s %10s %10s"%\
+              ('grid','case','min(ms)','median(ms)','drss(KB)','grads(KB)')
+        for cname, case in cases:
+            r = runCase(cname, case, o)
+            results[gname][cname] = r
+            if 'error' in r:
+                print "%-10s %-18s %s"%(gname,cname,r['error'])
+            else:
+                print "%-10s %-18s %10.3f %10.3f %10d %10s"%\
+                      (gname,cname,1e3*r['min'],1e3*r['median'],
+                       r['drss_kb'],r['grads_rss_kb'])
+
+#   Save results along with enough information to reproduce them
+#   ------------------------------------------------------------
+    if o.output is not None:
+        meta = { 'date': strftime('%Y-%m-%dT%H:%M:%SZ',gmtime()),
+                 'host': platform.node(),
+                 'platform': platform.platform(),
+                 'python': platform.python_version(),
+                 'numpy': N.__version__,
+                 'pygrads': pygrads_version,
+                 'bin': o.bin,
+                 'repeat': o.repeat,
+                 'seed': o.seed,
+                 'nobs': NOBS }
+        f = open(o.output,'w')
+        json.dump({ 'meta': meta, 'results': results }, f,
+                  indent=1, sort_keys=True)
+        f.close()
+        print ""
+        print " [] Results saved in " + o.output
+
+    if o.baseline is not None:
+        baseline = json.load(open(o.baseline))['results']
+        nbad = compare(results, baseline, o.tol)
+        if nbad > 0:
+            print ""
+            print " [] %d regression(s) above %g%% tolerance"%(nbad,100*o.tol)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
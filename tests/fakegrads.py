@@ -0,0 +1,870 @@
+#!/usr/bin/env python
+#--------------------------------------------------------------------------
+#
+#    Copyright (C) 2006-2008 by Arlindo da Silva <dasilva@opengrads.org>
+#    All Rights Reserved.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation# using version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY# without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program# if not, please consult
+#
+#              http://www.gnu.org/licenses/licenses.html
+#
+#    or write to the Free Software Foundation, Inc., 59 Temple Place,
+#    Suite 330, Boston, MA 02111-1307 USA
+#
+#------------------------------------------------------------------------
+
+"""
+A stand-in for a patched "grads -u" binary. It speaks the same
+protocol as GrADS does on its stdin/stdout pipes:
+
+  - each command is echoed back as "<IPC> cmd", followed by the text
+    output, an "<RC> rc </RC>" line and a closing "</IPC>";
+  - "q dims", "q file", "q ctlinfo", "q time", "q config", etc.
+    produce output laid out like the real thing;
+  - "set gxout fwrite" + "set fwrite -" followed by "display"
+    streams float32 data after a "<FWRITE>" marker;
+  - "define void = ipc_save(expr,-)" streams an "<EXP>" frame
+    (20 float meta header, data, lon, lat); with a file name instead
+    of "-" the frame is written to that file;
+  - "define var = ipc_load()" reads slices back from stdin, or from
+    the file given to "ipc_open fname r".
+
+There is no real data behind the descriptors: coordinates are taken
+from the descriptor file (any GrADS ctl file will do, and the data
+file does not need to exist) and the variables are filled with smooth
+synthetic fields. Non-ctl files (NetCDF, HDF, URLs) are served with
+the layout of data/model.ctl. Use it to benchmark or regression test
+the client classes on a box without GrADS:
+
+    ga = GaNum(Bin=sys.executable+' fakegrads.py', Echo=False)
+    fh = ga.open('../data/model.ctl')
+
+NumPy is only needed for the commands that produce or consume data.
+"""
+
+__version__ = '1.0.0'
+
+import os
+import sys
+import re
+
+from math     import floor, ceil
+from datetime import datetime, timedelta
+
+try:
+    import numpy as N
+    from numpy import ma
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+VERSION = 'v2.0.2'
+
+__Months__ = ['JAN','FEB','MAR','APR','MAY','JUN','JUL','AUG','SEP','OCT','NOV','DEC']
+__Days__   = ['Mon','Tue','Wed','Thu','Fri','Sat','Sun']
+
+# Used for anything that is not a ctl file
+# ----------------------------------------
+_MODEL_CTL = """dset ^model.grb
+title Sample Model Data for lats4d Tutorial
+undef 1e+20
+dtype grib
+xdef 72 linear 0.000000 5.000000
+ydef 46 linear -90.000000 4.000000
+zdef 7 levels
+1000 850 700 500 300 200 100
+tdef 5 linear 0Z1jan1987 1dy
+vars 8
+ps        0    1,  1,  0,  0 Surface pressure [hPa]
+ua        7   33,100 Eastward wind [m/s]
+va        7   34,100 Northward wind [m/s]
+zg        7    7,100 Geopotential height [m]
+ta        7   11,100 Air Temperature [K]
+hus       7   51,100 Specific humidity [kg/kg]
+ts        0   11,105,  2 Surface (2m) air temperature [K]
+pr        0   59,  1,  0,  0 Total precipitation rate [kg/(m^2*s)]
+endvars
+"""
+
+# Synthetic fields: (base, amplitude)
+# -----------------------------------
+_SYNTH = { 'ps'  : (1000., 50.),
+           'ts'  : ( 280., 20.),
+           'pr'  : (5e-5, 4e-5),
+           'ua'  : (  10., 15.),
+           'va'  : (   0., 10.),
+           'zg'  : (5000., 100.),
+           'ta'  : ( 250., 20.),
+           'hus' : (5e-3, 4e-3) }
+
+class FakeError(Exception):
+    pass
+
+#.....................................................................
+
+class Ctl(object):
+    """
+    Minimal GrADS data descriptor: coordinates and variable list.
+    """
+
+    def __init__(self, fname, text=None):
+
+        self.fname = fname
+        if text is None:
+            text = open(fname).read()
+            self.ctl = True
+        else:
+            self.ctl = False
+
+        self.dset = None
+        self.title = ''
+        self.undef = 1e20
+        self.dtype = None
+        self.vars = []
+        self.axes = {}
+
+        lines = [l.strip() for l in text.split('\n')]
+        lines = [l for l in lines if len(l)>0 and l[0]!='*']
+        i = 0
+        while i < len(lines):
+            words = lines[i].split()
+            key = words[0].lower()
+            if key == 'dset':
+                self.dset = words[1]
+            elif key == 'title':
+                self.title = ' '.join(words[1:]).replace('"','')
+            elif key == 'undef':
+                self.undef = float(words[1])
+            elif key == 'dtype':
+                self.dtype = words[1]
+            elif key in ('xdef','ydef','zdef','edef'):
+                n, kind = int(words[1]), words[2].lower()
+                vals = words[3:]
+                if kind == 'levels':
+                    while len(vals) < n:
+                        i += 1
+                        vals += lines[i].split()
+                    vals = [float(v) for v in vals[:n]]
+                elif kind == 'linear':
+                    vals = [float(v) for v in vals[:2]]
+                else:
+                    vals = [float(j+1) for j in range(n)] # names
+                    kind = 'levels'
+                self.axes[key[0]] = (n, kind, vals)
+            elif key == 'tdef':
+                n = int(words[1])
+                t0 = _gat2dt(words[3])
+                m = re.match(r'(\d+)([a-zA-Z]+)',words[4])
+                self.axes['t'] = (n, 'linear', (t0, int(m.group(1)),
+                                                m.group(2)[:2].lower()))
+            elif key == 'vars':
+                nv = int(words[1])
+                for j in range(nv):
+                    i += 1
+                    self.vars.append(_parseVar(lines[i]))
+            i += 1
+
+        if 'e' not in self.axes:
+            self.axes['e'] = (1, 'linear', [1., 1.])
+        if self.dset is not None and self.dset[0] == '^':
+            dirname = os.path.dirname(fname)
+            if dirname: dirname += '/'
+            self.bin = dirname + self.dset[1:]
+        else:
+            self.bin = self.dset
+
+    def size(self, dim):
+        return self.axes[dim][0]
+
+    def world(self, dim, i):
+        """World coordinate for grid index *i* (a float)."""
+        n, kind, vals = self.axes[dim]
+        if dim == 't':
+            return self.time(int(floor(i+0.5)))
+        if kind == 'linear':
+            return vals[0] + (i-1.)*vals[1]
+        k = int(floor(i))
+        k = min(max(k,1),n-1) if n>1 else 1
+        if n == 1: return vals[0]
+        return vals[k-1] + (i-k)*(vals[k]-vals[k-1])
+
+    def grid(self, dim, w):
+        """Grid index for world coordinate *w*."""
+        n, kind, vals = self.axes[dim]
+        if dim == 't':
+            return self.tindex(w)
+        if kind == 'linear':
+            return (w - vals[0])/vals[1] + 1.
+        if n == 1: return 1.
+        for k in range(n-1):
+            a, b = vals[k], vals[k+1]
+            if (a<=w<=b) or (b<=w<=a) or k == n-2:
+                return k + 1. + (w-a)/(b-a)
+
+    def time(self, t):
+        t0, inc, unit = self.axes['t'][2]
+        return _tadd(t0, (t-1)*inc, unit)
+
+    def tindex(self, tyme):
+        """Nearest grid index for datetime *tyme*."""
+        t0, inc, unit = self.axes['t'][2]
+        if unit in ('mo','yr'):
+            months = (tyme.year-t0.year)*12 + tyme.month - t0.month
+            if unit == 'yr': inc = 12 * inc
+            return 1 + int(floor(float(months)/inc + 0.5))
+        secs = _secs(tyme-t0)
+        step = { 'mn':60., 'hr':3600., 'dy':86400. }[unit] * inc
+        return 1 + int(floor(secs/step + 0.5))
+
+#.....................................................................
+
+class FakeGrADS(object):
+    """
+    The protocol state machine. Commands are read from *Reader* and
+    responses are written to *Writer*.
+    """
+
+    def __init__(self, Reader, Writer):
+        self.Reader = Reader
+        self.Writer = Writer
+        self.files = []
+        self.dfile = 0
+        self.dims = None
+        self.defined = {}
+        self.gxout = 'contour'
+        self.fwrite = False
+        self.fwrite_name = None
+        self.ipc_in = None
+        self.loopdim = 't'
+
+    def run(self):
+        self.frame('', ['Grid Analysis and Display System (GrADS) Version 2.0.2',
+                        'Copyright (c) 1988-2011 by Brian Doty and the',
+                        'Institute for Global Environment and Society (IGES)',
+                        'This program is distributed WITHOUT ANY WARRANTY',
+                        'See file COPYRIGHT for more information.',
+                        '',
+                        'This is a protocol emulator, not the real thing.'], 0)
+        while True:
+            line = self.Reader.readline()
+            if line == '':
+                break
+            cmd = line.rstrip('\r\n')
+            if cmd.strip().lower() in ('quit', 'exit'):
+                break
+            self.current, self.echoed = cmd, False
+            try:
+                out = self.execute(cmd)
+                rc = 0
+            except FakeError, e:
+                out = [ str(e) ]
+                rc = 1
+            except (ValueError, IndexError, KeyError), e:
+                out = [ 'Syntax error:  %s'%e ]
+                rc = 1
+            self.frame(cmd, out, rc)
+
+    def echo(self):
+        """
+        Echoes the current command ahead of its output. GrADS does that
+        before fwrite streams data; ipc_save() data comes first instead.
+        """
+        self.Writer.write('<IPC> ' + self.current + '\n')
+        self.echoed = True
+
+    def frame(self, cmd, out, rc):
+        w = self.Writer
+        if not getattr(self,'echoed',False):
+            w.write('<IPC> ' + cmd + '\n')
+        for line in out:
+            w.write(line+'\n')
+        w.write('\n<RC> %d </RC>\n</IPC>\n'%rc)
+        w.flush()
+
+    def execute(self, cmd):
+        words = cmd.split()
+        if len(words) == 0:
+            return []
+        verb = words[0].lower()
+        if verb in ('q','query'):
+            return self.query(words[1:])
+        elif verb == 'set':
+            return self.set(words[1:])
+        elif verb in ('open','sdfopen','xdfopen'):
+            return self.open(verb, words[1])
+        elif verb in ('d','display'):
+            return self.display(cmd.split(None,1)[1])
+        elif verb == 'define' or verb == 'ipc_define':
+            return self.define(cmd.split(None,1)[1])
+        elif verb == 'ipc_open':
+            return self.ipc_open(words[1:])
+        elif verb == 'ipc_close':
+            if self.ipc_in not in (None,'-'):
+                self.ipc_in.close()
+            self.ipc_in = None
+            return []
+        elif verb == 'close':
+            n = int(words[1])
+            if n != len(self.files):
+                raise FakeError, 'Close Error:  Only last file may be closed'
+            self.files.pop()
+            if not self.files: self.dims = None
+            return ['File %d has been closed'%n]
+        elif verb == 'reinit':
+            self.__init__(self.Reader,self.Writer)
+            return ['All files closed; all defined objects released;',
+                    'All GrADS attributes have been reinitialized']
+        elif verb == 'disable':
+            self.fwrite = False
+            return []
+        elif verb == 'exec':
+            out = []
+            for l in open(words[1]).readlines():
+                l = l.strip()
+                if len(l)>0 and l[0] != '*':
+                    out += self.execute(l)
+            return out
+        elif verb in ('c','clear','draw','enable','print','printim',
+                      'gxprint','swap','undefine'):
+            return []
+        else:
+            raise FakeError, 'Unknown command: %s'%words[0]
+
+#   ..................................................................
+
+    def open(self, verb, fname):
+        if fname.lower()[:7] == 'http://':
+            ctl = Ctl(fname, _MODEL_CTL)
+        elif not os.path.exists(fname):
+            raise FakeError, 'Open Error:  Can\'t open description file %s'%fname
+        elif verb == 'open':
+            ctl = Ctl(fname)
+        else:
+            ctl = Ctl(fname, _MODEL_CTL)
+            ctl.bin = fname
+        self.files.append(ctl)
+        fid = len(self.files)
+        out = [ 'Scanning description file:  ' + fname,
+                'Data file %s is open as file %d'%(ctl.bin,fid) ]
+        if fid == 1:
+            self.dfile = 1
+            self.dims = { 'x': [1., float(ctl.size('x'))],
+                          'y': [1., float(ctl.size('y'))],
+                          'z': [1., 1.], 't': [1., 1.], 'e': [1., 1.] }
+            out += [ 'LON set to %g %g'%(ctl.world('x',1),ctl.world('x',ctl.size('x'))),
+                     'LAT set to %g %g'%(ctl.world('y',1),ctl.world('y',ctl.size('y'))),
+                     'LEV set to %g %g'%(ctl.world('z',1),ctl.world('z',1)),
+                     'Time values set: %s %s'%(_gat(ctl.time(1)),_gat(ctl.time(1))),
+                     'E set to 1 1' ]
+        return out
+
+    def ctl(self, fid=None):
+        if fid is None: fid = self.dfile
+        try:
+            return self.files[fid-1]
+        except IndexError:
+            raise FakeError, 'No file open'
+
+#   ..................................................................
+
+    def set(self, words):
+        if len(words) == 0:
+            raise FakeError, 'SET error:  missing operand'
+        what = words[0].lower()
+        args = words[1:]
+        if what in ('x','y','z','t','e','lon','lat','lev','time'):
+            if self.dims is None:
+                raise FakeError, 'SET error:  no files open yet'
+            ctl = self.ctl()
+            dim = { 'lon':'x', 'lat':'y', 'lev':'z', 'time':'t' }.get(what,what)
+            if len(args) == 0 or len(args) > 2:
+                raise FakeError, 'SET error:  Missing or invalid arguments'
+            if what == 'time':
+                vals = [ float(ctl.tindex(_gat2dt(a))) for a in args ]
+            elif what in ('lon','lat','lev'):
+                vals = [ ctl.grid(dim,float(a)) for a in args ]
+            else:
+                vals = [ float(a) for a in args ]
+            if len(vals) == 1: vals = vals * 2
+            if dim in ('z','t','e') and vals[0] == vals[1]:
+                vals = [ floor(vals[0]+0.5) ] * 2
+            self.dims[dim] = vals
+            return []
+        elif what == 'dfile':
+            n = int(args[0])
+            self.ctl(n)
+            self.dfile = n
+            return ['Default file set to: %d'%n]
+        elif what == 'gxout':
+            self.gxout = args[0]
+            return []
+        elif what == 'fwrite':
+            self.fwrite_name = args[0]
+            return []
+        elif what == 'loopdim':
+            self.loopdim = args[0]
+            return []
+        else:
+            return []
+
+#   ..................................................................
+
+    def query(self, words):
+        if len(words) == 0:
+            raise FakeError, 'Query error:  missing operand'
+        what = words[0].lower()
+        if what == 'config':
+            return [ 'Config: %s %s-endian readline printim grib2 netcdf hdf4-sds hdf5 opendap-grids'\
+                     %(VERSION,sys.byteorder) ]
+        elif what in ('udxt','udct'):
+            return [ 'User Defined Extension Table:', '  ipc_open  ipc_close  ipc_save  ipc_load' ]
+        elif what == 'dims':
+            return self.qdims()
+        elif what == 'file':
+            return self.qfile(words[1:])
+        elif what == 'ctlinfo':
+            return self.qctlinfo(words[1:])
+        elif what == 'time':
+            ctl = self.ctl()
+            t1, t2 = [ ctl.time(int(floor(t+0.5))) for t in self.dims['t'] ]
+            return [ 'Time = %s to %s  %s to %s'%(_gat(t1),_gat(t2),
+                     __Days__[t1.weekday()],__Days__[t2.weekday()]) ]
+        elif what == 'ens':
+            e = int(floor(self.dims['e'][0]+0.5))
+            return [ 'Ens = %d  E = %d'%(e,e) ]
+        elif what == 'undef':
+            return [ 'Output undef value is set to %g'%self.ctl().undef ]
+        elif what == 'gxout':
+            return [ 'General output settings:',
+                     '1D Graphics Output type = line',
+                     '2D Vector Graphics Output type = vector',
+                     '2D Scalar Graphics Output is %s'%self.gxout,
+                     'Station Data Graphics Output type = value' ]
+        elif what == 'define':
+            return [ '%s'%v for v in self.defined.keys() ]
+        else:
+            raise FakeError, 'Query error:  invalid operand <%s>'%what
+
+    def qdims(self):
+        if self.dims is None:
+            return [ 'No files open' ]
+        ctl = self.ctl()
+        out = [ 'Default file number is: %d '%self.dfile ]
+        names = ( ('x','X','Lon'), ('y','Y','Lat'), ('z','Z','Lev'),
+                  ('t','T','Time'), ('e','E','Ens') )
+        for dim, D, W in names:
+            lo, hi = self.dims[dim]
+            if dim == 't':
+                w1, w2 = _gat(ctl.time(int(floor(lo+0.5)))), \
+                         _gat(ctl.time(int(floor(hi+0.5))))
+            elif dim == 'e':
+                w1, w2 = '%d'%lo, '%d'%hi
+            else:
+                w1, w2 = '%g'%ctl.world(dim,lo), '%g'%ctl.world(dim,hi)
+            if lo == hi:
+                out.append('%s is fixed     %s = %s  %s = %g'%(D,W,w1,D,lo))
+            else:
+                out.append('%s is varying   %s = %s to %s   %s = %g to %g'\
+                           %(D,W,w1,w2,D,lo,hi))
+        return out
+
+    def qfile(self, words):
+        fid = self.dfile
+        if len(words)>0: fid = int(words[0])
+        ctl = self.ctl(fid)
+        out = [ 'File %d : %s'%(fid,ctl.title),
+                '  Descriptor: %s'%ctl.fname,
+                '  Binary: %s'%ctl.bin,
+                '  Type = Gridded',
+                '  Xsize = %d  Ysize = %d  Zsize = %d  Tsize = %d  Esize = %d'\
+                %(ctl.size('x'),ctl.size('y'),ctl.size('z'),ctl.size('t'),ctl.size('e')),
+                '  Number of Variables = %d'%len(ctl.vars) ]
+        for name, levs, desc in ctl.vars:
+            dims = 't,z,y,x'
+            if levs == 0: dims = 't,y,x'
+            out.append('     %s %d %s %s'%(name,levs,dims,desc))
+        return out
+
+    def qctlinfo(self, words):
+        fid = self.dfile
+        if len(words)>0: fid = int(words[0])
+        ctl = self.ctl(fid)
+        out = [ 'dset %s'%ctl.dset, 'title %s'%ctl.title, 'undef %g'%ctl.undef ]
+        if ctl.dtype is not None:
+            out.append('dtype %s'%ctl.dtype)
+        for dim in ('x','y','z'):
+            n, kind, vals = ctl.axes[dim]
+            if kind == 'linear':
+                out.append('%sdef %d linear %g %g'%(dim,n,vals[0],vals[1]))
+            else:
+                svals = [ '%g'%v for v in vals ]
+                out.append('%sdef %d levels %s'%(dim,n,' '.join(svals[:10])))
+                for k in range(10,n,10):
+                    out.append(' '.join(svals[k:k+10]))
+        t0, inc, unit = ctl.axes['t'][2]
+        out.append('tdef %d linear %s %d%s'%(ctl.size('t'),_gat(t0),inc,unit))
+        if ctl.size('e') > 1:
+            out.append('edef %d names %s'%(ctl.size('e'),
+                       ' '.join(['%d'%(e+1) for e in range(ctl.size('e'))])))
+        out.append('vars %d'%len(ctl.vars))
+        for name, levs, desc in ctl.vars:
+            out.append('%s %d 99 %s'%(name,levs,desc))
+        out.append('endvars')
+        return out
+
+#   ..................................................................
+
+    def indices(self, dim, fixed=False):
+        """Integer grid indices spanned by the current environment."""
+        lo, hi = self.dims[dim]
+        if lo == hi:
+            return [ int(floor(lo+0.5)) ]
+        return range(int(floor(lo)), int(ceil(hi))+1)
+
+    def evaluate(self, expr):
+        """
+        Returns a 5D masked array (e,t,z,y,x) for *expr* in the current
+        dimension environment.
+        """
+        if not HAS_NUMPY:
+            raise FakeError, 'Data exchange requires NumPy'
+        if self.dims is None:
+            raise FakeError, 'No files open'
+        env = dict([ (d, self.indices(d)) for d in ('x','y','z','t','e') ])
+        try:
+            return _Parser(expr, self, env).parse()
+        except FakeError:
+            raise
+        except Exception, e:
+            raise FakeError, 'Syntax Error: invalid expression <%s> (%s)'%(expr,e)
+
+    def coords(self, dim):
+        ctl = self.ctl()
+        if dim == 't':
+            return N.array(self.indices(dim),dtype='float32')
+        return N.array([ ctl.world(dim,i) for i in self.indices(dim) ],
+                       dtype='float32')
+
+    def varying(self):
+        return [ d for d in ('x','y','z','t','e')
+                 if self.dims[d][0] != self.dims[d][1] ]
+
+    def display(self, expr):
+        if expr.strip().lower()[:10] == 'ipc_load()':
+            v = self.ipc_load()
+            return [ 'Contouring: %g to %g interval %g'%_cint(v) ]
+        v = self.evaluate(expr)
+        rank = len(self.varying())
+        if self.fwrite and self.fwrite_name == '-':
+            if rank > 3:
+                raise FakeError, 'Error: too many varying dimensions for fwrite'
+            self.echo()
+            self.Writer.write('<FWRITE>\n')
+            self.Writer.write(v.filled(self.ctl().undef).astype('float32').tostring())
+            self.Writer.flush()
+            return []
+        elif self.gxout == 'fwrite':
+            self.fwrite = True
+            return self.display(expr)
+        if rank > 2:
+            raise FakeError, 'Error: too many varying dimensions'
+        vmin, vmax = v.min(), v.max()
+        if vmin is ma.masked:
+            return [ 'Entire grid undefined' ]
+        if vmin == vmax:
+            return [ 'Constant field.  Value = %g'%vmin ]
+        return [ 'Contouring: %g to %g interval %g'%_cint(v) ]
+
+    def define(self, rhs):
+        name, expr = [ s.strip() for s in rhs.split('=',1) ]
+        e = expr.replace(' ','').lower()
+        if e[:9] == 'ipc_save(':
+            self.ipc_save(expr.strip()[9:-1])
+            return []
+        elif e[:9] == 'ipc_load(':
+            v = self.ipc_load()
+        else:
+            v = self.evaluate(expr)
+        start = dict([ (d, self.indices(d)[0]) for d in ('x','y','z','t','e') ])
+        self.defined[name.lower()] = (v, start)
+        return [ 'Define memory allocation size = %d bytes'%(v.size*4) ]
+
+#   ..................................................................
+
+    def ipc_open(self, args):
+        if len(args) < 2 or args[1] not in ('r','w'):
+            raise FakeError, 'usage: ipc_open fname r|w'
+        if args[1] == 'r':
+            if args[0] == '-':
+                self.ipc_in = '-'
+            else:
+                try:
+                    self.ipc_in = open(args[0],'rb')
+                except IOError:
+                    raise FakeError, 'ipc_open: cannot open %s'%args[0]
+        return []
+
+    def ipc_save(self, args):
+        expr, fname = [ s.strip() for s in args.rsplit(',',1) ]
+        vary = [ d for d in ('x','y','z','t') if self.dims[d][0] != self.dims[d][1] ]
+        if len(vary) != 2 or self.dims['e'][0] != self.dims['e'][1]:
+            raise FakeError, 'ipc_save: expecting 2 varying dimensions but got %d'%len(vary)
+        v = self.evaluate(expr).squeeze()
+        undef = self.ctl().undef
+        idim, jdim = [ 'xyzt'.index(d) for d in vary ]
+        icoord, jcoord = self.coords(vary[0]), self.coords(vary[1])
+        meta = N.zeros(20,dtype='float32')
+        meta[0:5] = (undef, idim, jdim, len(icoord), len(jcoord))
+        meta[5:9] = (icoord[0], icoord[-1], jcoord[0], jcoord[-1])
+        payload = ( meta.tostring() +
+                    v.filled(undef).astype('float32').tostring() +
+                    icoord.tostring() + jcoord.tostring() )
+        if fname != '-':
+            f = open(fname,'wb')
+            f.write(payload)
+            f.close()
+            return
+        self.Writer.write('<EXP>\n')
+        self.Writer.write(payload)
+        self.Writer.flush()
+
+    def ipc_load(self):
+        if self.ipc_in is None:
+            raise FakeError, 'ipc_load: no stream opened, use ipc_open'
+        elif self.ipc_in == '-':
+            stream = self.Reader
+        else:
+            stream = self.ipc_in
+        nx, ny = len(self.indices('x')), len(self.indices('y'))
+        ts, zs = self.indices('t'), self.indices('z')
+        v = ma.masked_array(N.zeros((1,len(ts),len(zs),ny,nx),dtype='float32'))
+        for l in range(len(ts)):
+            for k in range(len(zs)):
+                meta = N.fromstring(stream.read(80),dtype='float32')
+                mx, my = int(meta[3]), int(meta[4])
+                data = N.fromstring(stream.read(4*mx*my),dtype='float32')
+                stream.read(4*(mx+my)) # lon, lat
+                if mx != nx or my != ny:
+                    raise FakeError, 'ipc_load: nx/ny mismatch'
+                data = data.reshape((ny,nx))
+                v[0,l,k] = ma.masked_values(data,meta[0])
+        return v
+
+#.....................................................................
+
+class _Parser(object):
+    """
+    Recursive descent parser for a small subset of the GrADS expression
+    language: variables (optionally with a file number and dimension
+    overrides, e.g. ta.1(z=2)), lon, lat, lev, numbers, + - * / and
+    a few intrinsic functions.
+    """
+
+    Funcs = dict(sqrt='sqrt', abs='absolute', exp='exp', log='log',
+                 cos='cos', sin='sin')
+
+    def __init__(self, expr, ga, env):
+        self.tokens = re.findall(r'\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+|[A-Za-z_]\w*(?:\.\d+)?|[-+*/(),=]',
+                                 expr)
+        self.pos = 0
+        self.ga = ga
+        self.env = env
+
+    def peek(self):
+        if self.pos < len(self.tokens): return self.tokens[self.pos]
+        return None
+
+    def next(self):
+        tok = self.peek()
+        self.pos += 1
+        return tok
+
+    def parse(self):
+        v = self.expr()
+        if self.peek() is not None:
+            raise FakeError, 'Syntax Error: unexpected <%s>'%self.peek()
+        return self.shape(v)
+
+    def shape(self, v):
+        ne, nt, nz, ny, nx = [ len(self.env[d]) for d in 'etzyx' ]
+        v = ma.masked_array(v, dtype='float64')
+        return ma.masked_array(N.broadcast_to(v.data,(ne,nt,nz,ny,nx)).copy(),
+                               mask=N.broadcast_to(ma.getmaskarray(v),(ne,nt,nz,ny,nx)).copy())
+
+    def expr(self):
+        v = self.term()
+        while self.peek() in ('+','-'):
+            if self.next() == '+': v = v + self.term()
+            else:                  v = v - self.term()
+        return v
+
+    def term(self):
+        v = self.factor()
+        while self.peek() in ('*','/'):
+            if self.next() == '*': v = v * self.factor()
+            else:                  v = v / self.factor()
+        return v
+
+    def factor(self):
+        tok = self.next()
+        if tok is None:
+            raise FakeError, 'Syntax Error: premature end of expression'
+        if tok == '-':
+            return - self.factor()
+        if tok == '(':
+            v = self.expr()
+            self.expect(')')
+            return v
+        if tok[0].isdigit() or tok[0] == '.':
+            return ma.masked_array(float(tok))
+        name = tok.lower()
+        if name in self.Funcs and self.peek() == '(':
+            self.next()
+            v = self.expr()
+            self.expect(')')
+            return getattr(ma,self.Funcs[name])(v)
+        env = dict(self.env)
+        if self.peek() == '(':
+            self.next()
+            while True:
+                dim = self.next().lower()
+                self.expect('=')
+                sign = 1.
+                if self.peek() == '-':
+                    self.next(); sign = -1.
+                val = sign * float(self.next())
+                if dim in ('x','y','z','t','e'):
+                    env[dim] = [ int(val) ]
+                else:
+                    d = { 'lon':'x', 'lat':'y', 'lev':'z' }[dim]
+                    env[d] = [ int(floor(self.ga.ctl().grid(d,val)+0.5)) ]
+                if self.next() == ')': break
+        return self.variable(name, env)
+
+    def expect(self, tok):
+        if self.next() != tok:
+            raise FakeError, 'Syntax Error: expecting <%s>'%tok
+
+    def variable(self, name, env):
+        fid = self.ga.dfile
+        if '.' in name:
+            name, fid = name.split('.')
+            fid = int(fid)
+        ctl = self.ga.ctl(fid)
+        e, t, z, y, x = [ N.array(env[d],dtype='float64') for d in 'etzyx' ]
+        e = e[:,None,None,None,None]
+        t = t[None,:,None,None,None]
+        z = z[None,None,:,None,None]
+        y = y[None,None,None,:,None]
+        x = x[None,None,None,None,:]
+        if name == 'lon':
+            return ma.masked_array(_world(ctl,'x',x))
+        if name == 'lat':
+            return ma.masked_array(_world(ctl,'y',y))
+        if name == 'lev':
+            return ma.masked_array(_world(ctl,'z',z))
+        if name in self.ga.defined:
+            return self.defined(name, env)
+        names = [ v[0] for v in ctl.vars ]
+        if name not in names:
+            raise FakeError, 'Error:  Variable not found: %s'%name
+        levs = ctl.vars[names.index(name)][1]
+        base, amp = _SYNTH.get(name,(0.,1.))
+        lon, lat = _world(ctl,'x',x), _world(ctl,'y',y)
+        lev = _world(ctl,'z',z)
+        if levs == 0: lev = 0. * lev
+        v = base + amp * ( N.cos(N.radians(lat)) * N.sin(N.radians(lon) + 0.3*(t-1))
+                           + 0.1*(e-1) + 0.001*lev )
+        mask = N.zeros(v.shape,dtype='bool')
+        if name == 'hus':
+            mask = mask | (z>5) # like the real thing, hus stops at 300 hPa
+        return ma.masked_array(v, mask=N.broadcast_to(mask,v.shape))
+
+    def defined(self, name, env):
+        v, start = self.ga.defined[name]
+        idx = []
+        for n, d in enumerate('etzyx'):
+            i = N.array(env[d]) - start[d]
+            if v.shape[n] == 1:
+                i = 0 * i
+            idx.append(i)
+        ok = N.ones([len(i) for i in idx],dtype='bool')
+        for n, i in enumerate(idx):
+            good = (i>=0) & (i<v.shape[n])
+            shp = [1]*5; shp[n] = len(i)
+            ok = ok & good.reshape(shp)
+            idx[n] = N.clip(i,0,v.shape[n]-1)
+        out = v[N.ix_(*idx)]
+        return ma.masked_array(out.data,mask=ma.getmaskarray(out)|~ok)
+
+#.....................................................................
+
+def _world(ctl, dim, i):
+    f = N.vectorize(lambda i_: ctl.world(dim,i_))
+    return f(i)
+
+def _cint(v):
+    vmin, vmax = float(v.min()), float(v.max())
+    d = (vmax - vmin) / 10.
+    if d <= 0: return (vmin, vmax, 0.)
+    p = 10. ** floor(N.log10(d))
+    for m in (1., 2., 2.5, 5., 10.):
+        if m*p >= d: break
+    cint = m * p
+    return (ceil(vmin/cint)*cint, floor(vmax/cint)*cint, cint)
+
+def _parseVar(line):
+    m = re.match(r'(\S+)\s+(\d+)\S*\s+((?:-?\d+\s*,\s*)*-?\d+)\s+(.*)$', line)
+    if m is None:
+        words = line.split()
+        return (words[0].lower(), int(words[1].split(',')[0]), ' '.join(words[3:]))
+    return (m.group(1).lower(), int(m.group(2)), m.group(4))
+
+def _secs(td):
+    return td.days * 86400. + td.seconds + td.microseconds * 1e-6
+
+def _tadd(t0, n, unit):
+    if unit == 'mn': return t0 + timedelta(minutes=n)
+    if unit == 'hr': return t0 + timedelta(hours=n)
+    if unit == 'dy': return t0 + timedelta(days=n)
+    if unit == 'yr': n = 12 * n
+    m = t0.month - 1 + n
+    return t0.replace(year=t0.year + m // 12, month = m % 12 + 1)
+
+def _gat(t):
+    if t.minute:
+        return '%02d:%02dZ%02d%s%04d'%(t.hour,t.minute,t.day,__Months__[t.month-1],t.year)
+    return '%02dZ%02d%s%04d'%(t.hour,t.day,__Months__[t.month-1],t.year)
+
+def _gat2dt(gat):
+    """
+    Convert grads time to datetime; accepts the abbreviated forms
+    found in descriptor files, e.g., 0Z1jan1987 or jan1987.
+    """
+    gat = gat.upper()
+    if 'Z' in gat:
+        hm, date = gat.split('Z')
+    else:
+        hm, date = '0', gat
+    if ':' in hm: h, m = hm.split(':')
+    else:         h, m = hm, '0'
+    mmm = date[-7:-4]
+    dd, yy = date.split(mmm)
+    if dd == '': dd = '1'
+    return datetime(int(yy),__Months__.index(mmm)+1,int(dd),int(h or 0),int(m))
+
+#.....................................................................
+
+if __name__ == '__main__':
+    # Command line options (-u, -b, -l, -p, ...) are accepted and ignored
+    FakeGrADS(sys.stdin, sys.stdout).run()
@@ -27,11 +27,16 @@ parser.add_option("-d", "--datadir", dest="datadir", default=None,
 parser.add_option("-v", "--verbose", dest="level", default=2,
                   help="verbose level (default=%default)" )
 
+parser.add_option("-f", "--fake", dest="fake", action="store_true",
+                  default=False,
+                  help="run protocol tests against the GrADS emulator" )
+
 (o, a) = parser.parse_args()
 
 # Run the "model" based tests
 # ---------------------------
-run_all_tests(verb=o.level, BinDir=o.bindir, DataDir=o.datadir)
+run_all_tests(verb=o.level, BinDir=o.bindir, DataDir=o.datadir,
+              Fake=o.fake)
 
 
 